@@ -0,0 +1,121 @@
+"""
+行政区域ポリゴン - ローカルのGeoJSON（国土数値情報 行政区域データ N03 など）を読み込み、
+座標 → 都道府県・市区町村を点の内外判定で割り当てる
+
+ポリゴンは外接矩形でグリッドに登録しておき、点ごとに同じセルの候補だけを判定する
+"""
+import json
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger("store-traffic")
+
+_GRID_CELL_DEG = 0.1
+
+# 属性名の候補（N03形式 → 汎用形式の順に探す）
+_PREF_KEYS = ("N03_001", "prefecture", "pref")
+_PARENT_KEYS = ("N03_003", "parent")  # 郡・政令指定都市（例: 横浜市）
+_CITY_KEYS = ("N03_004", "city", "name")  # 市区町村・行政区（例: 中区）
+
+
+def _prop(props, keys):
+    for k in keys:
+        v = props.get(k)
+        if v:
+            return v
+    return ""
+
+
+def _polygons(geometry):
+    """GeoJSON geometry → [[外周, 穴, ...], ...]（座標は (lon, lat)）"""
+    if not geometry:
+        return []
+    if geometry.get("type") == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry.get("type") == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+def _in_ring(lon, lat, ring):
+    """レイキャスティング法で点が輪の内側にあるか"""
+    inside = False
+    n = len(ring)
+    x1, y1 = ring[-1][0], ring[-1][1]
+    for i in range(n):
+        x2, y2 = ring[i][0], ring[i][1]
+        if (y2 > lat) != (y1 > lat):
+            if lon < (x1 - x2) * (lat - y2) / (y1 - y2) + x2:
+                inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def _in_polygon(lon, lat, rings):
+    return _in_ring(lon, lat, rings[0]) and not any(_in_ring(lon, lat, hole) for hole in rings[1:])
+
+
+def load_boundaries(paths):
+    """
+    行政区域GeoJSONを読み込む
+
+    Args:
+        paths: GeoJSONファイルのパスのリスト（都道府県ごとのファイルを並べてもよい）
+
+    Returns:
+        list[dict]: [{"pref", "city", "parent", "bbox": (lon_min, lat_min, lon_max, lat_max), "rings": ...}, ...]
+    """
+    areas = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for feature in data.get("features", []):
+            props = feature.get("properties") or {}
+            city = _prop(props, _CITY_KEYS)
+            if not city:
+                continue
+            for rings in _polygons(feature.get("geometry")):
+                if not rings or len(rings[0]) < 3:
+                    continue
+                lons = [p[0] for p in rings[0]]
+                lats = [p[1] for p in rings[0]]
+                areas.append({
+                    "pref": _prop(props, _PREF_KEYS),
+                    "city": city,
+                    "parent": _prop(props, _PARENT_KEYS),
+                    "bbox": (min(lons), min(lats), max(lons), max(lats)),
+                    "rings": rings,
+                })
+        logger.info(f"行政区域読み込み: {path}（累計 {len(areas)}ポリゴン）")
+    return areas
+
+
+def assign_points(points, areas):
+    """
+    点ごとに含まれる行政区域を判定する
+
+    Args:
+        points: dict[名前] -> (lat, lon)
+        areas: load_boundaries() の戻り値
+
+    Returns:
+        dict[名前] -> {"pref", "city", "parent"}（どの区域にも入らない点は含まない）
+    """
+    grid = defaultdict(list)
+    for i, a in enumerate(areas):
+        lon_min, lat_min, lon_max, lat_max = a["bbox"]
+        for ci in range(int(lat_min // _GRID_CELL_DEG), int(lat_max // _GRID_CELL_DEG) + 1):
+            for cj in range(int(lon_min // _GRID_CELL_DEG), int(lon_max // _GRID_CELL_DEG) + 1):
+                grid[(ci, cj)].append(i)
+
+    assigned = {}
+    for name, (lat, lon) in points.items():
+        for i in grid.get((int(lat // _GRID_CELL_DEG), int(lon // _GRID_CELL_DEG)), ()):
+            a = areas[i]
+            lon_min, lat_min, lon_max, lat_max = a["bbox"]
+            if not (lon_min <= lon <= lon_max and lat_min <= lat <= lat_max):
+                continue
+            if _in_polygon(lon, lat, a["rings"]):
+                assigned[name] = {"pref": a["pref"], "city": a["city"], "parent": a["parent"]}
+                break
+    return assigned
@@ -9,6 +9,7 @@ import io
 import zipfile
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import dl_state
@@ -24,6 +25,8 @@ from config import (
     OUTPUT_DIR,
     IMAGE_CACHE_DIR,
     MAX_BULK_STATIONS,
+    MAX_TRANSFER_LEVEL,
+    IMAGE_FETCH_WORKERS,
     APP_USERS,
     APP_DELETE_PASSWORD,
 )
@@ -381,8 +384,14 @@ def _save_lib_json(checked_stations, checked_railways, lib_dir, lib_meta):
 
 
 def _bg_download(checked_stations, checked_railways, lib_dir, img_dir, lib_meta):
-    """バックグラウンドで画像をダウンロードしてライブラリに保存"""
+    """
+    バックグラウンドで画像をダウンロードしてライブラリに保存
+
+    駅ごとの画像取得は並列に行い（サイトごとの上限は http_client が全セッション共通で守る）、
+    保管庫・ライブラリJSONへの書き込みは取得が終わった駅から順にこのスレッドで行う
+    """
     from image_fetcher import fetch_station_images, save_cache_meta, _save_to_cache
+    from wiki_client import prefetch_pages
 
     # 駅名→路線名の逆引きマップ
     station_rw_map = {}
@@ -390,29 +399,36 @@ def _bg_download(checked_stations, checked_railways, lib_dir, img_dir, lib_meta)
         for s in stns:
             station_rw_map.setdefault(s["name"], []).append(rw_name)
 
-    total = len(checked_stations)
-    for i, s in enumerate(checked_stations):
-        dl_state.progress[lib_dir] = {"total": total, "done": i, "current": s["name"]}
-        paths = fetch_station_images(s["name"], img_dir)
-        s["image_path"] = paths
-
-        # 保管庫に画像+メタデータを保存
-        if paths:
-            _save_to_cache(s["name"], paths)
-        meta = {
-            "name": s["name"],
-            "railways": station_rw_map.get(s["name"], []),
-            "lat": s.get("lat"),
-            "lon": s.get("lon"),
-            "passengers": s.get("passengers"),
-            "line_count": s.get("line_count"),
-            "prefecture": lib_meta.get("prefecture", ""),
-            "city": lib_meta.get("city", ""),
-            "cached_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        }
-        save_cache_meta(s["name"], meta)
+    # 記事画像用のWikipedia記事をまとめて取得（50件ずつ）
+    prefetch_pages([f"{s['name']}駅" for s in checked_stations])
 
-        _save_lib_json(checked_stations, checked_railways, lib_dir, lib_meta)
+    total = len(checked_stations)
+    dl_state.progress[lib_dir] = {"total": total, "done": 0, "current": ""}
+    with ThreadPoolExecutor(max_workers=IMAGE_FETCH_WORKERS, thread_name_prefix="lib-download") as pool:
+        futures = {pool.submit(fetch_station_images, s["name"], img_dir): s for s in checked_stations}
+        for i, future in enumerate(as_completed(futures)):
+            s = futures[future]
+            paths = future.result()
+            s["image_path"] = paths
+
+            # 保管庫に画像+メタデータを保存
+            if paths:
+                _save_to_cache(s["name"], paths)
+            meta = {
+                "name": s["name"],
+                "railways": station_rw_map.get(s["name"], []),
+                "lat": s.get("lat"),
+                "lon": s.get("lon"),
+                "passengers": s.get("passengers"),
+                "line_count": s.get("line_count"),
+                "prefecture": lib_meta.get("prefecture", ""),
+                "city": lib_meta.get("city", ""),
+                "cached_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            save_cache_meta(s["name"], meta)
+
+            _save_lib_json(checked_stations, checked_railways, lib_dir, lib_meta)
+            dl_state.progress[lib_dir] = {"total": total, "done": i + 1, "current": s["name"]}
     dl_state.progress[lib_dir] = {"total": total, "done": total, "current": "", "finished": True}
 
 
@@ -538,6 +554,90 @@ def render_station_cards(data, mode_key):
         _render_cards(data.get("stations", []), json_dir)
 
 
+def _station_map_deck(result, stations):
+    """駅別結果のマップ（対象駅 + 基準駅）。座標のある駅がなければ None"""
+    base_coords = result.get("base_coords")
+    map_points = []
+    for s in stations:
+        if s.get("lat") and s.get("lon"):
+            map_points.append({
+                "name": s["name"],
+                "lat": s["lat"],
+                "lon": s["lon"],
+                "color": [45, 138, 78, 200],
+                "radius": 300,
+            })
+
+    if base_coords:
+        map_points.append({
+            "name": result.get("matched_station") or result.get("base_station", ""),
+            "lat": base_coords["lat"],
+            "lon": base_coords["lon"],
+            "color": [239, 68, 68, 220],
+            "radius": 500,
+        })
+
+    if not map_points:
+        return None
+
+    lats = [p["lat"] for p in map_points]
+    lons = [p["lon"] for p in map_points]
+    center_lat = sum(lats) / len(lats)
+    center_lon = sum(lons) / len(lons)
+
+    lat_range = max(lats) - min(lats) if len(lats) > 1 else 0.005
+    lon_range = max(lons) - min(lons) if len(lons) > 1 else 0.005
+    # 端の駅がマップ端ギリギリに来るよう最小余白
+    lat_range_padded = lat_range * 1.05 or 0.005
+    lon_range_padded = lon_range * 1.05 or 0.005
+    # pydeckのビューポート: 緯度方向は約 180/2^zoom 度が表示範囲
+    zoom_lat = math.log2(180 / lat_range_padded)
+    zoom_lon = math.log2(360 / lon_range_padded)
+    zoom = max(5, min(16, min(zoom_lat, zoom_lon)))
+
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=map_points,
+        get_position=["lon", "lat"],
+        get_fill_color="color",
+        get_radius="radius",
+        pickable=True,
+    )
+    view = pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=zoom, pitch=0)
+    return pdk.Deck(layers=[layer], initial_view_state=view, tooltip={"text": "{name}"}, map_style="light")
+
+
+def _run_station_search_progressive(search_name, max_transfer):
+    """
+    駅別検索を乗り換え回数ごとに進めながら、届いた分のマップと駅カードをその場で表示する
+    探索は上限回数（MAX_TRANSFER_LEVEL）まで1回で行い、途中の表示は指定の max_transfer 回までにする
+    （探索完了後は呼び出し側で rerun して通常の結果表示に切り替える）
+
+    Returns:
+        dict: 最終結果（上限回数まで。駅が見つからなければ None）
+    """
+    from station_mode import iter_station_mode
+
+    status = st.empty()
+    map_slot = st.empty()
+    result = None
+    for level, result in iter_station_mode(search_name, MAX_TRANSFER_LEVEL):
+        display_name = result.get("matched_station") or search_name
+        if level > max_transfer:
+            status.markdown(f"**{display_name}駅** から乗り換え{max_transfer}回まで表示中（{MAX_TRANSFER_LEVEL}回まで探索中...）")
+            continue
+        status.markdown(f"**{display_name}駅** から乗り換え{level}回まで: {result['total_stations']}駅（探索中...）")
+        deck = _station_map_deck(result, result["stations"])
+        if deck is not None:
+            map_slot.pydeck_chart(deck, key=f"pydeck_progress_{level}")
+        # 今回の回数で新しく加わった駅だけ追記する（最後の回数は完了後の結果表示に任せる）
+        new_stations = [s for s in result["stations"] if s.get("transfers") == level]
+        if new_stations and level < MAX_TRANSFER_LEVEL:
+            st.markdown(f"**乗り換え{level}回**（{len(new_stations)}駅）")
+            _render_cards(new_stations, STATION_OUTPUT_DIR)
+    return result
+
+
 # ===================================================
 # サイドバー
 # ===================================================
@@ -616,7 +716,7 @@ if page == "検索":
         with col1:
             base_station = st.text_input("基準駅名", value=default_station, placeholder="例: 表参道")
         with col2:
-            max_transfer = st.number_input("乗り換え回数", min_value=0, max_value=5, value=default_transfer)
+            max_transfer = st.number_input("乗り換え回数", min_value=0, max_value=MAX_TRANSFER_LEVEL, value=default_transfer)
 
         btn_col1, btn_col2 = st.columns([3, 1])
         with btn_col1:
@@ -625,7 +725,7 @@ if page == "検索":
             cancel_station = st.button("クリア", use_container_width=True, key="駅クリア")
 
         if cancel_station:
-            for k in ["last_result", "last_mode", "matched_station_name", "last_transfer", "_filter_railways", "_filter_time_limit", "_station_candidates", "_selected_candidate"]:
+            for k in ["last_result", "last_mode", "matched_station_name", "last_transfer", "_filter_railways", "_filter_time_limit", "_filter_transfer", "_station_candidates", "_selected_candidate"]:
                 st.session_state.pop(k, None)
             st.rerun()
 
@@ -669,53 +769,52 @@ if page == "検索":
                     _search_name = candidates[0]["name"]
                     _do_search = True
                 else:
-                    # 完全一致 or 入力名を含む候補(地域サフィックス付き)をチェック
-                    # 例: "表参道" → 完全一致1件 → そのまま検索
-                    # 例: "赤坂" → "赤坂(東京)", "赤坂(福岡)" etc → 選択UI
-                    exact = [c for c in candidates if c["name"] == base_station]
-                    if len(exact) == 1:
-                        _search_name = exact[0]["name"]
-                        _do_search = True
-                    else:
-                        # 入力名で始まる候補だけに絞る（赤坂見附、備後赤坂などを除外）
-                        primary = [c for c in candidates if c["name"].startswith(base_station)]
-                        if len(primary) == 1:
-                            _search_name = primary[0]["name"]
-                            _do_search = True
-                        elif len(primary) > 1:
-                            st.session_state["_station_candidates"] = primary
-                            st.rerun()
-                        else:
-                            # startswithでヒットしなければ全候補を表示
-                            st.session_state["_station_candidates"] = candidates
-                            st.rerun()
+                    # 同名駅（例: "赤坂" → "赤坂(東京)", "赤坂(福岡)"）や部分一致が複数 → 選択UI
+                    st.session_state["_station_candidates"] = candidates
+                    st.rerun()
 
         if _do_search and _search_name:
+            _last = st.session_state.get("last_result") or {}
+            if (
+                st.session_state.get("last_mode") == "station"
+                and _search_name in (_last.get("matched_station"), _last.get("base_station"))
+                and _last.get("max_transfer", 0) >= max_transfer
+                and all("transfers" in s for s in _last.get("stations", []))
+            ):
+                # 同じ駅の探索済み結果から乗り換え回数で絞り込むだけ（再探索しない）
+                st.session_state["last_transfer"] = max_transfer
+                st.session_state["_filter_transfer"] = max_transfer
+                st.rerun()
+
             dl_state.progress.clear()
-            with st.spinner(f"{_search_name}駅 から乗り換え{max_transfer}回以内を探索中..."):
-                try:
-                    from station_mode import run_station_mode
-                    result = run_station_mode(_search_name, max_transfer)
-                    if result:
-                        st.session_state["last_result"] = result
-                        st.session_state["last_mode"] = "station"
-                        matched = result.get("matched_station") or _search_name
-                        st.session_state["matched_station_name"] = matched
-                        st.session_state["last_transfer"] = max_transfer
-                        # 新しい検索なのでフィルタ状態をリセット
-                        st.session_state.pop("_filter_railways", None)
-                        st.session_state.pop("_filter_time_limit", None)
-                        st.rerun()
-                    else:
-                        st.warning("該当する駅が見つかりませんでした")
-                except Exception as e:
-                    st.error(f"エラー: {e}")
+            try:
+                # 上限回数まで1回で探索し、乗り換え回数は結果側のスライダーで絞り込む
+                # 回数の少ない駅から順に表示していく
+                result = _run_station_search_progressive(_search_name, max_transfer)
+                if result:
+                    st.session_state["last_result"] = result
+                    st.session_state["last_mode"] = "station"
+                    matched = result.get("matched_station") or _search_name
+                    st.session_state["matched_station_name"] = matched
+                    st.session_state["last_transfer"] = max_transfer
+                    # 新しい検索なのでフィルタ状態をリセット
+                    st.session_state.pop("_filter_railways", None)
+                    st.session_state.pop("_filter_time_limit", None)
+                    st.session_state["_filter_transfer"] = max_transfer
+                    st.rerun()
+                else:
+                    st.warning("該当する駅が見つかりませんでした")
+            except Exception as e:
+                st.error(f"エラー: {e}")
     else:
-        col1, col2 = st.columns(2)
+        _rank_labels = {"lines": "乗り入れ路線数", "hub": "ハブ度（路線数+経由度）", "betweenness": "経由度（媒介中心性）", "transfer": "接続駅数"}
+        col1, col2, col3 = st.columns([2, 2, 1])
         with col1:
             prefecture = st.text_input("都道府県", placeholder="例: 東京都", key="city_pref_input")
         with col2:
             city = st.text_input("市区町村", placeholder="例: 渋谷区", key="city_city_input")
+        with col3:
+            rank_by = st.selectbox("並び順", list(_rank_labels), format_func=lambda k: _rank_labels[k], key="city_rank_input")
 
         btn_col1, btn_col2 = st.columns([3, 1])
         with btn_col1:
@@ -739,7 +838,7 @@ if page == "検索":
                 with st.spinner(f"{prefecture} {city} の駅を検索中..."):
                     try:
                         from city_mode import run_city_mode
-                        result = run_city_mode(prefecture, city)
+                        result = run_city_mode(prefecture, city, rank_by=rank_by)
                         if result:
                             st.session_state["last_result"] = result
                             st.session_state["last_mode"] = "city"
@@ -771,10 +870,18 @@ if page == "検索":
             else:
                 st.markdown(f"**{city_name}の主要駅**")
 
+        # 駅ごとの乗り換え回数がある結果は、探索上限以下の任意の回数で絞り込める
+        has_transfers = mode_key == "station" and all("transfers" in s for s in result.get("stations", []))
+        if has_transfers:
+            st.session_state.setdefault("_filter_transfer", result.get("max_transfer", 0))
+            st.session_state["_filter_transfer"] = min(st.session_state["_filter_transfer"], result.get("max_transfer", 0))
+        # 表示・保存に使う乗り換え回数（絞り込めない結果は探索した回数のまま）
+        transfer_limit = st.session_state["_filter_transfer"] if has_transfers else result.get("max_transfer", 0)
+
         if mode_key == "station":
             matched = result.get("matched_station", "")
             input_name = result.get("base_station", "")
-            transfer_n = result.get("max_transfer", 0)
+            transfer_n = transfer_limit
             display_name = matched or input_name
             if matched and matched != input_name:
                 st.markdown(f"**{display_name}駅** から乗り換え{transfer_n}回以内　<span style='font-size:0.8rem;color:#888;'>入力: {input_name} → {matched}</span>", unsafe_allow_html=True)
@@ -782,12 +889,14 @@ if page == "検索":
                 st.markdown(f"**{display_name}駅** から乗り換え{transfer_n}回以内")
 
         total = result.get("total_stations", 0)
+        if has_transfers:
+            total = sum(1 for s in result.get("stations", []) if s["transfers"] <= st.session_state["_filter_transfer"])
 
         # フィルタ（駅別モード）
         railways = result.get("railways", [])
         filtered_railways = railways
         if mode_key == "station" and railways:
-            fc1, fc2 = st.columns([3, 1])
+            fc1, fc2, fc3 = st.columns([3, 1, 1])
             with fc1:
                 railway_names = [rw.get("railway", "不明") for rw in railways]
                 # 保存されたフィルタ状態があれば復元（有効な路線のみ）
@@ -815,12 +924,16 @@ if page == "検索":
                     default_time = min(60, max_time)
                 time_limit = st.slider("移動時間（分以内）", min_value=5, max_value=max_time, value=default_time, step=5)
                 st.session_state["_filter_time_limit"] = time_limit
+            with fc3:
+                if has_transfers and result.get("max_transfer", 0) > 0:
+                    transfer_limit = st.slider("乗り換え（回以内）", min_value=0, max_value=result["max_transfer"], step=1, key="_filter_transfer")
 
-            # 移動時間フィルタを適用（travel_time=Noneは除外）
+            # 移動時間・乗り換え回数フィルタを適用（travel_time=Noneは除外）
             for rw in filtered_railways:
                 rw["_filtered_stations"] = [
                     s for s in rw.get("stations", [])
                     if s.get("travel_time") is not None and s["travel_time"] <= time_limit
+                    and s.get("transfers", 0) <= transfer_limit
                 ]
         else:
             for rw in filtered_railways:
@@ -877,58 +990,14 @@ if page == "検索":
                 st.pydeck_chart(deck, key=f"pydeck_city_{len(map_points)}")
 
         elif mode_key == "station":
-            base_coords = result.get("base_coords")
             all_stations_flat = [s for rw in filtered_railways for s in rw.get("_filtered_stations", [])]
-            map_points = []
-            for s in all_stations_flat:
-                if s.get("lat") and s.get("lon"):
-                    map_points.append({
-                        "name": s["name"],
-                        "lat": s["lat"],
-                        "lon": s["lon"],
-                        "color": [45, 138, 78, 200],
-                        "radius": 300,
-                    })
-
-            if base_coords:
-                map_points.append({
-                    "name": result.get("matched_station") or result.get("base_station", ""),
-                    "lat": base_coords["lat"],
-                    "lon": base_coords["lon"],
-                    "color": [239, 68, 68, 220],
-                    "radius": 500,
-                })
-
-            if map_points:
-                lats = [p["lat"] for p in map_points]
-                lons = [p["lon"] for p in map_points]
-                center_lat = sum(lats) / len(lats)
-                center_lon = sum(lons) / len(lons)
-
-                lat_range = max(lats) - min(lats) if len(lats) > 1 else 0.005
-                lon_range = max(lons) - min(lons) if len(lons) > 1 else 0.005
-                # 端の駅がマップ端ギリギリに来るよう最小余白
-                lat_range_padded = lat_range * 1.05 or 0.005
-                lon_range_padded = lon_range * 1.05 or 0.005
-                # pydeckのビューポート: 緯度方向は約 180/2^zoom 度が表示範囲
-                zoom_lat = math.log2(180 / lat_range_padded)
-                zoom_lon = math.log2(360 / lon_range_padded)
-                zoom = max(5, min(16, min(zoom_lat, zoom_lon)))
-
-                layer = pdk.Layer(
-                    "ScatterplotLayer",
-                    data=map_points,
-                    get_position=["lon", "lat"],
-                    get_fill_color="color",
-                    get_radius="radius",
-                    pickable=True,
-                )
-                view = pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=zoom, pitch=0)
-                deck = pdk.Deck(layers=[layer], initial_view_state=view, tooltip={"text": "{name}"}, map_style="light")
+            deck = _station_map_deck(result, all_stations_flat)
+            if deck is not None:
                 # フィルタ変更時にビューをリセットするためkeyを動的に生成
                 _filter_t = st.session_state.get("_filter_time_limit", 0)
                 _filter_r = len(st.session_state.get("_filter_railways", []))
-                st.pydeck_chart(deck, key=f"pydeck_{len(map_points)}_{_filter_t}_{_filter_r}")
+                _filter_x = st.session_state.get("_filter_transfer", 0)
+                st.pydeck_chart(deck, key=f"pydeck_{_filter_t}_{_filter_r}_{_filter_x}_{len(all_stations_flat)}")
 
         st.markdown("")
 
@@ -993,7 +1062,7 @@ if page == "検索":
                     now = datetime.now()
                     ts = now.strftime("%Y%m%d_%H%M%S")
                     display_name = result.get("matched_station") or result.get("base_station", "unknown")
-                    transfer_n = result.get("max_transfer", 0)
+                    transfer_n = transfer_limit
                     lib_name = f"{display_name}_乗換{transfer_n}回_{ts}"
 
                     lib_dir = os.path.join(STATION_OUTPUT_DIR, "library", lib_name)
@@ -1003,6 +1072,8 @@ if page == "検索":
                     lib_meta = {
                         "base_station": result.get("base_station"),
                         "matched_station": result.get("matched_station"),
+                        "graph_hash": result.get("graph_hash"),
+                        "travel_version": result.get("travel_version"),
                         "max_transfer": transfer_n,
                         "downloaded_at": now.strftime("%Y-%m-%d %H:%M:%S"),
                         "total_stations": len(checked_stations),
@@ -1094,6 +1165,9 @@ if page == "検索":
                         "mode": "city",
                         "prefecture": pref,
                         "city": city_name,
+                        "graph_hash": result.get("graph_hash"),
+                        "rank_by": result.get("rank_by"),
+                        "input_stations": result.get("input_stations"),
                         "downloaded_at": now.strftime("%Y-%m-%d %H:%M:%S"),
                         "total_stations": len(checked_stations),
                     }
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+HTTP 接続の使い回し（http_client）の効果を測るベンチマーク
+
+市区別一括モードと同じ駅ごとの画像・乗降客数の取得を N 駅分（既定30駅）実行し、
+そのとき発生した GET リクエストを同じ順に2回再送して、ホストごとの所要時間を比べる。
+- 接続なし: リクエストごとに新しい接続を張る（http_client 導入前の requests.get と同じ）
+- 接続共有: http_client.get（ホストごとの Session で接続を使い回す）
+どちらもホストの枠（同時接続数・毎秒のリクエスト数）は守り、所要時間は枠の待ち時間を含まない。
+1回目の取得はキャッシュが効くので、再送で比べる（キャッシュの有無に左右されない）
+
+使用例:
+  python bench_http.py
+  python bench_http.py --stations 30 --names stations.txt
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import requests
+
+import http_client
+from config import HTTP_TIMEOUT, setup_logging
+
+logger = logging.getLogger("store-traffic")
+
+
+def _pick_stations(count, names_path=None):
+    """対象駅（names_path があれば1行1駅、なければ乗り入れ路線数の多い順に count 駅）"""
+    if names_path:
+        with open(names_path, "r", encoding="utf-8-sig") as f:
+            names = [line.strip().removesuffix("駅") for line in f if line.strip() and not line.startswith("#")]
+        return names[:count]
+    from transport_api import fetch_rail_graph
+    from city_mode import _rank_stations_by_popularity
+
+    station_to_railways, _railway_stations, _station_coords = fetch_rail_graph()
+    return [s["name"] for s in _rank_stations_by_popularity(list(station_to_railways), top_n=count)]
+
+
+def _run_job(names):
+    """駅ごとの画像・乗降客数を取得し、その間の GET リクエストを記録して返す"""
+    from city_mode import _fetch_all_station_assets
+
+    recorded = []
+    original = http_client.request
+
+    def recording(method, url, **kwargs):
+        if method == "GET":
+            recorded.append((url, kwargs.get("params"), kwargs.get("headers")))
+        return original(method, url, **kwargs)
+
+    http_client.request = recording
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench-http-") as tmp:
+            _fetch_all_station_assets({name: tmp for name in names})
+    finally:
+        http_client.request = original
+    return recorded
+
+
+def _replay_unpooled(recorded):
+    """記録したリクエストを、毎回新しい接続で再送する"""
+    for url, params, headers in recorded:
+        host = http_client._host(url)
+        with http_client.host_slot(url):
+            t0 = time.perf_counter()
+            try:
+                resp = requests.get(url, params=params, headers=headers, timeout=HTTP_TIMEOUT)
+                resp.content
+                resp.close()
+            except requests.RequestException:
+                http_client._record(host, time.perf_counter() - t0, error=True)
+                continue
+            http_client._record(host, time.perf_counter() - t0, error=resp.status_code >= 400)
+
+
+def _replay_pooled(recorded):
+    """記録したリクエストを、http_client の共有接続で再送する"""
+    for url, params, headers in recorded:
+        try:
+            http_client.get(url, params=params, headers=headers).content
+        except requests.RequestException:
+            pass
+
+
+def _log_stats(label, stats):
+    total = sum(s["requests"] for s in stats.values())
+    logger.info(f"--- {label}: {total}件 ---")
+    for host, s in sorted(stats.items()):
+        logger.info(
+            f"  {host}: {s['requests']}件（エラー{s['errors']}件） "
+            f"平均 {s['mean_ms']}ms, 中央値 {s['p50_ms']}ms, p95 {s['p95_ms']}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 接続の使い回しの効果を測る")
+    parser.add_argument("--stations", type=int, default=30, help="対象駅数（デフォルト: 30）")
+    parser.add_argument("--names", help="対象駅のリストファイル（1行1駅。なければ路線数の多い駅）")
+    args = parser.parse_args()
+    setup_logging()
+
+    names = _pick_stations(args.stations, args.names)
+    logger.info(f"=== HTTPベンチマーク: {len(names)}駅 ===")
+
+    http_client.latency_stats(reset=True)
+    t0 = time.perf_counter()
+    recorded = _run_job(names)
+    _log_stats(f"一括取得（{time.perf_counter() - t0:.1f}秒）", http_client.latency_stats(reset=True))
+    if not recorded:
+        logger.warning("GET リクエストがありませんでした（すべてキャッシュから取得）")
+        return
+
+    results = {}
+    for label, replay in (("接続なし", _replay_unpooled), ("接続共有", _replay_pooled)):
+        t0 = time.perf_counter()
+        replay(recorded)
+        elapsed = time.perf_counter() - t0
+        stats = http_client.latency_stats(reset=True)
+        _log_stats(f"{label}（{elapsed:.1f}秒）", stats)
+        results[label] = stats
+
+    for host in sorted(results["接続共有"]):
+        before = results["接続なし"].get(host)
+        after = results["接続共有"][host]
+        if before:
+            logger.info(f"{host}: 平均 {before['mean_ms']}ms → {after['mean_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
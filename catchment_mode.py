@@ -0,0 +1,198 @@
+"""
+商圏モード - 店舗の緯度経度から最寄り数駅を起点に、移動時間つきの到達駅リスト（商圏）を取得
+候補地を大量に評価できるよう、鉄道グラフと探索用インデックスは1回だけ構築して使い回す
+"""
+import csv
+import json
+import os
+import re
+import logging
+
+from config import CATCHMENT_OUTPUT_DIR
+from transport_api import (
+    fetch_rail_graph,
+    get_passenger_table,
+    get_travel_graph,
+    find_nearest_stations,
+    find_travel_times,
+    _walk_minutes,
+)
+
+logger = logging.getLogger("store-traffic")
+
+# 起点にする最寄り駅の数・徒歩圏の上限
+NEAREST_STATIONS = 3
+MAX_WALK_KM = 2.0
+
+# 商圏に含める移動時間の上限（分）— 駅別モードと同じ
+MAX_TRAVEL_MINUTES = 90
+
+
+def _sanitize_filename(name):
+    return re.sub(r'[\\/:*?"<>|]', "_", name).strip()
+
+
+def load_known_passengers():
+    """
+    既知の乗降客数を集める
+    Wikipediaダンプから作った乗降客数表（全国）を使い、表にない駅は保管庫メタデータの値で補う
+
+    Returns:
+        dict[駅名（「駅」なし）] -> int
+    """
+    from image_fetcher import load_all_cache_meta
+
+    table = get_passenger_table() or {}
+    passengers = {name: row["passengers"] for name, row in table.items() if row.get("passengers") is not None}
+    for meta in load_all_cache_meta():
+        pax = meta.get("passengers")
+        name = meta.get("name", "")
+        if pax is not None and name:
+            passengers.setdefault(name.rstrip("駅"), pax)
+    return passengers
+
+
+def prepare_catchment_context():
+    """
+    バッチ評価用の共有コンテキスト（グラフ・探索インデックス・乗降客数）を構築
+
+    Returns:
+        dict: find_catchment() に渡すコンテキスト
+    """
+    _station_to_railways, _railway_stations, station_coords = fetch_rail_graph()
+    return {
+        "travel_graph": get_travel_graph(),
+        "station_coords": station_coords,
+        "passengers": load_known_passengers(),
+    }
+
+
+def find_catchment(lat, lon, context, max_minutes=MAX_TRAVEL_MINUTES, max_transfer=None,
+                   nearest=NEAREST_STATIONS, max_walk_km=MAX_WALK_KM):
+    """
+    店舗座標からの商圏を求める。
+    最寄りの数駅を徒歩時間つきの始点として、多始点探索で到達駅と移動時間を得る。
+
+    重み:
+        time_weight = 1 - 移動時間 / max_minutes（近いほど1に近い）
+        score = 乗降客数 × time_weight（乗降客数が分かる駅のみ、それ以外は None）
+
+    Returns:
+        dict: {"access_stations": [...], "stations": [...]}（stations は移動時間の昇順）
+    """
+    travel_graph = context["travel_graph"]
+    station_coords = context["station_coords"]
+    passengers = context.get("passengers", {})
+
+    nearest_list = find_nearest_stations(lat, lon, travel_graph, k=nearest, max_km=max_walk_km)
+    access = [
+        {"name": name, "distance_km": round(d, 3), "walk_time": max(1, round(_walk_minutes(d)))}
+        for name, d in nearest_list
+    ]
+    if not access:
+        return {"access_stations": [], "stations": []}
+
+    sources = {name: _walk_minutes(d) for name, d in nearest_list}
+    times = find_travel_times(sources, travel_graph, max_minutes=max_minutes, max_transfer=max_transfer)
+
+    stations = []
+    for name, info in times.items():
+        t = info["travel_time"]
+        time_weight = max(0.0, 1 - t / max_minutes)
+        pax = passengers.get(name)
+        coords = station_coords.get(name) or {}
+        stations.append({
+            "name": name,
+            "travel_time": t,
+            "transfers": info["transfers"],
+            "access_station": info["source"],
+            "lat": coords.get("lat"),
+            "lon": coords.get("lon"),
+            "passengers": pax,
+            "time_weight": round(time_weight, 4),
+            "score": round(pax * time_weight) if pax is not None else None,
+        })
+    stations.sort(key=lambda s: (s["travel_time"], s["name"]))
+
+    return {"access_stations": access, "stations": stations}
+
+
+def run_catchment_mode(lat, lon, label=None, max_transfer=None):
+    """
+    1地点の商圏を求めてJSON保存
+
+    Args:
+        lat, lon: 店舗の緯度経度
+        label: 出力ファイル名に使う名前（省略時は座標）
+
+    Returns:
+        dict: 結果データ
+    """
+    logger.info(f"=== 商圏モード開始 ===")
+    logger.info(f"店舗座標: ({lat}, {lon})")
+
+    context = prepare_catchment_context()
+    catchment = find_catchment(lat, lon, context, max_transfer=max_transfer)
+    if not catchment["stations"]:
+        logger.warning(f"半径{MAX_WALK_KM}km以内に駅が見つかりませんでした")
+        return None
+
+    result = {
+        "label": label,
+        "lat": lat,
+        "lon": lon,
+        "access_stations": catchment["access_stations"],
+        "total_stations": len(catchment["stations"]),
+        "stations": catchment["stations"],
+    }
+
+    os.makedirs(CATCHMENT_OUTPUT_DIR, exist_ok=True)
+    safe_label = _sanitize_filename(label or f"{lat:.5f}_{lon:.5f}")
+    json_path = os.path.join(CATCHMENT_OUTPUT_DIR, f"{safe_label}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"JSON保存: {json_path}")
+    logger.info(f"=== 商圏モード完了: {result['total_stations']}駅 ===")
+    return result
+
+
+def run_catchment_batch(points_path, output_path=None, max_transfer=None):
+    """
+    候補地CSV（列: id, lat, lon）を一括評価し、1行1地点のNDJSONに書き出す。
+    グラフと探索インデックスは全地点で共有する。
+
+    Returns:
+        str: 出力NDJSONのパス
+    """
+    logger.info(f"=== 商圏バッチ開始: {points_path} ===")
+    context = prepare_catchment_context()
+
+    if output_path is None:
+        base = os.path.splitext(os.path.basename(points_path))[0]
+        output_path = os.path.join(CATCHMENT_OUTPUT_DIR, f"{_sanitize_filename(base)}.ndjson")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    count = 0
+    with open(points_path, "r", encoding="utf-8-sig", newline="") as fin, \
+            open(output_path, "w", encoding="utf-8") as fout:
+        for row in csv.DictReader(fin):
+            try:
+                lat, lon = float(row["lat"]), float(row["lon"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"座標が不正な行をスキップ: {row}")
+                continue
+            catchment = find_catchment(lat, lon, context, max_transfer=max_transfer)
+            record = {
+                "id": row.get("id"),
+                "lat": lat,
+                "lon": lon,
+                "access_stations": catchment["access_stations"],
+                "total_stations": len(catchment["stations"]),
+                "stations": catchment["stations"],
+            }
+            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+
+    logger.info(f"=== 商圏バッチ完了: {count}地点 → {output_path} ===")
+    return output_path
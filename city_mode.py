@@ -5,13 +5,35 @@ Overpass API (OpenStreetMap) を使用
 import json
 import os
 import re
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 import requests
 
 from image_fetcher import fetch_station_images
-from config import OVERPASS_API_URL, CITY_OUTPUT_DIR
-from transport_api import fetch_rail_graph
+from wiki_client import get_page, prefetch_pages, parse_passenger_count
+from config import (
+    OVERPASS_API_URL,
+    NOMINATIM_SEARCH_URL,
+    CITY_OUTPUT_DIR,
+    CITY_LOOKUP_DEADLINE,
+    CITY_LOOKUP_BBOX_GRACE,
+    CITY_LOOKUP_MAX_BACKUPS,
+    CITY_STATION_WORKERS,
+)
+import http_client
+from transport_api import (
+    fetch_rail_graph,
+    get_station_centrality,
+    get_graph_version,
+    CACHE_DIR,
+    lookup_stations_in_city,
+    list_cities_in_prefecture,
+    base_station_name,
+    get_passenger_table,
+)
 
 logger = logging.getLogger("store-traffic")
 
@@ -21,23 +43,25 @@ def _sanitize_filename(name):
     return re.sub(r'[\\/:*?"<>|]', "_", name).strip()
 
 
-def fetch_stations_in_city(prefecture, city):
+def _city_area_query(city):
+    """市区名の行政区域（admin_level 7/8）内の駅を取る Overpass QL"""
+    return f"""
+    [out:json][timeout:60];
+    area["name"="{city}"]["admin_level"~"[78]"]->.a;
+    (
+      node["railway"="station"](area.a);
+      node["railway"="halt"](area.a);
+    );
+    out body;
     """
-    Overpass API で指定市区内の鉄道駅を取得
-
-    Args:
-        prefecture: 都道府県名（例: "東京都"）
-        city: 市区町村名（例: "渋谷区"）
 
-    Returns:
-        list[str]: 駅名リスト
-    """
-    logger.info(f"Overpass APIで {prefecture}{city} の駅を検索中...")
 
-    # Overpass QL クエリ
-    query = f"""
+def _pref_city_area_query(prefecture, city):
+    """都道府県の行政区域内に絞った市区名の行政区域内の駅を取る Overpass QL"""
+    return f"""
     [out:json][timeout:60];
-    area["name"="{city}"]["admin_level"~"[78]"]->.a;
+    area["name"="{prefecture}"]->.pref;
+    area["name"="{city}"](area.pref)->.a;
     (
       node["railway"="station"](area.a);
       node["railway"="halt"](area.a);
@@ -45,25 +69,9 @@ def fetch_stations_in_city(prefecture, city):
     out body;
     """
 
-    try:
-        resp = requests.post(
-            OVERPASS_API_URL,
-            data={"data": query},
-            timeout=90,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except requests.RequestException as e:
-        logger.error(f"Overpass APIエラー: {e}")
-        # フォールバック: 都道府県名も含めて再検索
-        return _fetch_stations_fallback(prefecture, city)
-
-    elements = data.get("elements", [])
-    if not elements:
-        logger.info("結果なし。フォールバック検索を試行...")
-        return _fetch_stations_fallback(prefecture, city)
 
-    # 駅名を抽出（重複排除）
+def _station_names(elements):
+    """Overpass の要素から駅名を抽出（「駅」を除去して重複排除）"""
     stations = []
     seen = set()
     for elem in elements:
@@ -75,6 +83,50 @@ def fetch_stations_in_city(prefecture, city):
             if clean_name not in seen:
                 stations.append(clean_name)
                 seen.add(clean_name)
+    return stations
+
+
+def _query_overpass_stations(query, timeout=90, cancel=None):
+    """
+    Overpass QL を実行して駅名リストを返す（通信エラーは呼び出し側へ送出）
+
+    cancel が立っていれば応答の解析を省いて空リストを返す
+    """
+    resp = http_client.post(
+        OVERPASS_API_URL,
+        data={"data": query},
+        timeout=timeout,
+        cancel=cancel,
+    )
+    resp.raise_for_status()
+    if cancel is not None and cancel.is_set():
+        return []
+    return _station_names(resp.json().get("elements", []))
+
+
+def fetch_stations_in_city(prefecture, city):
+    """
+    Overpass API で指定市区内の鉄道駅を取得（失敗・結果なしなら都道府県付きで再検索）
+
+    Args:
+        prefecture: 都道府県名（例: "東京都"）
+        city: 市区町村名（例: "渋谷区"）
+
+    Returns:
+        list[str]: 駅名リスト
+    """
+    logger.info(f"Overpass APIで {prefecture}{city} の駅を検索中...")
+
+    try:
+        stations = _query_overpass_stations(_city_area_query(city))
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Overpass APIエラー: {e}")
+        # フォールバック: 都道府県名も含めて再検索
+        return _fetch_stations_fallback(prefecture, city)
+
+    if not stations:
+        logger.info("結果なし。フォールバック検索を試行...")
+        return _fetch_stations_fallback(prefecture, city)
 
     logger.info(f"{prefecture}{city}: {len(stations)}駅 検出")
     return stations
@@ -86,66 +138,42 @@ def _fetch_stations_fallback(prefecture, city):
     """
     logger.info(f"フォールバック検索: {prefecture} {city}")
 
-    query = f"""
-    [out:json][timeout:60];
-    area["name"="{prefecture}"]->.pref;
-    area["name"="{city}"](area.pref)->.a;
-    (
-      node["railway"="station"](area.a);
-      node["railway"="halt"](area.a);
-    );
-    out body;
-    """
-
     try:
-        resp = requests.post(
-            OVERPASS_API_URL,
-            data={"data": query},
-            timeout=90,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except requests.RequestException as e:
+        stations = _query_overpass_stations(_pref_city_area_query(prefecture, city))
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"フォールバック検索エラー: {e}")
         return []
 
-    elements = data.get("elements", [])
-    stations = []
-    seen = set()
-    for elem in elements:
-        tags = elem.get("tags", {})
-        name = tags.get("name", "")
-        if name and name not in seen:
-            clean_name = name.rstrip("駅")
-            if clean_name not in seen:
-                stations.append(clean_name)
-                seen.add(clean_name)
-
     logger.info(f"フォールバック結果: {len(stations)}駅")
     return stations
 
 
-def _find_stations_by_bbox(prefecture, city):
+def _find_stations_by_bbox(prefecture, city, timeout=30, cancel=None):
     """
     Nominatim + 鉄道グラフキャッシュで市区内の駅を取得（Overpass不要）
+
+    cancel が立っていればグラフの走査を省いて空リストを返す
     """
     logger.info(f"Nominatim + キャッシュで {prefecture}{city} の駅を検索中...")
     try:
-        resp = requests.get(
-            "https://nominatim.openstreetmap.org/search",
+        resp = http_client.get(
+            NOMINATIM_SEARCH_URL,
             params={"q": f"{prefecture}{city}", "format": "json", "limit": 1},
             headers={"User-Agent": "StationStudio/1.0"},
-            timeout=30,
+            timeout=timeout,
+            cancel=cancel,
         )
         resp.raise_for_status()
         results = resp.json()
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"Nominatimエラー: {e}")
         return []
 
     if not results:
         logger.warning(f"Nominatimで {prefecture}{city} が見つかりません")
         return []
+    if cancel is not None and cancel.is_set():
+        return []
 
     bbox = results[0]["boundingbox"]  # [lat_min, lat_max, lon_min, lon_max]
     lat_min, lat_max = float(bbox[0]), float(bbox[1])
@@ -167,173 +195,364 @@ def _find_stations_by_bbox(prefecture, city):
     return stations
 
 
-def fetch_passenger_count(station_name):
+# 行政区域で絞る検索（結果が出たら即採用）。"bbox" は矩形で拾うため隣接市区の駅も混じる
+_PRECISE_STRATEGIES = ("overpass_area", "overpass_pref_area")
+
+# 通信中のバックアップ戦略の数（ホスト → 件数）。打ち切った検索の分も応答が返るまで数える
+_hedge_backups = {}
+_hedge_lock = threading.Lock()
+
+
+def _reserve_backup(host):
+    """ホストのバックアップ枠を1つ確保する（CITY_LOOKUP_MAX_BACKUPS 件が通信中なら False）"""
+    with _hedge_lock:
+        if _hedge_backups.get(host, 0) >= CITY_LOOKUP_MAX_BACKUPS:
+            return False
+        _hedge_backups[host] = _hedge_backups.get(host, 0) + 1
+        return True
+
+
+def _release_backup(host):
+    with _hedge_lock:
+        _hedge_backups[host] -= 1
+
+
+def _timed(fn, timeout):
+    """戦略を1つ実行して (駅名リスト, 所要秒, エラー) を返す"""
+    t0 = time.perf_counter()
+    try:
+        return fn(timeout), time.perf_counter() - t0, None
+    except Exception as e:
+        return [], time.perf_counter() - t0, e
+
+
+def _lookup_stations_hedged(prefecture, city, deadline=CITY_LOOKUP_DEADLINE, bbox_grace=CITY_LOOKUP_BBOX_GRACE):
+    """
+    駅検索の各戦略を同時に実行し、最初に十分な結果を返したものを採用する
+
+    行政区域の検索（Overpass）は空でない結果が出た時点で採用する。矩形検索（Nominatim）の結果は
+    bbox_grace 秒だけ行政区域の結果を待ち、出なければ採用する。
+    採用が決まった時点・締め切りを過ぎた時点で残りの戦略は打ち切る（通信中のリクエストは待たないが、
+    ホストの枠を待っているリクエストは送らずに終わる）。
+    同じホストへの2本目以降の戦略はバックアップとして、そのホストのバックアップが CITY_LOOKUP_MAX_BACKUPS 件
+    通信中なら実行しない（status="skipped"）
+
+    Returns:
+        (station_names, lookup)
+        lookup: {"winner": 戦略名|None, "seconds": 全体の所要秒,
+                 "strategies": {戦略名: {"status": ok/empty/error/cancelled/skipped, "seconds", "stations"}}}
+    """
+    t0 = time.perf_counter()
+    cancel = threading.Event()
+    http_timeout = min(90, deadline)
+    # (戦略名, 接続先ホスト, 実行関数)。ホストごとに最初の戦略が本命、以降がバックアップ
+    strategies = [
+        ("overpass_area", OVERPASS_API_URL,
+         lambda timeout: _query_overpass_stations(_city_area_query(city), timeout, cancel)),
+        ("overpass_pref_area", OVERPASS_API_URL,
+         lambda timeout: _query_overpass_stations(_pref_city_area_query(prefecture, city), timeout, cancel)),
+        ("bbox", NOMINATIM_SEARCH_URL,
+         lambda timeout: _find_stations_by_bbox(prefecture, city, timeout, cancel)),
+    ]
+    timings = {name: {"status": "cancelled", "seconds": None, "stations": 0} for name, _, _ in strategies}
+
+    logger.info(f"{prefecture}{city} の駅を {len(strategies)}通りで同時検索中（締め切り {deadline:.0f}秒）...")
+    pool = ThreadPoolExecutor(max_workers=len(strategies), thread_name_prefix="city-lookup")
+    futures = {}
+    primary_hosts = set()
+    for name, url, fn in strategies:
+        host = http_client._host(url)
+        if host not in primary_hosts:
+            primary_hosts.add(host)
+            futures[pool.submit(_timed, fn, http_timeout)] = name
+        elif _reserve_backup(host):
+            fut = pool.submit(_timed, fn, http_timeout)
+            # 応答が返ったとき（開始前に取り消されたときも）にバックアップ枠を返す
+            fut.add_done_callback(lambda _f, host=host: _release_backup(host))
+            futures[fut] = name
+        else:
+            logger.info(f"駅検索 {name}: {host} のバックアップ検索が通信中のため省略")
+            timings[name] = {"status": "skipped", "seconds": 0.0, "stations": 0}
+    pending = set(futures)
+    results = {}
+    bbox_until = None
+    try:
+        while pending:
+            wait_until = t0 + deadline if bbox_until is None else min(t0 + deadline, bbox_until)
+            remaining = wait_until - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = futures[fut]
+                names, seconds, error = fut.result()
+                status = "error" if error else ("ok" if names else "empty")
+                timings[name] = {"status": status, "seconds": round(seconds, 2), "stations": len(names)}
+                if error:
+                    logger.warning(f"駅検索 {name}: エラー {error}")
+                if names:
+                    results[name] = names
+                    if name == "bbox":
+                        bbox_until = time.perf_counter() + bbox_grace
+            if any(name in results for name in _PRECISE_STRATEGIES):
+                break
+            # 行政区域の検索がすべて終わっていれば矩形の結果を待たずに採用
+            if "bbox" in results and not any(futures[f] in _PRECISE_STRATEGIES for f in pending):
+                break
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    winner = next((name for name in (*_PRECISE_STRATEGIES, "bbox") if name in results), None)
+    elapsed = time.perf_counter() - t0
+    for name, t in timings.items():
+        if t["status"] == "cancelled":
+            t["seconds"] = round(elapsed, 2)
+    logger.info(
+        f"駅検索: {winner or '該当なし'}を採用（{len(results.get(winner, []))}駅, {elapsed:.1f}秒） "
+        + ", ".join(f"{name}={t['status']}/{t['seconds']}秒" for name, t in timings.items())
+    )
+    return results.get(winner, []), {"winner": winner, "seconds": round(elapsed, 2), "strategies": timings}
+
+
+# 乗降客数の解析済み結果（版ID → {"passengers", "passenger_label"}）。版が変わらない記事は再解析しない
+PASSENGER_CACHE = os.path.join(CACHE_DIR, "wiki_passengers.json")
+_passenger_memo = {}
+_passenger_lock = threading.Lock()
+# 前回の保存以降に解析した結果があるか
+_passenger_dirty = False
+
+
+def _load_passenger_memo():
+    if not _passenger_memo and os.path.exists(PASSENGER_CACHE):
+        try:
+            with open(PASSENGER_CACHE, "r", encoding="utf-8") as f:
+                _passenger_memo.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"乗降客数キャッシュ読み込み失敗: {e}")
+
+
+def _save_passenger_memo():
+    """前回の保存以降に解析した結果があればキャッシュファイルを書き直す（一括取得では最後に1回だけ）"""
+    global _passenger_dirty
+    with _passenger_lock:
+        if not _passenger_dirty:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = PASSENGER_CACHE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_passenger_memo, f, ensure_ascii=False)
+        os.replace(tmp, PASSENGER_CACHE)
+        _passenger_dirty = False
+
+
+def fetch_passenger_count(station_name, save=True):
     """
     Wikipedia日本語版から駅の乗降客数を全社合算で取得。
     乗降人員はそのまま、乗車人員は×2して乗降換算。
+    記事は冒頭節（infobox）だけを取得し、解析結果は記事の版IDごとにキャッシュする。
+    乗降客数表（build_passenger_table）にある駅は表を引くだけで API は呼ばない
+    （表にない駅は記事名の揺れなどで対応づけられなかった駅なので、API で取得する）。
 
     Args:
         station_name: 駅名（「駅」なし）
+        save: False なら解析結果をキャッシュファイルに書かない（呼び出し側で _save_passenger_memo() する）
 
     Returns:
         dict: {"passengers": int|None, "passenger_label": str|None}
     """
+    global _passenger_dirty
+    # Wikipediaダンプから作った乗降客数表にあればネットワークを使わない
+    table = get_passenger_table()
+    if table is not None:
+        row = table.get(station_name)
+        if row:
+            return {"passengers": row["passengers"], "passenger_label": row["passenger_label"]}
+        logger.info(f"乗降客数表にない駅のため Wikipedia API で取得: {station_name}")
+
     page_title = f"{station_name}駅"
-    try:
-        resp = requests.get(
-            "https://ja.wikipedia.org/w/api.php",
-            params={
-                "action": "query",
-                "titles": page_title,
-                "prop": "revisions",
-                "rvprop": "content",
-                "rvlimit": 1,
-                "format": "json",
-            },
-            headers={"User-Agent": "StationStudio/1.0"},
-            timeout=30,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except Exception as e:
-        logger.debug(f"Wikipedia取得失敗 ({page_title}): {e}")
+    page = get_page(page_title)
+    wikitext = page["wikitext"] if page else None
+    if not wikitext:
+        logger.debug(f"Wikipedia記事なし ({page_title})")
         return {"passengers": None, "passenger_label": None}
 
-    pages = data.get("query", {}).get("pages", {})
-    for pid, page in pages.items():
-        if pid == "-1":
-            break
-        revs = page.get("revisions", [])
-        if not revs:
-            break
-        wikitext = revs[0].get("*", "")
-
-        total = 0
-        found = False
-        for label in ("乗降人員", "乗車人員"):
-            multiplier = 1 if label == "乗降人員" else 2
-            for m in re.finditer(rf"\|\s*{label}\s*=\s*(.+)", wikitext):
-                line = m.group(1)
-                pipe_pos = line.find("|")
-                if pipe_pos >= 0:
-                    line = line[:pipe_pos]
-                # refタグ・マークアップ除去
-                line = re.sub(r"<ref[^>]*/>", "", line)
-                line = re.sub(r"<ref[^>]*>.*?</ref>", "", line, flags=re.DOTALL)
-                line = re.sub(r"<br\s*/?>", " ", line)
-                line = line.replace("'''", "")
-                line = re.sub(r"（[^）]*）", " ", line)
-                line = re.sub(r"\{\{[^}]*\}\}", "", line)
-                # 「数字+人」パターン
-                numbers = re.findall(r"([\d,]+)\s*人", line)
-                if numbers:
-                    for n in numbers:
-                        v = int(n.replace(",", ""))
-                        if v > 100:
-                            total += v * multiplier
-                            found = True
-                    continue
-                # 「人」なし — 3桁以上の数字
-                numbers2 = re.findall(r"([\d,]{3,})", line)
-                for n in numbers2:
-                    v = int(n.replace(",", ""))
-                    if v > 100:
-                        total += v * multiplier
-                        found = True
-
-        if found:
-            logger.info(f"{page_title}: 全社合算乗降人員 = {total:,}")
-            return {"passengers": total, "passenger_label": "乗降人員（全社合算）"}
-
-    logger.debug(f"{page_title}: 乗降客数データなし")
-    return {"passengers": None, "passenger_label": None}
-
-
-def _rank_stations_by_popularity(station_names, top_n=3):
+    revid = str(page["revid"]) if page.get("revid") else None
+    with _passenger_lock:
+        _load_passenger_memo()
+        cached = _passenger_memo.get(revid) if revid else None
+    if cached is not None:
+        return dict(cached)
+
+    total = parse_passenger_count(wikitext)
+    if total is not None:
+        logger.info(f"{page_title}: 全社合算乗降人員 = {total:,}")
+        result = {"passengers": total, "passenger_label": "乗降人員（全社合算）"}
+    else:
+        logger.debug(f"{page_title}: 乗降客数データなし")
+        result = {"passengers": None, "passenger_label": None}
+
+    if revid:
+        with _passenger_lock:
+            _passenger_memo[revid] = result
+            _passenger_dirty = True
+        if save:
+            _save_passenger_memo()
+    return dict(result)
+
+
+# 市区内ランキングの並び順（いずれも成果物に保存済みの中心性指標を引くだけ）
+RANKING_ORDERS = {
+    "lines": lambda c: (c["line_count"],),
+    "hub": lambda c: (c["line_count"], c["betweenness"], c["transfer_degree"]),
+    "betweenness": lambda c: (c["betweenness"], c["line_count"]),
+    "transfer": lambda c: (c["transfer_degree"], c["line_count"]),
+}
+
+
+def _rank_stations_by_popularity(station_names, top_n=3, order="lines"):
     """
-    鉄道グラフの乗り入れ路線数で駅をランキングし上位N件を返す
+    鉄道グラフの中心性指標で駅をランキングし上位N件を返す
 
     Args:
         station_names: Overpassで取得した駅名リスト
         top_n: 上位何件を返すか
+        order: 並び順（RANKING_ORDERS のキー。既定は乗り入れ路線数）
 
     Returns:
         list[dict]: [{"name": str, "line_count": int, "lat": float|None, "lon": float|None}, ...]
     """
     station_to_railways, _railway_stations, station_coords = fetch_rail_graph()
+    centrality = get_station_centrality()
+    sort_key = RANKING_ORDERS.get(order, RANKING_ORDERS["lines"])
+    empty = {"line_count": 0, "transfer_degree": 0, "betweenness": 0.0}
 
     ranked = []
     for name in station_names:
-        railways_list = sorted(station_to_railways.get(name, set()))
-        line_count = len(railways_list)
+        c = centrality.get(name, empty)
         coords = station_coords.get(name, {})
         ranked.append({
             "name": name,
-            "line_count": line_count,
-            "railways": railways_list,
+            "line_count": c["line_count"],
+            "railways": sorted(station_to_railways.get(name, set())),
             "lat": coords.get("lat"),
             "lon": coords.get("lon"),
+            "_key": sort_key(c),
         })
 
-    # 路線数で降順ソート（同数なら元の順序を維持）
-    ranked.sort(key=lambda x: x["line_count"], reverse=True)
+    # 指標で降順ソート（同数なら元の順序を維持）
+    ranked.sort(key=lambda x: x["_key"], reverse=True)
 
     top = ranked[:top_n]
-    logger.info(f"上位{top_n}駅: {[(s['name'], s['line_count']) for s in top]}")
+    for s in top:
+        s.pop("_key")
+    logger.info(f"上位{top_n}駅（{order}）: {[(s['name'], s['line_count']) for s in top]}")
     return top
 
 
-def run_city_mode(prefecture, city):
+def _fetch_station_assets(station_name, output_subdir, label=""):
     """
-    市区別モード実行
+    1駅分の画像と乗降客数を取得（駅ごとに並列で呼ばれる）
+
+    Returns:
+        (image_paths, pax)
+        image_paths: 市区別出力ディレクトリ（CITY_OUTPUT_DIR）からの相対パスのリスト
+        pax: fetch_passenger_count() の戻り値
+    """
+    logger.info(f"{label} {station_name} の画像を取得中...")
+    image_paths = fetch_station_images(station_name, output_subdir)
+
+    # 相対パスに変換
+    rel_paths = [os.path.relpath(p, os.path.dirname(output_subdir)) for p in image_paths]
+
+    # Wikipedia乗降客数を取得（キャッシュファイルは全駅の取得後にまとめて保存）
+    pax = fetch_passenger_count(station_name, save=False)
+    return rel_paths, pax
+
+
+def _fetch_all_station_assets(owners):
+    """
+    複数駅の画像・乗降客数を並列取得する（Wikipedia記事は乗降客数・記事画像用にまとめて先に取得）
 
     Args:
-        prefecture: 都道府県名（例: "東京都"）
-        city: 市区町村名（例: "渋谷区"）
+        owners: dict[元の駅名] -> 画像の保存先ディレクトリ（順位順）
 
     Returns:
-        dict: 結果データ
+        dict[元の駅名] -> (image_paths, pax)。取得に失敗した駅はエラーメッセージ（str）
     """
-    logger.info(f"=== 市区別モード開始 ===")
-    logger.info(f"対象: {prefecture} {city}")
+    prefetch_pages([f"{name}駅" for name in owners])
+    assets = {}
+    with ThreadPoolExecutor(max_workers=CITY_STATION_WORKERS, thread_name_prefix="city-station") as pool:
+        tasks = {
+            name: pool.submit(_fetch_station_assets, name, subdir, f"[{i+1}/{len(owners)}]")
+            for i, (name, subdir) in enumerate(owners.items())
+        }
+        for name, fut in tasks.items():
+            # 1駅の失敗で他の駅・市区の取得を止めない
+            try:
+                assets[name] = fut.result()
+            except Exception as e:
+                logger.error(f"{name}駅 の画像・乗降客数の取得に失敗: {e}")
+                assets[name] = str(e)
+    _save_passenger_memo()
+    return assets
 
-    # 出力ディレクトリ準備
-    safe_pref = _sanitize_filename(prefecture)
-    safe_city = _sanitize_filename(city)
-    output_subdir = os.path.join(CITY_OUTPUT_DIR, f"{safe_pref}_{safe_city}")
-    os.makedirs(output_subdir, exist_ok=True)
 
-    # 1. 市区内の全駅リストを取得
-    station_names = fetch_stations_in_city(prefecture, city)
-    if not station_names:
-        # Overpass失敗時: Nominatim + 鉄道グラフキャッシュで検索
-        station_names = _find_stations_by_bbox(prefecture, city)
-    if not station_names:
-        logger.warning("駅が見つかりませんでした")
-        return None
+def _city_output_subdir(prefecture, city):
+    return os.path.join(CITY_OUTPUT_DIR, f"{_sanitize_filename(prefecture)}_{_sanitize_filename(city)}")
 
-    total_found = len(station_names)
-    logger.info(f"取得駅数: {total_found}駅")
 
-    # 2. 乗り入れ路線数で上位5駅を選定
-    top_stations = _rank_stations_by_popularity(station_names, top_n=5)
+def _select_city_stations(prefecture, city, rank_by):
+    """
+    市区内の全駅を取得し、上位5駅を選ぶ
 
-    # 3. 上位5駅の画像を取得
-    stations_data = []
+    Returns:
+        (station_names, lookup, top_stations)。駅が見つからなければ None
+    """
+    # 行政区域の割り当て表があればネットワークを使わない
+    station_names = lookup_stations_in_city(prefecture, city)
+    if station_names:
+        logger.info(f"行政区域の割り当て表から取得: {len(station_names)}駅")
+        lookup = {"winner": "boundaries", "seconds": 0.0, "strategies": {}}
+    else:
+        # Overpass（2通り）と Nominatim + 鉄道グラフキャッシュを同時に投げ、先に揃った結果を使う
+        station_names, lookup = _lookup_stations_hedged(prefecture, city)
+    if not station_names:
+        logger.warning(f"{prefecture}{city}: 駅が見つかりませんでした")
+        return None
 
-    for i, st_info in enumerate(top_stations):
-        station_name = st_info["name"]
-        logger.info(f"[{i+1}/{len(top_stations)}] {station_name} の画像を取得中...")
+    logger.info(f"取得駅数: {len(station_names)}駅")
 
-        image_paths = fetch_station_images(station_name, output_subdir)
+    # 中心性指標（既定は乗り入れ路線数）で上位5駅を選定
+    top_stations = _rank_stations_by_popularity(station_names, top_n=5, order=rank_by)
+    return station_names, lookup, top_stations
 
-        # 相対パスに変換
-        rel_paths = [os.path.relpath(p, os.path.dirname(output_subdir)) for p in image_paths]
 
-        # Wikipedia乗降客数を取得
-        pax = fetch_passenger_count(station_name)
+def _save_city_result(prefecture, city, rank_by, selection, assets):
+    """
+    選定結果と取得済みの画像・乗降客数から市区別の結果JSONを作って保存する
+
+    Returns:
+        (result, json_path)
+    """
+    station_names, lookup, top_stations = selection
+    pax_table = get_passenger_table()
 
-        station_entry = {
+    # 同名駅の表示名（"赤坂(東京)"）は元の駅名で取得した結果を使う（順位順）
+    stations_data = []
+    for st_info in top_stations:
+        station_name = base_station_name(st_info["name"])
+        error = None
+        if isinstance(assets[station_name], str):
+            # 取得に失敗した駅は画像なしで載せ、status="error" を残す
+            error = assets[station_name]
+            rel_paths, pax = [], {"passengers": None, "passenger_label": None}
+        else:
+            rel_paths, pax = assets[station_name]
+        if pax_table is not None and st_info["name"] in pax_table:
+            # 乗降客数表は同名駅も表示名ごとに持っている
+            pax = pax_table[st_info["name"]]
+        station_data = {
             "name": f"{station_name}駅",
             "line_count": st_info["line_count"],
             "railways": st_info.get("railways", []),
@@ -343,23 +562,198 @@ def run_city_mode(prefecture, city):
             "passengers": pax["passengers"],
             "passenger_label": pax["passenger_label"],
         }
-        stations_data.append(station_entry)
+        if error is not None:
+            station_data.update(status="error", error=error)
+        stations_data.append(station_data)
 
-    # 4. JSON保存
     result = {
         "prefecture": prefecture,
         "city": city,
-        "total_stations_found": total_found,
+        "graph_hash": get_graph_version()["graph_hash"],
+        "input_stations": station_names,
+        "total_stations_found": len(station_names),
+        "lookup": lookup,
+        "rank_by": rank_by,
         "total_stations": len(stations_data),
         "stations": stations_data,
     }
+    if pax_table is not None:
+        # 乗降客数表があれば上位駅以外も含めた市区内の全駅分
+        result["station_passengers"] = {n: pax_table[n]["passengers"] for n in station_names if n in pax_table}
 
-    json_filename = f"{safe_pref}_{safe_city}.json"
+    json_filename = f"{_sanitize_filename(prefecture)}_{_sanitize_filename(city)}.json"
     json_path = os.path.join(CITY_OUTPUT_DIR, json_filename)
     with open(json_path, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
 
     logger.info(f"JSON保存: {json_path}")
-    logger.info(f"=== 市区別モード完了: {len(stations_data)}駅 ===")
+    return result, json_path
+
+
+def run_city_mode(prefecture, city, rank_by="lines"):
+    """
+    市区別モード実行
+
+    Args:
+        prefecture: 都道府県名（例: "東京都"）
+        city: 市区町村名（例: "渋谷区"）
+        rank_by: 上位駅の並び順（RANKING_ORDERS のキー）
+
+    Returns:
+        dict: 結果データ
+    """
+    logger.info(f"=== 市区別モード開始 ===")
+    logger.info(f"対象: {prefecture} {city}")
+
+    # 出力ディレクトリ準備
+    output_subdir = _city_output_subdir(prefecture, city)
+    os.makedirs(output_subdir, exist_ok=True)
+
+    # 1-2. 市区内の全駅リストを取得し、上位5駅を選定
+    selection = _select_city_stations(prefecture, city, rank_by)
+    if selection is None:
+        return None
+
+    # 3. 上位5駅の画像・乗降客数を駅ごとに並列取得（元の駅名が同じ駅は1回にまとめる）
+    owners = dict.fromkeys(base_station_name(st["name"]) for st in selection[2])
+    assets = _fetch_all_station_assets({name: output_subdir for name in owners})
+
+    # 4. JSON保存
+    result, _json_path = _save_city_result(prefecture, city, rank_by, selection, assets)
+    logger.info(f"=== 市区別モード完了: {result['total_stations']}駅 ===")
+    http_client.log_latency_stats()
 
     return result
+
+
+def _read_city_list(path, default_prefecture=None):
+    """
+    市区リストファイルを読む（1行1市区。「都道府県,市区」または「市区」のみ。タブ区切りも可）
+
+    市区のみの行は default_prefecture を使う。空行・#で始まる行・見出し行は無視する
+
+    Returns:
+        list[(都道府県, 市区)]
+    """
+    cities = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = [p.strip() for p in re.split(r"[,\t]", line) if p.strip()]
+            if fields[0] in ("prefecture", "都道府県", "city", "市区町村"):
+                continue
+            if len(fields) >= 2:
+                cities.append((fields[0], fields[1]))
+            elif default_prefecture:
+                cities.append((default_prefecture, fields[0]))
+            else:
+                logger.warning(f"都道府県がないためスキップ: {line}（--pref で既定の都道府県を指定できます）")
+    return list(dict.fromkeys(cities))
+
+
+def run_city_batch(prefecture=None, cities_path=None, rank_by="lines"):
+    """
+    複数市区をまとめて処理する（都道府県内の全市区町村、または市区リストファイル）
+
+    グラフは1回だけ読み込み、市区をまたいで重複する上位駅の画像・乗降客数は1回だけ取得する。
+    市区ごとの結果JSONは単体の市区別モードと同じ形式で保存し、全市区の一覧をNDJSONに書き出す
+
+    Args:
+        prefecture: 都道府県名（cities_path がなければ、行政区域の割り当て表からこの都道府県の全市区町村を対象にする）
+        cities_path: 市区リストファイル（_read_city_list() の形式）
+        rank_by: 上位駅の並び順（RANKING_ORDERS のキー）
+
+    Returns:
+        dict: {"index_path", "cities", "found", "errors", "stations", "fetched"}。対象市区がなければ None
+    """
+    if cities_path:
+        cities = _read_city_list(cities_path, prefecture)
+        label = os.path.splitext(os.path.basename(cities_path))[0]
+    else:
+        cities = [(prefecture, c) for c in (list_cities_in_prefecture(prefecture) or [])]
+        label = prefecture
+        if not cities:
+            logger.warning(
+                f"{prefecture} の市区町村一覧がありません（--mode graph --boundaries で行政区域を取り込むか、--cities で市区リストを指定）"
+            )
+    if not cities:
+        return None
+
+    logger.info(f"=== 市区別一括モード開始: {label}（{len(cities)}市区） ===")
+    fetch_rail_graph()  # 全市区でグラフを共有
+
+    # 1-2. 全市区の上位駅を選定
+    selections = []
+    errors = {}
+    for i, (pref, city) in enumerate(cities):
+        logger.info(f"[{i+1}/{len(cities)}] {pref} {city}")
+        # 1市区の失敗で都道府県全体の実行を止めない（一覧には status="error" で残す）
+        try:
+            selection = _select_city_stations(pref, city, rank_by)
+        except Exception as e:
+            logger.error(f"{pref}{city}: 駅の選定に失敗: {e}")
+            errors[(pref, city)] = str(e)
+            selection = None
+        selections.append((pref, city, selection))
+
+    # 3. 市区をまたいで重複する駅は、最初に現れた市区のディレクトリに1回だけ取得
+    owners = {}
+    for pref, city, selection in selections:
+        if selection is None:
+            continue
+        subdir = _city_output_subdir(pref, city)
+        os.makedirs(subdir, exist_ok=True)
+        for st in selection[2]:
+            owners.setdefault(base_station_name(st["name"]), subdir)
+    total_stations = sum(len(sel[2]) for _, _, sel in selections if sel)
+    logger.info(f"上位駅 のべ{total_stations}駅 → 取得 {len(owners)}駅")
+    assets = _fetch_all_station_assets(owners)
+
+    # 4. 市区ごとのJSONと一覧NDJSON
+    os.makedirs(CITY_OUTPUT_DIR, exist_ok=True)
+    index_path = os.path.join(CITY_OUTPUT_DIR, f"{_sanitize_filename(label)}_index.ndjson")
+    found = 0
+    with open(index_path, "w", encoding="utf-8") as fout:
+        for pref, city, selection in selections:
+            record = {"prefecture": pref, "city": city}
+            if selection is not None:
+                try:
+                    result, json_path = _save_city_result(pref, city, rank_by, selection, assets)
+                except Exception as e:
+                    logger.error(f"{pref}{city}: 結果JSONの保存に失敗: {e}")
+                    errors[(pref, city)] = str(e)
+                    selection = None
+            if (pref, city) in errors:
+                record.update(
+                    status="error", error=errors[(pref, city)], json_path=None, total_stations_found=0, stations=[]
+                )
+            elif selection is None:
+                record.update(status="not_found", json_path=None, total_stations_found=0, stations=[])
+            else:
+                stations = []
+                for s in result["stations"]:
+                    entry = {"name": s["name"], "passengers": s["passengers"], "images": len(s["image_path"])}
+                    if s.get("status") == "error":
+                        entry.update(status="error", error=s["error"])
+                    stations.append(entry)
+                record.update(
+                    status="ok",
+                    json_path=os.path.relpath(json_path, CITY_OUTPUT_DIR),
+                    total_stations_found=result["total_stations_found"],
+                    stations=stations,
+                )
+                found += 1
+            fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    logger.info(f"=== 市区別一括モード完了: {found}/{len(cities)}市区（失敗 {len(errors)}市区） → {index_path} ===")
+    http_client.log_latency_stats()
+    return {
+        "index_path": index_path,
+        "cities": len(cities),
+        "found": found,
+        "errors": len(errors),
+        "stations": total_stations,
+        "fetched": len(owners),
+    }
@@ -59,7 +59,64 @@ IMAGE_QUERIES_SCENERY = [
 
 ODPT_BASE_URL = "https://api.odpt.org/api/v4"
 OVERPASS_API_URL = "https://overpass-api.de/api/interpreter"
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
 WIKIMEDIA_API_URL = "https://commons.wikimedia.org/w/api.php"
+JA_WIKIPEDIA_API_URL = "https://ja.wikipedia.org/w/api.php"
+
+# 全国鉄道グラフ取得時のOverpass応答形式
+# "lean": 駅ノードとrelationのみ（既定・軽量） / "full": wayや線路形状ノードも含めて全取得
+OVERPASS_FETCH_MODE = os.environ.get("OVERPASS_FETCH_MODE", "lean")
+
+# ローカルのOSM抽出ファイル（.osm.pbf / .osm.xml(.bz2/.gz)）。指定するとOverpassの代わりにこれからグラフを構築
+OSM_EXTRACT_PATH = os.environ.get("OSM_EXTRACT_PATH", "")
+
+# 事業者のGTFS(zip)。カンマ区切りで指定すると、グラフ構築後に駅間の実測所要時間を取り込む
+GTFS_FEEDS = [p for p in os.environ.get("GTFS_FEEDS", "").split(",") if p]
+
+# 行政区域ポリゴン（GeoJSON。国土数値情報 N03 など）。カンマ区切りで指定すると、
+# グラフ構築後に全駅を都道府県・市区町村に割り当てる（市区別モードがネットワークなしで引ける）
+MUNICIPAL_BOUNDARIES = [p for p in os.environ.get("MUNICIPAL_BOUNDARIES", "").split(",") if p]
+
+# 鉄道グラフ構築の並列プロセス数（0 = CPUコア数）
+GRAPH_BUILD_WORKERS = int(os.environ.get("GRAPH_BUILD_WORKERS", "0"))
+
+# 駅別モードの乗り換え回数の上限（アプリはこの回数まで1回で探索し、回数は結果側で絞り込む）
+MAX_TRANSFER_LEVEL = 5
+
+# 市区別モードの駅検索（Overpass の行政区域検索 / 都道府県内の行政区域検索 / Nominatim+矩形 を同時に実行）
+# 全体の締め切り（秒）と、矩形の結果が先に出たときに行政区域の結果を待つ猶予（秒）
+CITY_LOOKUP_DEADLINE = float(os.environ.get("CITY_LOOKUP_DEADLINE", "60"))
+CITY_LOOKUP_BBOX_GRACE = float(os.environ.get("CITY_LOOKUP_BBOX_GRACE", "5"))
+# 同じホストへの2本目以降の戦略（バックアップ）を通信中にしておける数（ホストごと）。
+# 打ち切った検索の応答待ちがホストの同時接続数（HOST_LIMITS）を埋め、次の市区の検索が詰まらないようにする
+CITY_LOOKUP_MAX_BACKUPS = 1
+
+# 市区別モードで上位駅の画像・乗降客数を並列に取得するスレッド数
+CITY_STATION_WORKERS = 5
+
+# 画像可用性インデックス（build_image_index）: 調べ直すまでの日数と、Commons調査の並列数
+IMAGE_INDEX_MAX_AGE_DAYS = 30
+IMAGE_INDEX_WORKERS = 4
+
+# 画像候補のダウンロードに使うスレッド数（全ジョブで共有。ホストごとの上限は HOST_LIMITS）
+IMAGE_DOWNLOAD_WORKERS = 8
+# アプリのライブラリ保存で駅ごとの画像取得を並列に行うスレッド数
+IMAGE_FETCH_WORKERS = 4
+
+# ホストごとの (同時接続数, 毎秒のリクエスト数, バースト)。トークンバケットで、並列処理・複数ジョブ・
+# 複数セッションからのアクセスを合わせてもこの範囲に収める（毎秒のリクエスト数 0 は間隔の制限なし）
+HOST_LIMITS = {
+    "ja.wikipedia.org": (2, 5.0, 2),
+    "commons.wikimedia.org": (2, 2.0, 2),
+    "upload.wikimedia.org": (2, 1.0, 1),
+    "www.googleapis.com": (2, 5.0, 2),
+    "nominatim.openstreetmap.org": (1, 1.0, 1),
+    "overpass-api.de": (2, 0.0, 0),
+}
+# 上記以外のホスト（Google検索結果の画像URLなど）
+HOST_LIMIT_DEFAULT = (4, 0.0, 0)
+# HTTPリクエストの既定タイムアウト（秒）。Overpass など重い問い合わせは呼び出し側で延ばす
+HTTP_TIMEOUT = 30
 
 # =============================================
 # 出力ディレクトリ
@@ -68,6 +125,7 @@ WIKIMEDIA_API_URL = "https://commons.wikimedia.org/w/api.php"
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
 STATION_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "station")
 CITY_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "city")
+CATCHMENT_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "catchment")
 IMAGE_CACHE_DIR = os.path.join(OUTPUT_DIR, "image_cache")
 
 # =============================================
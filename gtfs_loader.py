@@ -0,0 +1,144 @@
+"""
+GTFS読み込み - 事業者のGTFS(zip)から駅間の実測所要時間（区間ごとの中央値）を求める
+
+stop_times.txt は trip ごとに逐次読み、隣り合う停車の発着時刻差だけを区間ごとの
+度数表（所要秒 → 本数）に積み上げるので、全件をメモリに載せない。
+GTFSの停留所 → グラフの駅の対応づけと、区間がグラフ上で隣接しているかの判定は呼び出し側が渡す。
+"""
+import csv
+import io
+import os
+import zipfile
+import logging
+from collections import Counter, defaultdict
+
+logger = logging.getLogger("store-traffic")
+
+# 鉄道系の route_type（基本: 0=路面電車, 1=地下鉄, 2=鉄道, 5=ケーブル, 7=ケーブルカー, 12=モノレール
+# 拡張: 100番台=鉄道, 400番台=都市鉄道, 900番台=路面電車）
+_RAIL_ROUTE_TYPES = {0, 1, 2, 5, 7, 12}
+
+
+def _is_rail_route(route_type):
+    try:
+        t = int(route_type)
+    except (TypeError, ValueError):
+        return False
+    return t in _RAIL_ROUTE_TYPES or 100 <= t < 200 or 400 <= t < 500 or 900 <= t < 1000
+
+
+def _read_csv(zf, name):
+    """zip内のCSVを1行ずつ dict で返す（BOM付きにも対応）"""
+    with zf.open(name) as f:
+        yield from csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig", newline=""))
+
+
+def _seconds(hms):
+    """GTFSの時刻 "HH:MM:SS"（24時以降も可）→ 秒。空なら None"""
+    if not hms or not hms.strip():
+        return None
+    h, m, s = hms.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def _median(counter):
+    """度数表（値 → 件数）の中央値"""
+    half = (sum(counter.values()) + 1) // 2
+    acc = 0
+    for value in sorted(counter):
+        acc += counter[value]
+        if acc >= half:
+            return value
+    return None
+
+
+def _feed_segment_counts(path, match_stop, is_adjacent, counts, stats):
+    """1つのGTFS zipを読み、区間ごとの所要秒の度数を counts に加える"""
+    with zipfile.ZipFile(path) as zf:
+        rail_routes = {r["route_id"] for r in _read_csv(zf, "routes.txt") if _is_rail_route(r.get("route_type"))}
+        rail_trips = {t["trip_id"] for t in _read_csv(zf, "trips.txt") if t.get("route_id") in rail_routes}
+
+        stop_station = {}
+        for s in _read_csv(zf, "stops.txt"):
+            try:
+                lat, lon = float(s["stop_lat"]), float(s["stop_lon"])
+            except (KeyError, TypeError, ValueError):
+                lat = lon = None
+            station = match_stop(s.get("stop_name", ""), lat, lon)
+            stats["stops"] += 1
+            if station:
+                stop_station[s["stop_id"]] = station
+                stats["matched_stops"] += 1
+
+        def _flush(rows):
+            """1 trip 分の停車（順序, 駅, 着, 発）から隣り合う停車間の所要秒を積む"""
+            rows.sort(key=lambda r: r[0])
+            for (_, st_a, arr_a, dep_a), (_, st_b, arr_b, dep_b) in zip(rows, rows[1:]):
+                if st_a is None or st_b is None or st_a == st_b:
+                    continue
+                start = dep_a if dep_a is not None else arr_a
+                end = arr_b if arr_b is not None else dep_b
+                if start is None or end is None or end <= start or not is_adjacent(st_a, st_b):
+                    continue
+                key = (st_a, st_b) if st_a < st_b else (st_b, st_a)
+                counts[key][end - start] += 1
+                stats["samples"] += 1
+
+        # stop_times は trip_id ごとにまとまっている前提で、trip単位に区切って処理する
+        current_trip, rows = None, []
+        bad_rows = 0
+        for r in _read_csv(zf, "stop_times.txt"):
+            trip = r["trip_id"]
+            if trip != current_trip:
+                _flush(rows)
+                current_trip, rows = trip, []
+            if trip not in rail_trips:
+                continue
+            try:
+                rows.append((
+                    int(r["stop_sequence"]),
+                    stop_station.get(r["stop_id"]),
+                    _seconds(r.get("arrival_time")),
+                    _seconds(r.get("departure_time")),
+                ))
+            except (TypeError, ValueError):
+                # 停車順・時刻の形式が不正な行は読み飛ばす（飛ばした駅をまたぐ区間は is_adjacent で除かれる）
+                bad_rows += 1
+        _flush(rows)
+        if bad_rows:
+            logger.warning(f"GTFS: 形式が不正な stop_times の行 {bad_rows}件をスキップ: {os.path.basename(path)}")
+        stats["bad_rows"] += bad_rows
+
+
+def load_gtfs_segment_minutes(paths, match_stop, is_adjacent):
+    """
+    GTFS zip 群から、グラフ上で隣接する駅間の所要時間（中央値、分）を求める
+
+    Args:
+        paths: GTFS zip のパスのリスト
+        match_stop: (停留所名, lat, lon) → グラフの駅名 or None
+        is_adjacent: (駅名, 駅名) → グラフ上で隣り合う駅なら True
+
+    Returns:
+        (edge_minutes, stats)
+        edge_minutes: dict[(駅名, 駅名)] -> 分（キーは駅名の昇順）
+        stats: {"feeds", "stops", "matched_stops", "samples", "bad_rows", "edges"}
+    """
+    counts = defaultdict(Counter)
+    stats = {"feeds": 0, "stops": 0, "matched_stops": 0, "samples": 0, "bad_rows": 0}
+    for path in paths:
+        logger.info(f"GTFS読み込み: {os.path.basename(path)}")
+        try:
+            _feed_segment_counts(path, match_stop, is_adjacent, counts, stats)
+        except (zipfile.BadZipFile, KeyError, ValueError, csv.Error) as e:
+            logger.warning(f"GTFSを読み込めないためスキップ: {path}（{e}）")
+            continue
+        stats["feeds"] += 1
+
+    edge_minutes = {key: round(_median(c) / 60, 1) for key, c in counts.items()}
+    stats["edges"] = len(edge_minutes)
+    logger.info(
+        f"GTFS: {stats['feeds']}フィード, 停留所 {stats['matched_stops']}/{stats['stops']}件を駅に対応づけ, "
+        f"{stats['samples']}区間実績 → {stats['edges']}区間"
+    )
+    return edge_minutes, stats
@@ -0,0 +1,238 @@
+"""
+HTTP 共通処理 - 外部APIへのリクエストはすべてここを通す
+
+- ホストごとに requests.Session を1つ持ち、接続を使い回す（TCP/TLSのハンドシェイクは最初の1回だけ）。
+  接続プールの大きさはホストの同時接続数に合わせる
+- ホストごとに同時接続数とトークンバケット（毎秒のリクエスト数・バースト）を守る（駅ごとの処理を並列にしても、
+  同じサイトへの負荷は HOST_LIMITS の範囲に収まる）。429 が返ったホストは Retry-After の間、
+  全スレッドで新しいリクエストを止める
+- ホストごとの所要時間を集計する（latency_stats）
+- cancel（threading.Event）を渡したリクエストは、枠を取る前に cancel が立っていれば送らずに打ち切る
+  （結果を待たなくなったヘッジ検索などが、枠の空き待ちから後続の処理の枠を埋めないようにする）
+制限・接続・集計はモジュール変数で持つので、プロセス内の全スレッド・全ジョブ・Streamlit の全セッションで共有される
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HOST_LIMITS, HOST_LIMIT_DEFAULT, HTTP_TIMEOUT
+
+logger = logging.getLogger("store-traffic")
+
+# 429 で Retry-After がないときにホストを止める秒数
+_DEFAULT_BACKOFF = 5.0
+# Retry-After が長すぎるときもホストを止めるのはこの秒数まで（全スレッドが止まるため）
+_MAX_BACKOFF = 15.0
+# cancel 付きのリクエストが枠の空きを待つ間、打ち切りを確認する間隔（秒）
+_CANCEL_POLL = 0.05
+
+
+class RequestCancelled(requests.RequestException):
+    """cancel が立っていたため、ホストの枠を取る前に打ち切ったリクエスト"""
+
+
+class _HostLimiter:
+    """
+    1ホスト分の同時接続数（セマフォ）とトークンバケット
+
+    トークンは毎秒 rate 個ずつ burst 個まで貯まり、リクエストごとに1個使う。
+    足りないときは残量を負にして予約し、貯まる時刻まで待つ（予約順に開始する）
+    """
+
+    def __init__(self, max_concurrent, rate, burst):
+        self.max_concurrent = max_concurrent
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """now 時点の残量（updated が未来なら、その時刻まで貯まらない分だけ少ない）"""
+        return min(self.burst, self.tokens + (now - self.updated) * self.rate)
+
+    def wait_turn(self):
+        """トークンを1個予約し、使えるようになるまで待つ"""
+        with self.lock:
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if self.rate > 0:
+                self.tokens = self._refill(now) - 1
+                self.updated = now
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+
+    def backoff(self, seconds):
+        """このホストへの次のリクエスト開始を seconds 秒後以降に遅らせる（貯まっていたトークンも捨てる）"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            if self.rate > 0:
+                self.tokens = min(self._refill(now), 0.0)
+                self.updated = max(now, self.paused_until)
+
+
+class _HostStats:
+    """1ホスト分のリクエスト数と所要時間（秒）"""
+
+    def __init__(self):
+        self.seconds = []
+        self.errors = 0
+
+
+_limiters = {}
+_sessions = {}
+_stats = {}
+_state_lock = threading.Lock()
+
+
+def _host(url):
+    return urlsplit(url).hostname or ""
+
+
+def _limiter(host):
+    with _state_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _HostLimiter(*HOST_LIMITS.get(host, HOST_LIMIT_DEFAULT))
+            _limiters[host] = limiter
+        return limiter
+
+
+def _session(host):
+    """ホストごとの Session（接続プールは同時接続数ぶん。再試行は呼び出し側で行う）"""
+    with _state_lock:
+        session = _sessions.get(host)
+        if session is None:
+            max_concurrent = HOST_LIMITS.get(host, HOST_LIMIT_DEFAULT)[0]
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent, max_retries=0)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _record(host, seconds, error=False):
+    with _state_lock:
+        stats = _stats.setdefault(host, _HostStats())
+        stats.seconds.append(seconds)
+        if error:
+            stats.errors += 1
+
+
+def _retry_after(resp):
+    """429 の応答からホストを止める秒数（0〜_MAX_BACKOFF 秒。HTTP日付形式・不正値は既定値）"""
+    try:
+        seconds = float(resp.headers.get("Retry-After", ""))
+    except ValueError:
+        seconds = _DEFAULT_BACKOFF
+    if seconds != seconds:  # nan
+        seconds = _DEFAULT_BACKOFF
+    return min(max(seconds, 0.0), _MAX_BACKOFF)
+
+
+@contextmanager
+def host_slot(url, cancel=None):
+    """
+    URL のホストの枠を確保してから with ブロックを実行する（get/post は内部でこれを使う）
+
+    cancel が枠の確保前・順番待ちの後に立っていれば RequestCancelled を送出する（枠は使わない）
+
+    例:
+        with host_slot(url):
+            ...
+    """
+    limiter = _limiter(_host(url))
+    if cancel is None:
+        limiter.slots.acquire()
+    else:
+        while not limiter.slots.acquire(timeout=_CANCEL_POLL):
+            if cancel.is_set():
+                raise RequestCancelled(f"打ち切り: {url}")
+    try:
+        limiter.wait_turn()
+        if cancel is not None and cancel.is_set():
+            raise RequestCancelled(f"打ち切り: {url}")
+        yield
+    finally:
+        limiter.slots.release()
+
+
+def request(method, url, timeout=HTTP_TIMEOUT, cancel=None, **kwargs):
+    """
+    ホストの枠を確保し、ホストごとの Session でリクエストする（本文は枠を持ったまま読み切る）
+
+    429 が返ったときは Retry-After の間そのホストへの新しいリクエストを止めてから応答を返す
+    （呼び出し側はそのまま再試行すればよい）。
+    cancel（threading.Event）が枠を取る前に立っていれば送らずに RequestCancelled を送出する
+    （送信後の応答待ちは打ち切れない）
+
+    Returns:
+        requests.Response（例外は requests.RequestException をそのまま送出）
+    """
+    host = _host(url)
+    with host_slot(url, cancel):
+        t0 = time.perf_counter()
+        try:
+            resp = _session(host).request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            _record(host, time.perf_counter() - t0, error=True)
+            raise
+        _record(host, time.perf_counter() - t0, error=resp.status_code >= 400)
+    if resp.status_code == 429:
+        wait = _retry_after(resp)
+        logger.info(f"429レート制限: {host} を{wait:.0f}秒停止")
+        _limiter(host).backoff(wait)
+    return resp
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def latency_stats(reset=False):
+    """
+    ホストごとのリクエスト数と所要時間
+
+    Returns:
+        dict[ホスト] -> {"requests", "errors", "mean_ms", "p50_ms", "p95_ms"}
+    """
+    with _state_lock:
+        snapshot = {host: (sorted(s.seconds), s.errors) for host, s in _stats.items()}
+        if reset:
+            _stats.clear()
+    result = {}
+    for host, (seconds, errors) in snapshot.items():
+        if not seconds:
+            continue
+        result[host] = {
+            "requests": len(seconds),
+            "errors": errors,
+            "mean_ms": round(sum(seconds) / len(seconds) * 1000, 1),
+            "p50_ms": round(seconds[len(seconds) // 2] * 1000, 1),
+            "p95_ms": round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] * 1000, 1),
+        }
+    return result
+
+
+def log_latency_stats(reset=True):
+    """ホストごとの所要時間をログに出す（ジョブの最後に呼ぶ）"""
+    for host, s in sorted(latency_stats(reset=reset).items()):
+        logger.info(
+            f"HTTP {host}: {s['requests']}件（エラー{s['errors']}件） "
+            f"平均 {s['mean_ms']}ms, 中央値 {s['p50_ms']}ms, p95 {s['p95_ms']}ms"
+        )
@@ -1,5 +1,8 @@
 """
 画像取得モジュール - Wikipedia記事画像 + Google Custom Search API + Wikimediaフォールバック
+
+候補画像のダウンロードは全ジョブ共有のスレッドプールで並列に行う。
+サイトごとのアクセス間隔は http_client のホスト別トークンバケットに任せ、ここでは待たない
 """
 import io
 import json
@@ -7,7 +10,7 @@ import os
 import re
 import logging
 import shutil
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from PIL import Image
@@ -22,12 +25,16 @@ from config import (
     IMAGE_QUERIES_SIGN,
     IMAGE_QUERIES_SCENERY,
     IMAGE_CACHE_DIR,
+    IMAGE_DOWNLOAD_WORKERS,
 )
+import http_client
+from wiki_client import get_page
+from image_index import known_empty
 
 logger = logging.getLogger("store-traffic")
 
-# リクエスト間隔（秒）
-REQUEST_DELAY = 2.0
+# 候補画像のダウンロード用（プロセス内の全ジョブ・全セッションで共有）
+_download_pool = ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS, thread_name_prefix="image-dl")
 
 # 共通ヘッダー（Wikimediaポリシー準拠）
 _HEADERS = {
@@ -152,12 +159,11 @@ def _download_image(url, save_path, retries=2):
     """画像をダウンロードして保存。サイズ検証・429リトライ付き。"""
     for attempt in range(retries + 1):
         try:
-            resp = requests.get(url, headers=_HEADERS, timeout=30, stream=True)
+            resp = http_client.get(url, headers=_HEADERS)
 
             if resp.status_code == 429:
-                wait = min(5 * (attempt + 1), 15)
-                logger.info(f"429レート制限。{wait}秒待機... (試行{attempt+1})")
-                time.sleep(wait)
+                # 待ち時間は http_client がホスト単位で入れる（同じホストへの他のリクエストも止まる）
+                logger.info(f"429レート制限 (試行{attempt+1})")
                 continue
 
             resp.raise_for_status()
@@ -176,7 +182,7 @@ def _download_image(url, save_path, retries=2):
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
             with open(save_path, "wb") as f:
                 f.write(image_data)
-            logger.info(f"画像保存: {save_path}")
+            logger.debug(f"画像保存: {save_path}")
             return True
         except requests.RequestException as e:
             logger.debug(f"画像ダウンロード失敗: {e}")
@@ -188,54 +194,69 @@ def _wikipedia_station_image(station_name, output_dir, safe_name):
     """
     Wikipedia日本語版の駅記事からメイン画像（infobox画像）を取得。
     駅記事のリード画像は駅舎外観写真であることが多い。
+    記事は wiki_client でまとめて取得済みならキャッシュから引く。
     """
-    params = {
-        "action": "query",
-        "format": "json",
-        "titles": f"{station_name}駅",
-        "prop": "pageimages",
-        "piprop": "original",
-    }
-    try:
-        resp = requests.get(
-            "https://ja.wikipedia.org/w/api.php",
-            params=params,
-            headers=_HEADERS,
-            timeout=30,
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except requests.RequestException as e:
-        logger.error(f"Wikipedia APIエラー: {e}")
-        return []
-
-    pages = data.get("query", {}).get("pages", {})
-    for page_id, page in pages.items():
-        if page_id == "-1":
-            continue
-        original = page.get("original", {})
-        image_url = original.get("source", "")
-        if not image_url:
-            continue
-
+    page = get_page(f"{station_name}駅")
+    image_url = page["image"] if page else None
+    if image_url:
         # SVG/GIFを除外
         lower_url = image_url.lower()
         if ".svg" in lower_url or ".gif" in lower_url:
             logger.debug(f"Wikipedia: SVG/GIFスキップ: {image_url}")
-            continue
-
-        ext = ".png" if ".png" in lower_url else ".jpg"
-        filename = f"{safe_name}_1{ext}"
-        save_path = os.path.join(output_dir, filename)
+        else:
+            ext = ".png" if ".png" in lower_url else ".jpg"
+            filename = f"{safe_name}_1{ext}"
+            save_path = os.path.join(output_dir, filename)
 
-        if _download_image(image_url, save_path):
-            logger.info(f"Wikipedia記事画像取得成功: {station_name}駅")
-            return [save_path]
+            if _download_image(image_url, save_path):
+                logger.info(f"Wikipedia記事画像取得成功: {station_name}駅")
+                return [save_path]
 
     logger.info(f"Wikipedia記事画像なし: {station_name}駅")
     return []
 
 
+def _download_candidates(candidates, output_dir, safe_name, max_images, start_idx=0):
+    """
+    候補画像を共有スレッドプールで並列にダウンロードし、候補の順に最大 max_images 枚保存する
+
+    足りない枚数ぶんだけ同時に取りに行き、失敗した分は次の候補で補う（必要以上にはダウンロードしない）
+
+    Args:
+        candidates: [(画像URL, 拡張子), ...]（優先順）
+        start_idx: 保存ファイルの連番の開始位置（既に保存済みの枚数）
+
+    Returns:
+        list[str]: 保存された画像パス（{safe_name}_{連番}{拡張子}）
+    """
+    saved_paths = []
+    pending = list(candidates)
+    while pending and len(saved_paths) < max_images:
+        n = max_images - len(saved_paths)
+        batch, pending = pending[:n], pending[n:]
+        # 完了順に関係なく候補順で番号を振るため、一時ファイルに落としてから改名する
+        futures = []
+        for j, (url, ext) in enumerate(batch):
+            tmp_path = os.path.join(output_dir, f".{safe_name}_{start_idx + len(saved_paths) + j + 1}{ext}.part")
+            futures.append((_download_pool.submit(_download_image, url, tmp_path), tmp_path, ext))
+        for future, tmp_path, ext in futures:
+            try:
+                ok = future.result()
+            except OSError as e:
+                logger.debug(f"画像保存失敗: {e}")
+                ok = False
+            if not ok:
+                # 書き込み途中で失敗した一時ファイルは残さない
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+            save_path = os.path.join(output_dir, f"{safe_name}_{start_idx + len(saved_paths) + 1}{ext}")
+            os.replace(tmp_path, save_path)
+            logger.info(f"画像保存: {save_path}")
+            saved_paths.append(save_path)
+    return saved_paths
+
+
 def _is_relevant_result(item, station_name):
     """検索結果が駅に関連しているか判定"""
     import re
@@ -269,12 +290,9 @@ def _google_search_once(query, station_name, output_dir, max_images):
         "num": 10,
     }
 
+    url = "https://www.googleapis.com/customsearch/v1"
     try:
-        resp = requests.get(
-            "https://www.googleapis.com/customsearch/v1",
-            params=params,
-            timeout=30,
-        )
+        resp = http_client.get(url, params=params)
         resp.raise_for_status()
         results = resp.json()
     except requests.RequestException as e:
@@ -285,13 +303,8 @@ def _google_search_once(query, station_name, output_dir, max_images):
     if not items:
         return []
 
-    saved_paths = []
-    safe_name = _sanitize_filename(station_name)
-
-    for i, item in enumerate(items):
-        if len(saved_paths) >= max_images:
-            break
-
+    candidates = []
+    for item in items:
         # 関連性チェック: 駅名がタイトル/スニペットに含まれない画像はスキップ
         if not _is_relevant_result(item, station_name):
             logger.debug(f"関連性低: {item.get('title', '')}")
@@ -319,16 +332,9 @@ def _google_search_once(query, station_name, output_dir, max_images):
         ext = ".jpg"
         if ".png" in image_url.lower():
             ext = ".png"
+        candidates.append((image_url, ext))
 
-        filename = f"{safe_name}_{len(saved_paths) + 1}{ext}"
-        save_path = os.path.join(output_dir, filename)
-
-        if _download_image(image_url, save_path):
-            saved_paths.append(save_path)
-
-        time.sleep(REQUEST_DELAY)
-
-    return saved_paths
+    return _download_candidates(candidates, output_dir, _sanitize_filename(station_name), max_images)
 
 
 def search_google_images(station_name, output_dir, max_images=IMAGES_PER_STATION):
@@ -375,8 +381,13 @@ def search_google_images(station_name, output_dir, max_images=IMAGES_PER_STATION
     return search_wikimedia_images(fb_name, output_dir, max_images)
 
 
-def _wikimedia_search(query, max_images, output_dir, safe_name, start_idx=0):
-    """Wikimedia Commons APIで1クエリ分の画像検索・保存"""
+def _wikimedia_candidates(query):
+    """
+    Wikimedia Commons APIで1クエリ分を検索し、使える画像（最小幅以上の JPEG/PNG）の情報を返す
+
+    Returns:
+        list[dict]: imageinfo（url, width, height, mime）のリスト。APIエラー時は None
+    """
     params = {
         "action": "query",
         "format": "json",
@@ -389,22 +400,15 @@ def _wikimedia_search(query, max_images, output_dir, safe_name, start_idx=0):
     }
 
     try:
-        resp = requests.get(WIKIMEDIA_API_URL, params=params, headers=_HEADERS, timeout=30)
+        resp = http_client.get(WIKIMEDIA_API_URL, params=params, headers=_HEADERS)
         resp.raise_for_status()
         data = resp.json()
     except requests.RequestException as e:
         logger.error(f"Wikimedia APIエラー: {e}")
-        return []
-
-    pages = data.get("query", {}).get("pages", {})
-    if not pages:
-        return []
-
-    saved_paths = []
-    for page_id, page in pages.items():
-        if len(saved_paths) >= max_images:
-            break
+        return None
 
+    candidates = []
+    for page_id, page in data.get("query", {}).get("pages", {}).items():
         imageinfo = page.get("imageinfo", [{}])
         if not imageinfo:
             continue
@@ -418,31 +422,61 @@ def _wikimedia_search(query, max_images, output_dir, safe_name, start_idx=0):
         if mime not in ("image/jpeg", "image/png"):
             continue
 
-        image_url = info.get("url", "")
-        if not image_url:
+        if not info.get("url", ""):
             continue
+        candidates.append(info)
+    return candidates
 
-        ext = ".jpg" if "jpeg" in mime else ".png"
-        filename = f"{safe_name}_{start_idx + len(saved_paths) + 1}{ext}"
-        save_path = os.path.join(output_dir, filename)
 
-        if _download_image(image_url, save_path):
-            saved_paths.append(save_path)
+def _wikimedia_search(query, max_images, output_dir, safe_name, start_idx=0):
+    """Wikimedia Commons APIで1クエリ分の画像検索・保存"""
+    candidates = [
+        (info["url"], ".jpg" if "jpeg" in info["mime"] else ".png")
+        for info in _wikimedia_candidates(query) or []
+    ]
+    return _download_candidates(candidates, output_dir, safe_name, max_images, start_idx)
 
-        time.sleep(REQUEST_DELAY)
 
-    return saved_paths
+def _wikimedia_queries(station_name):
+    """Wikimedia検索のクエリ（日本語名 → 「駅名 station」→ 駅名のみ の順）"""
+    return [f"{station_name}駅", f"{station_name} station", station_name]
+
+
+def probe_wikimedia(station_name):
+    """
+    画像をダウンロードせずに、Wikimedia Commons に使える画像があるかだけ調べる（画像可用性インデックス用）
+
+    Returns:
+        dict: {"query": 最初に候補のあったクエリ|None, "count": 候補数, "sizes": [[幅, 高さ], ...]}
+        APIエラーで判定できなければ None
+    """
+    for query in _wikimedia_queries(station_name):
+        candidates = _wikimedia_candidates(query)
+        if candidates is None:
+            return None
+        if candidates:
+            return {
+                "query": query,
+                "count": len(candidates),
+                "sizes": [[c.get("width", 0), c.get("height", 0)] for c in candidates[:IMAGES_PER_STATION]],
+            }
+    return {"query": None, "count": 0, "sizes": []}
 
 
 def search_wikimedia_images(station_name, output_dir, max_images=IMAGES_PER_STATION):
     """
     Wikimedia Commons APIで駅画像を検索・保存（フォールバック）
     日本語名 → 「駅名 station」の順でフォールバック検索
+    画像可用性インデックスで候補なしと分かっている駅は検索しない
     """
+    if known_empty(station_name, "commons"):
+        logger.info(f"Wikimedia画像なし（インデックス）: {station_name}")
+        return []
+
     safe_name = _sanitize_filename(station_name)
 
     # 1. 「駅名+駅」で検索
-    queries = [f"{station_name}駅", f"{station_name} station", station_name]
+    queries = _wikimedia_queries(station_name)
     saved_paths = []
 
     for query in queries:
@@ -478,11 +512,14 @@ def fetch_station_images(station_name, output_dir, max_images=IMAGES_PER_STATION
         if paths:
             return paths
 
-    # 2. Wikipedia記事のメイン画像
-    logger.info(f"Wikipedia記事画像を検索: {station_name}駅")
-    paths = _wikipedia_station_image(station_name, output_dir, safe_name)
-    if paths:
-        return paths
+    # 2. Wikipedia記事のメイン画像（画像可用性インデックスで候補なしと分かっていれば省く）
+    if known_empty(station_name, "wikipedia"):
+        logger.info(f"Wikipedia記事画像なし（インデックス）: {station_name}駅")
+    else:
+        logger.info(f"Wikipedia記事画像を検索: {station_name}駅")
+        paths = _wikipedia_station_image(station_name, output_dir, safe_name)
+        if paths:
+            return paths
 
     # 3. Wikimedia Commons
     return search_wikimedia_images(station_name, output_dir, max_images)
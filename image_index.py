@@ -0,0 +1,157 @@
+"""
+画像可用性インデックス - 全駅について、画像の取得元ごとに使える候補があるかを事前に調べて保存する
+
+Wikipedia記事のリード画像は pageimages で50駅ずつ、Wikimedia Commons はリード画像が使えない駅だけ
+検索件数を調べる（画像はダウンロードしない）。画像取得時は、候補なしと分かっている取得元を省く。
+調べた日時を駅ごとに持ち、IMAGE_INDEX_MAX_AGE_DAYS を過ぎた駅だけ次回の実行で調べ直す
+"""
+import json
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import http_client
+from config import MIN_IMAGE_WIDTH, IMAGE_INDEX_MAX_AGE_DAYS, IMAGE_INDEX_WORKERS
+from transport_api import CACHE_DIR, fetch_rail_graph, base_station_name
+from wiki_client import probe_lead_images
+
+logger = logging.getLogger("store-traffic")
+
+IMAGE_INDEX = os.path.join(CACHE_DIR, "image_index.json")
+# 途中経過を保存する間隔（駅数）。中断しても次回はその続きから調べる
+_SAVE_EVERY = 200
+
+# プロセス内で読み込み済みのインデックス（mtime / stations）。画像取得の各スレッドから読まれるので
+# 読み込みはロック内で行う
+_index_memo = {}
+_index_lock = threading.Lock()
+
+
+def _usable_lead(lead):
+    """リード画像が画像取得で使えるか（_wikipedia_station_image と同じ条件: SVG/GIF以外・最小幅以上）"""
+    if not lead:
+        return False
+    url = lead["url"].lower()
+    return ".svg" not in url and ".gif" not in url and lead["width"] >= MIN_IMAGE_WIDTH
+
+
+def load_image_index():
+    """
+    Returns:
+        dict[駅名] -> {"wikipedia": {"url", "width", "height", "usable"}|None,
+                       "commons": {"query", "count", "sizes"}|None（未調査）, "checked_at"}
+        インデックスがなければ空
+    """
+    try:
+        mtime = os.path.getmtime(IMAGE_INDEX)
+    except OSError:
+        return {}
+    with _index_lock:
+        if _index_memo.get("mtime") != mtime:
+            try:
+                with open(IMAGE_INDEX, "r", encoding="utf-8") as f:
+                    stations = json.load(f)["stations"]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"画像可用性インデックス読み込み失敗: {e}")
+                stations = {}
+            _index_memo.update(mtime=mtime, stations=stations)
+        return _index_memo["stations"]
+
+
+def known_empty(station_name, source):
+    """
+    調査済みで使える候補がないと分かっている取得元なら True（未調査・候補ありは False）
+
+    Args:
+        source: "wikipedia"（記事のリード画像）/ "commons"（Wikimedia Commons 検索）
+    """
+    entry = load_image_index().get(station_name)
+    if not entry:
+        return False
+    if source == "wikipedia":
+        return not (entry["wikipedia"] and entry["wikipedia"]["usable"])
+    commons = entry.get("commons")
+    return commons is not None and commons["count"] == 0
+
+
+def _save_index(stations):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = IMAGE_INDEX + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "stations": stations}, f, ensure_ascii=False)
+    os.replace(tmp, IMAGE_INDEX)
+
+
+def build_image_index(workers=IMAGE_INDEX_WORKERS):
+    """
+    グラフの全駅の画像可用性を調べてインデックスを更新する（未調査・古い駅のみ）
+
+    Returns:
+        dict: {"stations", "checked", "wikipedia", "commons", "empty", "seconds"}
+    """
+    from image_fetcher import probe_wikimedia
+
+    t0 = time.perf_counter()
+    station_to_railways, _railway_stations, _station_coords = fetch_rail_graph()
+    # 画像は元の駅名で探すので、同名駅は1回だけ調べる
+    names = sorted({base_station_name(n) for n in station_to_railways})
+    stations = dict(load_image_index())
+    cutoff = (datetime.now() - timedelta(days=IMAGE_INDEX_MAX_AGE_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    todo = [n for n in names if n not in stations or stations[n]["checked_at"] < cutoff]
+    logger.info(f"画像可用性インデックス: {len(names)}駅中 {len(todo)}駅を調査")
+
+    # 1. Wikipedia記事のリード画像（50駅ずつ）
+    leads = probe_lead_images([f"{n}駅" for n in todo])
+    checked = 0
+    need_commons = []
+    for name in todo:
+        title = f"{name}駅"
+        if title not in leads:
+            continue  # APIエラー。次回の実行で調べ直す
+        lead = leads[title]
+        if lead:
+            lead = {**lead, "usable": _usable_lead(lead)}
+        if lead and lead["usable"]:
+            stations[name] = {"wikipedia": lead, "commons": None, "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            checked += 1
+        else:
+            need_commons.append((name, lead))
+    _save_index(stations)
+    logger.info(f"リード画像あり {checked}駅 / なし {len(need_commons)}駅 → Commonsを調査")
+
+    # 2. リード画像が使えない駅だけ Commons の検索件数を調べる（ホストごとの制限内で並列）
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-index") as pool:
+        futures = {pool.submit(probe_wikimedia, name): (name, lead) for name, lead in need_commons}
+        for i, fut in enumerate(as_completed(futures)):
+            name, lead = futures[fut]
+            commons = fut.result()
+            if commons is not None:
+                stations[name] = {
+                    "wikipedia": lead, "commons": commons, "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                }
+                checked += 1
+            if (i + 1) % _SAVE_EVERY == 0:
+                _save_index(stations)
+                logger.info(f"Commons調査: {i + 1}/{len(need_commons)}駅")
+    _save_index(stations)
+
+    stats = {
+        "stations": len(names),
+        "checked": checked,
+        "wikipedia": sum(1 for e in stations.values() if e["wikipedia"] and e["wikipedia"]["usable"]),
+        "commons": sum(1 for e in stations.values() if e["commons"] and e["commons"]["count"]),
+        "empty": sum(
+            1 for e in stations.values()
+            if not (e["wikipedia"] and e["wikipedia"]["usable"]) and e["commons"] and not e["commons"]["count"]
+        ),
+        "seconds": round(time.perf_counter() - t0, 1),
+    }
+    logger.info(
+        f"画像可用性インデックス: {stats['checked']}駅を調査, リード画像 {stats['wikipedia']}駅, "
+        f"Commons {stats['commons']}駅, 候補なし {stats['empty']}駅, {stats['seconds']}秒"
+    )
+    http_client.log_latency_stats()
+    return stats
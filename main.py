@@ -17,13 +17,25 @@ def main():
 使用例:
   python main.py --mode station --base 表参道 --transfer 1
   python main.py --mode city --pref 東京都 --city 渋谷区
+  python main.py --mode city --pref 神奈川県
+  python main.py --mode city --cities cities.txt
+  python main.py --mode catchment --lat 35.6654 --lon 139.7122
+  python main.py --mode catchment --points candidates.csv
+  python main.py --mode graph --source archive
+  python main.py --mode graph --travel-table
+  python main.py --mode graph --source extract --extract japan-latest.osm.pbf
+  python main.py --mode graph --gtfs tokyometro.zip toei.zip
+  python main.py --mode graph --boundaries N03-20240101.geojson
+  python main.py --mode graph --wiki-dump jawiki-latest-pages-articles.xml.bz2
+  python main.py --mode graph --image-index
+  python main.py --mode refresh --dry-run
         """,
     )
     parser.add_argument(
         "--mode",
         required=True,
-        choices=["station", "city"],
-        help="実行モード: station（駅別）/ city（市区別）",
+        choices=["station", "city", "catchment", "graph", "refresh"],
+        help="実行モード: station（駅別）/ city（市区別）/ catchment（商圏）/ graph（鉄道グラフ再構築）/ refresh（保存済み結果の差分再計算）",
     )
     parser.add_argument(
         "--base",
@@ -43,6 +55,78 @@ def main():
         "--city",
         help="市区町村名（cityモード用）",
     )
+    parser.add_argument(
+        "--cities",
+        help="市区リストファイル（1行1市区「都道府県,市区」または「市区」）。まとめて処理して一覧NDJSONを出力（cityモード用）",
+    )
+    parser.add_argument(
+        "--rank",
+        default="lines",
+        choices=["lines", "hub", "betweenness", "transfer"],
+        help="上位駅の並び順（cityモード用）: lines（路線数）/ hub（路線数+媒介中心性）/ betweenness / transfer",
+    )
+    parser.add_argument(
+        "--lat",
+        type=float,
+        help="店舗の緯度（catchmentモード用）",
+    )
+    parser.add_argument(
+        "--lon",
+        type=float,
+        help="店舗の経度（catchmentモード用）",
+    )
+    parser.add_argument(
+        "--points",
+        help="候補地CSV（列: id, lat, lon）。一括評価してNDJSONを出力（catchmentモード用）",
+    )
+    parser.add_argument(
+        "--source",
+        default="overpass",
+        choices=["overpass", "archive", "extract"],
+        help="グラフの取得元（graphモード用）: overpass（再取得）/ archive（保存済み生レスポンスから再構築）/ extract（ローカルのOSM抽出ファイル）",
+    )
+    parser.add_argument(
+        "--extract",
+        help="OSM抽出ファイルのパス .osm.pbf / .osm.xml(.bz2/.gz)（--source extract 用。省略時は OSM_EXTRACT_PATH）",
+    )
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="保存済み生レスポンスでプロセス数ごとの構築時間を計測（graphモード用）",
+    )
+    parser.add_argument(
+        "--gtfs",
+        nargs="+",
+        help="事業者のGTFS(zip)から駅間の実測所要時間を現在のグラフに取り込む（graphモード用）",
+    )
+    parser.add_argument(
+        "--boundaries",
+        nargs="+",
+        help="行政区域GeoJSONから全駅の市区町村を割り当てる（graphモード用。市区別モードがネットワークなしで引ける）",
+    )
+    parser.add_argument(
+        "--wiki-dump",
+        help="Wikipediaダンプ（jawiki pages-articles .xml.bz2）から全国の駅の乗降客数表を作成（graphモード用）",
+    )
+    parser.add_argument(
+        "--image-index",
+        action="store_true",
+        help="全駅の画像の有無を取得元ごとに事前に調べる（graphモード用。画像取得時に候補のない取得元を省く）",
+    )
+    parser.add_argument(
+        "--travel-table",
+        action="store_true",
+        help="現在のグラフから全駅発の移動時間表を作成（graphモード用）",
+    )
+    parser.add_argument(
+        "--from-hash",
+        help="この版のグラフで作られた結果だけを対象にする（refreshモード用）",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="判定結果の表示のみ（refreshモード用）",
+    )
 
     args = parser.parse_args()
     logger = setup_logging()
@@ -69,12 +153,25 @@ def main():
             sys.exit(1)
 
     elif args.mode == "city":
+        if args.cities or (args.pref and not args.city):
+            # 都道府県内の全市区町村 / 市区リストファイルをまとめて処理
+            from city_mode import run_city_batch
+
+            summary = run_city_batch(args.pref, args.cities, rank_by=args.rank)
+            if not summary:
+                print("\n対象の市区がありません")
+                sys.exit(1)
+            print(f"\n完了: {summary['found']}/{summary['cities']}市区（失敗 {summary['errors']}市区）")
+            print(f"上位駅: のべ{summary['stations']}駅（取得 {summary['fetched']}駅）")
+            print(f"一覧: {summary['index_path']}")
+            return
+
         if not args.pref or not args.city:
-            parser.error("cityモードには --pref と --city が必要です")
+            parser.error("cityモードには --pref と --city（または --pref のみ / --cities）が必要です")
 
         from city_mode import run_city_mode
 
-        result = run_city_mode(args.pref, args.city)
+        result = run_city_mode(args.pref, args.city, rank_by=args.rank)
         if result:
             print(f"\n完了: {result['total_stations']}駅の情報を取得しました")
             print(f"対象: {result['prefecture']} {result['city']}")
@@ -82,6 +179,96 @@ def main():
             print("\n駅情報の取得に失敗しました")
             sys.exit(1)
 
+    elif args.mode == "catchment":
+        if args.points:
+            from catchment_mode import run_catchment_batch
+
+            out_path = run_catchment_batch(args.points)
+            print(f"\n完了: {out_path}")
+        else:
+            if args.lat is None or args.lon is None:
+                parser.error("catchmentモードには --lat と --lon（または --points）が必要です")
+
+            from catchment_mode import run_catchment_mode
+
+            result = run_catchment_mode(args.lat, args.lon)
+            if result:
+                print(f"\n完了: {result['total_stations']}駅の商圏を取得しました")
+                print(f"最寄り駅: {', '.join(a['name'] for a in result['access_stations'])}")
+            else:
+                print("\n商圏の取得に失敗しました")
+                sys.exit(1)
+
+    elif args.mode == "graph":
+        from transport_api import fetch_rail_graph, rebuild_rail_graph_from_archive
+
+        if args.bench:
+            from transport_api import benchmark_graph_build, load_overpass_archive
+
+            data, _meta = load_overpass_archive()
+            for r in benchmark_graph_build(data):
+                mark = "" if r["identical"] else "  ※出力不一致"
+                print(f"{r['workers']:>3}プロセス: {r['seconds']:.2f}秒{mark}")
+            return
+
+        # 現在のグラフへの後処理（指定したものを順に実行し、グラフ自体は作り直さない）
+        if args.gtfs or args.boundaries or args.wiki_dump or args.image_index or args.travel_table:
+            if args.gtfs:
+                from transport_api import apply_gtfs_feeds
+
+                stats = apply_gtfs_feeds(args.gtfs)
+                print(
+                    f"\nGTFS: 停留所 {stats['matched_stops']}/{stats['stops']}件を駅に対応づけ, "
+                    f"{stats['edges']}区間（隣接区間の{stats['coverage']:.0%}）"
+                )
+            if args.boundaries:
+                from transport_api import apply_municipal_boundaries
+
+                stats = apply_municipal_boundaries(args.boundaries)
+                print(f"\n行政区域: {stats['assigned']}/{stats['stations']}駅を{stats['municipalities']}市区町村に割り当て")
+            if args.wiki_dump:
+                from transport_api import build_passenger_table
+
+                stats = build_passenger_table(args.wiki_dump)
+                print(f"\n乗降客数表: 記事 {stats['articles']}件 → {stats['stations']}駅, {stats['seconds']}秒")
+            if args.image_index:
+                from image_index import build_image_index
+
+                stats = build_image_index()
+                print(
+                    f"\n画像可用性: {stats['checked']}駅を調査, リード画像 {stats['wikipedia']}駅, "
+                    f"Commons {stats['commons']}駅, 候補なし {stats['empty']}駅"
+                )
+            if args.travel_table:
+                from transport_api import build_travel_table
+
+                stats = build_travel_table()
+                print(
+                    f"\n移動時間表: {stats['stations']}駅, {stats['rows']}行, "
+                    f"{stats['bytes'] / 1e6:.1f}MB, {stats['seconds']:.1f}秒"
+                )
+            return
+
+        if args.source == "archive":
+            station_to_railways, railway_stations, _ = rebuild_rail_graph_from_archive()
+        elif args.source == "extract":
+            from transport_api import build_rail_graph_from_extract
+
+            station_to_railways, railway_stations, _ = build_rail_graph_from_extract(args.extract)
+        else:
+            station_to_railways, railway_stations, _ = fetch_rail_graph(use_cache=False)
+        print(f"\n完了: {len(station_to_railways)}駅, {len(railway_stations)}路線")
+
+    elif args.mode == "refresh":
+        from refresh_mode import run_refresh_mode
+
+        summary = run_refresh_mode(from_hash=args.from_hash, dry_run=args.dry_run)
+        print(f"\n確認: {summary['checked']}件")
+        for label, key in (("版の付け替え", "restamped"), ("再計算", "recomputed"), ("ライブラリ要更新", "stale")):
+            print(f"{label}: {len(summary[key])}件")
+            for p in summary[key]:
+                print(f"  {p}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,167 @@
+"""
+OSM抽出ファイルの読み込み - ローカルの .osm.pbf / .osm.xml(.bz2/.gz) を逐次解析し、
+鉄道グラフ構築に必要な要素だけを Overpass 応答と同じ形式で返す
+
+残すのは route relation（train/subway など）と、railway=station/halt/stop かつ name 付きのノードのみ。
+relation の直接のメンバーに加え、メンバーの way を構成する駅ノードも残す（Overpass の lean / full 応答と同じ駅の集合）。
+way は駅ノードを含むものだけ、駅ノードIDの列として持つ（ファイル内の順序は node → way → relation）。
+全国の抽出ファイルでも保持するのは駅ノードと路線relationだけなので、メモリ使用量は駅数で頭打ちになる
+.osm.pbf の読み込みには pyosmium（pip install osmium）が必要
+"""
+import bz2
+import gzip
+import os
+import time
+import logging
+import xml.etree.ElementTree as ET
+
+from transport_api import _ROUTE_TYPES, _NAME_ALIAS_TAGS
+
+logger = logging.getLogger("store-traffic")
+
+_STATION_RAILWAY = ("station", "halt", "stop")
+# グラフ構築で参照するタグだけ残す
+_NODE_TAGS = ("name", "railway") + _NAME_ALIAS_TAGS
+_RELATION_TAGS = ("type", "route", "name", "ref", "operator")
+_MEMBER_TYPES = {"n": "node", "w": "way", "r": "relation"}
+
+
+def _keep_node(tags):
+    return tags.get("name") and tags.get("railway") in _STATION_RAILWAY
+
+
+def _keep_relation(tags):
+    return tags.get("type") == "route" and tags.get("route") in _ROUTE_TYPES
+
+
+def _pick(tags, keys):
+    return {k: tags[k] for k in keys if k in tags}
+
+
+def _open_xml(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _read_xml(path, nodes, way_stations, relations):
+    """.osm.xml を iterparse で1要素ずつ処理し、処理済みの要素はすぐに破棄する"""
+    station_ids = set()
+    with _open_xml(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == "node":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                if _keep_node(tags):
+                    nodes.append({
+                        "type": "node",
+                        "id": int(elem.get("id")),
+                        "lat": float(elem.get("lat")),
+                        "lon": float(elem.get("lon")),
+                        "tags": _pick(tags, _NODE_TAGS),
+                    })
+                    station_ids.add(nodes[-1]["id"])
+            elif elem.tag == "way":
+                refs = [ref for ref in (int(nd.get("ref")) for nd in elem.iter("nd")) if ref in station_ids]
+                if refs:
+                    way_stations[int(elem.get("id"))] = refs
+            elif elem.tag == "relation":
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                if _keep_relation(tags):
+                    relations.append({
+                        "type": "relation",
+                        "id": int(elem.get("id")),
+                        "members": [
+                            {"type": m.get("type"), "ref": int(m.get("ref")), "role": m.get("role", "")}
+                            for m in elem.iter("member")
+                        ],
+                        "tags": _pick(tags, _RELATION_TAGS),
+                    })
+            # 処理済みの要素をルートから外してメモリを解放
+            root.clear()
+
+
+def _read_pbf(path, nodes, way_stations, relations):
+    """.osm.pbf を pyosmium で読み込む（wayは構成ノードIDだけ見る。ノード座標の解決はしない）"""
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError(".osm.pbf の読み込みには pyosmium が必要です（pip install osmium）")
+
+    station_ids = set()
+
+    class _Handler(osmium.SimpleHandler):
+        def node(self, n):
+            tags = {t.k: t.v for t in n.tags}
+            if _keep_node(tags) and n.location.valid():
+                nodes.append({
+                    "type": "node",
+                    "id": n.id,
+                    "lat": n.location.lat,
+                    "lon": n.location.lon,
+                    "tags": _pick(tags, _NODE_TAGS),
+                })
+                station_ids.add(n.id)
+
+        def way(self, w):
+            refs = [nd.ref for nd in w.nodes if nd.ref in station_ids]
+            if refs:
+                way_stations[w.id] = refs
+
+        def relation(self, r):
+            tags = {t.k: t.v for t in r.tags}
+            if _keep_relation(tags):
+                relations.append({
+                    "type": "relation",
+                    "id": r.id,
+                    "members": [
+                        {"type": _MEMBER_TYPES.get(m.type, m.type), "ref": m.ref, "role": m.role}
+                        for m in r.members
+                    ],
+                    "tags": _pick(tags, _RELATION_TAGS),
+                })
+
+    _Handler().apply_file(path)
+
+
+def load_osm_extract(path):
+    """
+    OSM抽出ファイルから鉄道グラフ用の要素を取り出す
+
+    Args:
+        path: .osm.pbf / .osm / .osm.xml（.bz2 / .gz 圧縮可）
+
+    Returns:
+        dict: {"elements": [...]}（Overpass の lean 応答と同じ形式）
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"OSM抽出ファイルがありません: {path}")
+
+    logger.info(f"OSM抽出ファイルを読み込み中: {path}（{os.path.getsize(path) / 1e6:.0f}MB）")
+    t0 = time.perf_counter()
+    nodes, way_stations, relations = [], {}, []
+    if path.endswith(".pbf"):
+        _read_pbf(path, nodes, way_stations, relations)
+    else:
+        _read_xml(path, nodes, way_stations, relations)
+
+    # 路線relationのメンバーの駅ノードと、メンバーの way を構成する駅ノードだけ残す
+    member_ids = set()
+    for r in relations:
+        for m in r["members"]:
+            if m["type"] == "node":
+                member_ids.add(m["ref"])
+            elif m["type"] == "way":
+                member_ids.update(way_stations.get(m["ref"], ()))
+    nodes = [n for n in nodes if n["id"] in member_ids]
+
+    logger.info(
+        f"OSM抽出ファイル解析: 路線relation {len(relations)}件, 駅ノード {len(nodes)}件, "
+        f"{time.perf_counter() - t0:.1f}秒"
+    )
+    return {"elements": relations + nodes}
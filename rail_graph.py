@@ -0,0 +1,293 @@
+"""
+鉄道グラフのメモリ表現 - 駅・路線を int32 ID で持ち、駅↔路線の対応を CSR 配列で保持する
+dict ベースの既存呼び出し元向けに Mapping 互換ビューも提供する
+
+キャッシュ上はCSR配列をそのままバイナリで保存し、読み込み時は mmap して必要な区間だけ参照する
+（路線ごとの駅リストは最初にアクセスされたときに復元してメモ化）
+"""
+import hashlib
+import json
+import math
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+_NAN = float("nan")
+
+# バイナリ形式: マジック + 6区間の要素数（int64）→ 各区間を8バイト境界に揃えて連結（リトルエンディアン）
+_BIN_MAGIC = b"RGRAPH1\0"
+_BIN_HEADER = struct.Struct("<8s6q")
+_BIN_TYPECODES = "iiiidd"  # st_rw_offsets, st_rw_ids, rw_st_offsets, rw_st_ids, lat, lon
+
+
+def _csr(rows):
+    """ID列のリストを (offsets, ids) の CSR 配列に変換"""
+    offsets = array("i", [0])
+    ids = array("i")
+    for row in rows:
+        ids.extend(row)
+        offsets.append(len(ids))
+    return offsets, ids
+
+
+class RailGraph:
+    """
+    駅↔路線の2部グラフ（CSR形式）
+
+    station_names[sid] / railway_names[rid]: ID → 名前
+    st_rw_offsets / st_rw_ids: 駅ID → 乗り入れ路線ID列
+    rw_st_offsets / rw_st_ids: 路線ID → 駅ID列（路線上の順序どおり）
+    lat / lon: 駅IDごとの座標（不明なら NaN）
+    """
+
+    def __init__(self, station_names, railway_names, st_rw_offsets, st_rw_ids,
+                 rw_st_offsets, rw_st_ids, lat, lon):
+        self.station_names = station_names
+        self.railway_names = railway_names
+        self.st_rw_offsets = st_rw_offsets
+        self.st_rw_ids = st_rw_ids
+        self.rw_st_offsets = rw_st_offsets
+        self.rw_st_ids = rw_st_ids
+        self.lat = lat
+        self.lon = lon
+        self.station_ids = {name: i for i, name in enumerate(station_names)}
+        self.railway_ids = {name: i for i, name in enumerate(railway_names)}
+        self._views = None
+        self._mmap = None
+
+    @classmethod
+    def from_dicts(cls, station_to_railways, railway_stations, station_coords):
+        """従来の dict 表現（構築直後・JSONキャッシュ）から変換する"""
+        # 駅IDは「路線に属する駅（元の順序）」→「座標だけある駅」の順に振る
+        station_names = list(station_to_railways)
+        station_names.extend(n for n in station_coords if n not in station_to_railways)
+        station_ids = {name: i for i, name in enumerate(station_names)}
+
+        railway_names = list(railway_stations)
+        railway_ids = {name: i for i, name in enumerate(railway_names)}
+
+        # 乗り入れ路線は set で渡されるので、ID順に並べてハッシュシードによらず同じ配列にする
+        st_rw_offsets, st_rw_ids = _csr(
+            sorted(railway_ids[rw] for rw in station_to_railways.get(name, ()) if rw in railway_ids)
+            for name in station_names
+        )
+        rw_st_offsets, rw_st_ids = _csr(
+            [station_ids[s] for s in railway_stations[rw]] for rw in railway_names
+        )
+
+        lat = array("d", [_NAN]) * len(station_names)
+        lon = array("d", [_NAN]) * len(station_names)
+        for name, c in station_coords.items():
+            sid = station_ids[name]
+            lat[sid] = c["lat"]
+            lon[sid] = c["lon"]
+
+        return cls(station_names, railway_names, st_rw_offsets, st_rw_ids,
+                   rw_st_offsets, rw_st_ids, lat, lon)
+
+    def _sections(self):
+        return (self.st_rw_offsets, self.st_rw_ids, self.rw_st_offsets, self.rw_st_ids, self.lat, self.lon)
+
+    def write_binary(self, path):
+        """CSR配列・座標列をバイナリ形式で書き出す（名前テーブルは呼び出し側でJSONに保存）"""
+        sections = self._sections()
+        with open(path, "wb") as f:
+            f.write(_BIN_HEADER.pack(_BIN_MAGIC, *(len(a) for a in sections)))
+            for a, code in zip(sections, _BIN_TYPECODES):
+                data = array(code, a)
+                if sys.byteorder != "little":
+                    data.byteswap()
+                raw = data.tobytes()
+                f.write(raw)
+                f.write(b"\0" * (-len(raw) % 8))
+
+    @classmethod
+    def open_binary(cls, path, station_names, railway_names):
+        """
+        write_binary() で保存したファイルを mmap で開く。
+        配列はファイル上の区間を指す memoryview のまま使い、全体を読み込まない。
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, *lengths = _BIN_HEADER.unpack_from(mm, 0)
+        # 各区間は8バイト境界まで埋めてあるので、要素数からファイルの長さが決まる
+        expected = _BIN_HEADER.size + sum(
+            -(-n * array(code).itemsize // 8) * 8 for n, code in zip(lengths, _BIN_TYPECODES)
+        )
+        if magic != _BIN_MAGIC or expected != len(mm):
+            mm.close()
+            raise ValueError(f"鉄道グラフのバイナリ形式が不正です（書き込み途中の可能性）: {path}")
+
+        buf = memoryview(mm)
+        pos = _BIN_HEADER.size
+        sections = []
+        for n, code in zip(lengths, _BIN_TYPECODES):
+            size = n * array(code).itemsize
+            if sys.byteorder == "little":
+                sections.append(buf[pos:pos + size].cast(code))
+            else:
+                data = array(code, bytes(buf[pos:pos + size]))
+                data.byteswap()
+                sections.append(data)
+            pos += size + (-size % 8)
+
+        if len(station_names) + 1 != lengths[0] or len(railway_names) + 1 != lengths[2]:
+            raise ValueError(f"鉄道グラフの名前テーブルとバイナリが一致しません: {path}")
+
+        graph = cls(station_names, railway_names, *sections)
+        graph._mmap = mm
+        return graph
+
+    def content_hash(self):
+        """グラフ内容（名前テーブル+CSR配列+座標）のSHA-256（先頭16桁）"""
+        h = hashlib.sha256()
+        h.update(json.dumps([self.station_names, self.railway_names], ensure_ascii=False).encode("utf-8"))
+        for a, code in zip(self._sections(), _BIN_TYPECODES):
+            h.update(array(code, a).tobytes())
+        return h.hexdigest()[:16]
+
+    def station_digests(self):
+        """
+        駅ごとの内容ダイジェスト（版間の差分検出用）
+        駅の座標と、乗り入れ各路線の内容（駅順・座標）から作るので、
+        駅自身か乗り入れ路線のどこかが変われば値が変わる
+
+        Returns:
+            dict[駅名] -> str（12桁）
+        """
+        def _coord(sid):
+            return None if math.isnan(self.lat[sid]) else [round(self.lat[sid], 7), round(self.lon[sid], 7)]
+
+        railway_digests = []
+        for rid in range(len(self.railway_names)):
+            payload = [[self.station_names[s], _coord(s)] for s in self.stations_of(rid)]
+            railway_digests.append(
+                hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+            )
+
+        digests = {}
+        for sid, name in enumerate(self.station_names):
+            rws = sorted([self.railway_names[r], railway_digests[r]] for r in self.railways_of(sid))
+            payload = json.dumps([_coord(sid), rws], ensure_ascii=False).encode("utf-8")
+            digests[name] = hashlib.sha1(payload).hexdigest()[:12]
+        return digests
+
+    # --- ID ベースのアクセス（探索の内側ループ用） ---
+
+    def railways_of(self, sid):
+        return self.st_rw_ids[self.st_rw_offsets[sid]:self.st_rw_offsets[sid + 1]]
+
+    def stations_of(self, rid):
+        return self.rw_st_ids[self.rw_st_offsets[rid]:self.rw_st_offsets[rid + 1]]
+
+    def has_coord(self, sid):
+        return not math.isnan(self.lat[sid])
+
+    def nbytes(self):
+        """CSR配列・座標列のバイト数（名前テーブルとID辞書は含まない。mmap時はファイル上）"""
+        return sum(a.itemsize * len(a) for a in self._sections())
+
+    # --- 互換ビュー ---
+
+    def views(self):
+        """(station_to_railways, railway_stations, station_coords) の Mapping 互換ビュー"""
+        if self._views is None:
+            self._views = (
+                StationRailwaysView(self),
+                RailwayStationsView(self),
+                StationCoordsView(self),
+            )
+        return self._views
+
+
+class StationRailwaysView(Mapping):
+    """駅名 → 路線名の frozenset（路線に属する駅のみ）"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._len = None
+
+    def __getitem__(self, name):
+        g = self.graph
+        rids = g.railways_of(g.station_ids[name])
+        if not rids:
+            raise KeyError(name)
+        return frozenset(g.railway_names[r] for r in rids)
+
+    def __contains__(self, name):
+        sid = self.graph.station_ids.get(name)
+        if sid is None:
+            return False
+        offsets = self.graph.st_rw_offsets
+        return offsets[sid + 1] > offsets[sid]
+
+    def __iter__(self):
+        offsets = self.graph.st_rw_offsets
+        for sid, name in enumerate(self.graph.station_names):
+            if offsets[sid + 1] > offsets[sid]:
+                yield name
+
+    def __len__(self):
+        if self._len is None:
+            offsets = self.graph.st_rw_offsets
+            self._len = sum(1 for i in range(len(self.graph.station_names)) if offsets[i + 1] > offsets[i])
+        return self._len
+
+
+class RailwayStationsView(Mapping):
+    """路線名 → 駅名リスト（路線上の順序）。一度復元したリストは使い回す（変更しないこと）"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._decoded = {}
+
+    def __getitem__(self, rw):
+        stations = self._decoded.get(rw)
+        if stations is None:
+            g = self.graph
+            names = g.station_names
+            stations = [names[s] for s in g.stations_of(g.railway_ids[rw])]
+            self._decoded[rw] = stations
+        return stations
+
+    def __contains__(self, rw):
+        return rw in self.graph.railway_ids
+
+    def __iter__(self):
+        return iter(self.graph.railway_names)
+
+    def __len__(self):
+        return len(self.graph.railway_names)
+
+
+class StationCoordsView(Mapping):
+    """駅名 → {"lat": float, "lon": float}（座標のある駅のみ）"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._len = None
+
+    def __getitem__(self, name):
+        g = self.graph
+        sid = g.station_ids[name]
+        lat = g.lat[sid]
+        if math.isnan(lat):
+            raise KeyError(name)
+        return {"lat": lat, "lon": g.lon[sid]}
+
+    def __contains__(self, name):
+        sid = self.graph.station_ids.get(name)
+        return sid is not None and self.graph.has_coord(sid)
+
+    def __iter__(self):
+        g = self.graph
+        for sid, name in enumerate(g.station_names):
+            if g.has_coord(sid):
+                yield name
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for v in self.graph.lat if not math.isnan(v))
+        return self._len
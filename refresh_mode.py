@@ -0,0 +1,154 @@
+"""
+再計算モード - グラフ更新後、保存済み結果のうち入力が変わったものだけを再計算する
+結果に記録された graph_hash の版と現在の版の駅ダイジェストを比べて判定する
+駅別の結果は移動時間の版（travel_version。GTFS区間時間の取り込みで変わる）も比べる
+"""
+import glob
+import json
+import os
+import logging
+
+from config import STATION_OUTPUT_DIR, CITY_OUTPUT_DIR
+from transport_api import fetch_rail_graph, get_graph_version, load_graph_version_digests
+
+logger = logging.getLogger("store-traffic")
+
+# グラフ全体に依存する並び順（1駅でも変われば順位が変わりうる）
+_GLOBAL_RANKINGS = ("hub", "betweenness")
+
+
+def _input_stations(data, mode, station_to_railways, railway_stations):
+    """結果の入力に関わる駅の集合"""
+    names = {s.get("name", "").rstrip("駅") for s in data.get("stations", [])}
+    if mode == "city":
+        names.update(data.get("input_stations") or [])
+        return names
+
+    base = data.get("matched_station") or data.get("base_station")
+    if base:
+        names.add(base)
+    # 探索が経由しうる駅: 結果駅に乗り入れる路線上の全駅
+    railways = {rw for n in names for rw in station_to_railways.get(n, ())}
+    for rw in railways:
+        names.update(railway_stations[rw])
+    return names
+
+
+def _saved_travel_version(data):
+    """保存済み結果の移動時間の版（記録のない結果はGTFSなしで作られたものとみなす）"""
+    return data.get("travel_version") or data.get("graph_hash")
+
+
+def _is_up_to_date(data, mode, new_hash, new_travel_version):
+    if data.get("graph_hash") != new_hash:
+        return False
+    return mode != "station" or _saved_travel_version(data) == new_travel_version
+
+
+def _is_affected(data, mode, new_hash, new_digests, new_travel_version, station_to_railways, railway_stations):
+    """保存済み結果が現在のグラフで変わりうるか"""
+    old_hash = data.get("graph_hash")
+    if mode == "station":
+        old_travel = _saved_travel_version(data)
+        if old_travel != new_travel_version and (old_travel != old_hash or new_travel_version != new_hash):
+            # GTFS区間時間が変わった（駅ダイジェストには表れないので、駅別は再計算）
+            return True
+    if old_hash == new_hash:
+        return False
+    old_digests = load_graph_version_digests(old_hash)
+    if old_digests is None:
+        # 版不明（旧結果・版情報なし）は再計算対象
+        return True
+    if mode == "city" and data.get("rank_by") in _GLOBAL_RANKINGS:
+        return True
+    return any(
+        old_digests.get(n) != new_digests.get(n)
+        for n in _input_stations(data, mode, station_to_railways, railway_stations)
+    )
+
+
+def _iter_saved(mode):
+    """(パス, データ, 種別) を返す。種別は "result" / "library" """
+    base_dir = STATION_OUTPUT_DIR if mode == "station" else CITY_OUTPUT_DIR
+    paths = [(p, "result") for p in sorted(glob.glob(os.path.join(base_dir, "*.json")))]
+    paths += [(p, "library") for p in sorted(glob.glob(os.path.join(base_dir, "library", "*", "data.json")))]
+    for path, kind in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                yield path, json.load(f), kind
+        except (json.JSONDecodeError, IOError):
+            logger.warning(f"読み込み失敗のためスキップ: {path}")
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def run_refresh_mode(from_hash=None, dry_run=False):
+    """
+    保存済みの駅別/市区別結果とライブラリを現在のグラフ版に追従させる
+
+    - 入力駅のダイジェストが変わっていない結果: graph_hash を付け替えるだけ
+    - 変わった結果（駅別/市区別JSON）: 同じ条件で再計算
+    - 変わったライブラリ: 画像を取り直さないよう "graph_stale" を付けるだけ
+
+    Args:
+        from_hash: 指定した版で作られた結果だけを対象にする
+        dry_run: 判定だけ行い、ファイルは変更しない
+
+    Returns:
+        dict: {"checked": int, "restamped": [...], "recomputed": [...], "stale": [...]}
+    """
+    logger.info(f"=== 再計算モード開始 ===")
+    station_to_railways, railway_stations, _ = fetch_rail_graph()
+    version = get_graph_version()
+    new_hash, new_travel_version = version["graph_hash"], version["travel_version"]
+    new_digests = load_graph_version_digests(new_hash) or {}
+    logger.info(f"現在のグラフ版: {new_hash}")
+
+    summary = {"checked": 0, "restamped": [], "recomputed": [], "stale": []}
+    for mode in ("station", "city"):
+        for path, data, kind in list(_iter_saved(mode)):
+            if from_hash and data.get("graph_hash") != from_hash:
+                continue
+            if _is_up_to_date(data, mode, new_hash, new_travel_version):
+                continue
+            summary["checked"] += 1
+
+            if not _is_affected(
+                data, mode, new_hash, new_digests, new_travel_version, station_to_railways, railway_stations
+            ):
+                summary["restamped"].append(path)
+                if not dry_run:
+                    data["graph_hash"] = new_hash
+                    if mode == "station":
+                        data["travel_version"] = new_travel_version
+                    _write_json(path, data)
+                continue
+
+            if kind == "library":
+                summary["stale"].append(path)
+                if not dry_run:
+                    data["graph_stale"] = True
+                    _write_json(path, data)
+                continue
+
+            summary["recomputed"].append(path)
+            if dry_run:
+                continue
+            logger.info(f"再計算: {path}")
+            if mode == "station":
+                from station_mode import run_station_mode
+
+                run_station_mode(data["base_station"], data.get("max_transfer", 0), use_cache=False)
+            else:
+                from city_mode import run_city_mode
+
+                run_city_mode(data["prefecture"], data["city"], rank_by=data.get("rank_by", "lines"))
+
+    logger.info(
+        f"=== 再計算モード完了: 確認{summary['checked']}件, 付け替え{len(summary['restamped'])}件, "
+        f"再計算{len(summary['recomputed'])}件, ライブラリ要更新{len(summary['stale'])}件 ==="
+    )
+    return summary
@@ -7,8 +7,16 @@ import os
 import re
 import logging
 
-from transport_api import get_reachable_stations
-from config import STATION_OUTPUT_DIR
+from transport_api import (
+    iter_reachable_stations,
+    get_graph_version,
+    lookup_travel_times,
+    get_edge_minutes,
+    get_travel_graph,
+    find_travel_times,
+    get_passenger_table,
+)
+from config import STATION_OUTPUT_DIR, MAX_TRANSFER_LEVEL
 
 logger = logging.getLogger("store-traffic")
 
@@ -87,79 +95,196 @@ def _estimate_travel_time(base, target, railway_stations, station_to_railways, s
     return best
 
 
-def run_station_mode(base_station, max_transfer):
+def _load_saved_result(json_path, graph_hash, travel_version):
+    """同じグラフ版・移動時間の版で保存済みの結果（駅ごとの乗り換え回数つき）があれば返す"""
+    if not os.path.exists(json_path):
+        return None
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+    if saved.get("graph_hash") != graph_hash:
+        return None
+    # GTFS区間時間を取り込むと、グラフの版は同じでも移動時間が変わる
+    if saved.get("travel_version", saved.get("graph_hash")) != travel_version:
+        return None
+    if any("transfers" not in s for s in saved.get("stations", [])):
+        return None
+    return saved
+
+
+def filter_result_by_transfer(result, max_transfer):
+    """
+    駅ごとの乗り換え回数つきの結果を、乗り換え max_transfer 回以内の結果に絞る
+
+    Returns:
+        dict: 同じ形式の結果（max_transfer・駅数は絞り込んだ回数のもの）
+    """
+    railways_data = []
+    for rw in result.get("railways", []):
+        stations = [s for s in rw["stations"] if s["transfers"] <= max_transfer]
+        if stations:
+            railways_data.append({**rw, "stations": stations})
+    return {
+        **result,
+        "max_transfer": max_transfer,
+        "total_stations": sum(len(rw["stations"]) for rw in railways_data),
+        "railways": railways_data,
+        "stations": [s for rw in railways_data for s in rw["stations"]],
+    }
+
+
+def _result_path(safe_base, max_transfer):
+    return os.path.join(STATION_OUTPUT_DIR, f"{safe_base}_{max_transfer}transfer.json")
+
+
+def iter_station_mode(base_station, max_transfer, use_cache=True):
+    """
+    run_station_mode の逐次版: 乗り換え0回 → 1回 → … の順に、その回数までの結果を返していく
+    到達駅の探索（iter_reachable_stations）も移動時間の推定も回数ごとに進めるので、
+    深い探索でも最初の結果は0回分の探索だけで返る
+    最後（max_transfer回）の結果はJSONに保存してから返す
+    より多い回数で保存済みの結果があれば、探索せずに max_transfer 回以内に絞って返す
+
+    Yields:
+        (level, result): level回までの駅を含む結果（形式は run_station_mode の戻り値と同じ）
+    """
     logger.info(f"=== 駅別モード開始 ===")
     logger.info(f"基準駅: {base_station}, 最大乗り換え: {max_transfer}回")
 
     safe_base = _sanitize_filename(base_station)
     os.makedirs(STATION_OUTPUT_DIR, exist_ok=True)
-
-    reachable, by_railway, matched_name, station_coords, railway_stations, station_to_railways = get_reachable_stations(base_station, max_transfer)
-    if not reachable and not by_railway:
-        logger.warning("到達可能な駅が見つかりませんでした")
-        return None
-
-    base = matched_name or base_station
-    base_coords = station_coords.get(base)
+    json_path = _result_path(safe_base, max_transfer)
+    version = get_graph_version()
+    graph_hash, travel_version = version["graph_hash"], version["travel_version"]
+
+    if use_cache:
+        # 検索画面は上限回数まで探索して保存するので、少ない回数の要求はその結果を絞り込めば足りる
+        for saved_transfer in range(max_transfer, max(max_transfer, MAX_TRANSFER_LEVEL) + 1):
+            saved_path = _result_path(safe_base, saved_transfer)
+            saved = _load_saved_result(saved_path, graph_hash, travel_version)
+            if saved:
+                logger.info(f"保存済みの結果を使用: {saved_path}")
+                yield max_transfer, filter_result_by_transfer(saved, max_transfer)
+                return
 
     # 移動時間の上限（推定不能 or これを超える駅は除外）
     MAX_TRAVEL_MINUTES = 90
 
-    railways_data = []
-    seen = set()
-    total_count = 0
+    # Wikipediaダンプから作った乗降客数表があれば全駅に付ける（ネットワークは使わない）
+    pax_table = get_passenger_table() or {}
 
-    for railway_name, stations_on_line in by_railway.items():
-        logger.info(f"--- {railway_name} ({len(stations_on_line)}駅) ---")
+    found = False
+    entries = {}  # 駅名 -> 結果の駅エントリ（移動時間の上限内のみ）
+    for level, reached in iter_reachable_stations(base_station, max_transfer):
+        reachable, by_railway, matched_name, station_coords, railway_stations, station_to_railways, station_transfers = reached
+        if not reachable and not by_railway:
+            continue
 
-        stations_data = []
-        for station_name in stations_on_line:
-            if station_name in seen:
+        if not found:
+            found = True
+            base = matched_name or base_station
+            base_coords = station_coords.get(base)
+
+            # 移動時間表（build_travel_table）があれば基準駅の行を引くだけ。なければ駅ごとに推定
+            # （表に行のない駅も駅ごとの推定で補う）
+            table_times = lookup_travel_times(base)
+            if table_times is not None:
+                logger.info(f"移動時間表を使用: {len(table_times)}駅")
+            elif get_edge_minutes():
+                # GTFSの実測区間時間があれば、その重みで基準駅から1回だけ探索する（駅ごとの座標計算なし）
+                table_times = find_travel_times({base: 0}, get_travel_graph(), max_minutes=MAX_TRAVEL_MINUTES)
+                logger.info(f"GTFS区間時間で探索: {len(table_times)}駅")
+
+        # 駅は最初に現れた路線の下に表示する（路線のまとまりは回数が進むと変わりうるので毎回作る）
+        station_railway = {}
+        for railway_name, stations_on_line in by_railway.items():
+            for station_name in stations_on_line:
+                station_railway.setdefault(station_name, railway_name)
+
+        # 今回の回数で新しく加わった駅だけ移動時間を求める
+        for station_name in station_railway:
+            if station_transfers.get(station_name, level) != level:
                 continue
-
-            travel_time = _estimate_travel_time(base, station_name, railway_stations, station_to_railways, station_coords)
+            travel_time = None
+            if table_times is not None:
+                travel_time = table_times.get(station_name, {}).get("travel_time")
+            if travel_time is None:
+                # 表・GTFS探索の上限外の駅は、表がないときと同じ推定に戻す
+                travel_time = _estimate_travel_time(base, station_name, railway_stations, station_to_railways, station_coords)
             if travel_time is None or travel_time > MAX_TRAVEL_MINUTES:
                 continue
 
-            seen.add(station_name)
-            total_count += 1
-
             coords = station_coords.get(station_name)
 
             entry = {
                 "name": station_name,
                 "image_path": [],
                 "travel_time": travel_time,
+                "transfers": level,
             }
             if coords:
                 entry["lat"] = coords["lat"]
                 entry["lon"] = coords["lon"]
+            pax = pax_table.get(station_name)
+            if pax:
+                entry["passengers"] = pax["passengers"]
+                entry["passenger_label"] = pax["passenger_label"]
+
+            entries[station_name] = entry
+
+        railways_data = []
+        for railway_name, stations_on_line in by_railway.items():
+            stations_data = [
+                entries[s] for s in stations_on_line
+                if s in entries and station_railway[s] == railway_name
+            ]
+            if stations_data:
+                railways_data.append({
+                    "railway": railway_name,
+                    "stations": stations_data,
+                })
+
+        result = {
+            "base_station": base_station,
+            "matched_station": matched_name,
+            "graph_hash": graph_hash,
+            "travel_version": travel_version,
+            "max_transfer": max_transfer,
+            "total_stations": len(entries),
+            "railways": railways_data,
+            "stations": [s for r in railways_data for s in r["stations"]],
+        }
+
+        if base_coords:
+            result["base_coords"] = base_coords
+
+        logger.info(f"乗り換え{level}回まで: {len(entries)}駅")
+        if level == max_transfer:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            logger.info(f"JSON保存: {json_path}")
+            logger.info(f"=== 駅別モード完了: {len(entries)}駅 ===")
+        yield level, result
+
+    if not found:
+        logger.warning("到達可能な駅が見つかりませんでした")
 
-            stations_data.append(entry)
-
-        if stations_data:
-            railways_data.append({
-                "railway": railway_name,
-                "stations": stations_data,
-            })
 
-    result = {
-        "base_station": base_station,
-        "matched_station": matched_name,
-        "max_transfer": max_transfer,
-        "total_stations": total_count,
-        "railways": railways_data,
-        "stations": [s for r in railways_data for s in r["stations"]],
-    }
-
-    if base_coords:
-        result["base_coords"] = base_coords
+def run_station_mode(base_station, max_transfer, use_cache=True):
+    """
+    基準駅から乗り換えmax_transfer回以内の駅を路線別に取得してJSONに保存する
+    各駅には最小乗り換え回数 "transfers" を付けるので、上限まで1回探索すれば
+    それより少ない回数の結果は呼び出し側の絞り込みで得られる
 
-    json_filename = f"{safe_base}_{max_transfer}transfer.json"
-    json_path = os.path.join(STATION_OUTPUT_DIR, json_filename)
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    Args:
+        use_cache: 同じグラフ版で保存済みの結果があれば再探索せずに返す
 
-    logger.info(f"JSON保存: {json_path}")
-    logger.info(f"=== 駅別モード完了: {total_count}駅 ===")
+    Returns:
+        dict: 結果（駅が見つからなければ None）
+    """
+    result = None
+    for _level, result in iter_station_mode(base_station, max_transfer, use_cache):
+        pass
     return result
@@ -0,0 +1,43 @@
+import json
+import os
+import sys
+
+import pytest
+
+# リポジトリ直下のモジュール（transport_api など）を import できるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    """transport_api のキャッシュの置き場所（CACHE_DIR 配下のパスすべて）を一時ディレクトリに向ける"""
+    import transport_api
+
+    original = transport_api.CACHE_DIR
+    for attr in dir(transport_api):
+        value = getattr(transport_api, attr)
+        if attr.lstrip("_").isupper() and isinstance(value, str) and value.startswith(original):
+            monkeypatch.setattr(transport_api, attr, value.replace(original, str(tmp_path), 1))
+    monkeypatch.setattr(transport_api, "_artifact_memo", {})
+    monkeypatch.setattr(transport_api, "_travel_table_memo", {})
+    monkeypatch.setattr(transport_api, "_passenger_table_memo", {})
+    return tmp_path
+
+
+@pytest.fixture
+def rail_data():
+    """小さな Overpass 応答（tests/fixtures/rail-overpass.json）"""
+    with open(os.path.join(FIXTURES, "rail-overpass.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def built_graph(cache_dir, rail_data, monkeypatch):
+    """rail_data から一時ディレクトリにグラフ成果物を作る（ネットワークからの再取得は rail_data を返す）"""
+    import transport_api
+
+    monkeypatch.setattr(transport_api, "_fetch_rail_data_from_overpass", lambda mode=None: rail_data)
+    transport_api._build_and_save_graph(rail_data, {"source": "test"})
+    return cache_dir
@@ -0,0 +1,96 @@
+import json
+
+import transport_api
+from admin_boundaries import assign_points, load_boundaries
+
+
+def _square(lon_min, lat_min, lon_max, lat_max):
+    return [[lon_min, lat_min], [lon_max, lat_min], [lon_max, lat_max], [lon_min, lat_max], [lon_min, lat_min]]
+
+
+def _feature(props, *polygons):
+    if len(polygons) == 1:
+        geometry = {"type": "Polygon", "coordinates": polygons[0]}
+    else:
+        geometry = {"type": "MultiPolygon", "coordinates": list(polygons)}
+    return {"type": "Feature", "properties": props, "geometry": geometry}
+
+
+def _write_geojson(path, *features):
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": list(features)}), encoding="utf-8")
+    return str(path)
+
+
+def _city(points, areas):
+    return {name: a["city"] for name, a in assign_points(points, areas).items()}
+
+
+def test_holes_and_enclaves(tmp_path):
+    # 外側の区の穴に、別の区の飛び地がちょうど収まる
+    outer = _feature({"N03_001": "東京都", "N03_004": "外区"},
+                     [_square(139.60, 35.60, 139.80, 35.80), _square(139.65, 35.65, 139.70, 35.70)])
+    enclave = _feature({"N03_001": "東京都", "N03_004": "飛地区"},
+                       [_square(139.65, 35.65, 139.70, 35.70)], [_square(139.90, 35.60, 139.95, 35.65)])
+    areas = load_boundaries([_write_geojson(tmp_path / "n03.geojson", outer, enclave)])
+    assert len(areas) == 3
+
+    assert _city({
+        "穴の中": (35.675, 139.675),
+        "外区の中": (35.75, 139.75),
+        "飛地の本体": (35.62, 139.92),
+        "どこでもない": (35.62, 139.85),
+    }, areas) == {"穴の中": "飛地区", "外区の中": "外区", "飛地の本体": "飛地区"}
+
+
+def test_points_on_shared_edges_belong_to_one_area():
+    west = {"pref": "東京都", "city": "西区", "parent": "", "rings": [_square(139.6, 35.6, 139.7, 35.7)]}
+    east = {"pref": "東京都", "city": "東区", "parent": "", "rings": [_square(139.7, 35.6, 139.8, 35.7)]}
+    for a in (west, east):
+        lons, lats = [p[0] for p in a["rings"][0]], [p[1] for p in a["rings"][0]]
+        a["bbox"] = (min(lons), min(lats), max(lons), max(lats))
+
+    # 境界線上・頂点上の点も、どちらか一方だけに割り当てる（隙間も重複もない）
+    points = {f"境界{i}": (35.6 + i * 0.025, 139.7) for i in range(4)}
+    points["下辺上"] = (35.6, 139.65)
+    for areas in ([west, east], [east, west]):
+        assigned = _city(points, areas)
+        assert set(assigned) == set(points)
+        assert {assigned[f"境界{i}"] for i in range(4)} == {"東区"}
+
+
+def test_concave_polygon_notch_is_outside():
+    # 凹型（コの字）: 切り欠きの点は外、切り欠きの頂点と同じ緯度の点も正しく判定する
+    ring = [[0, 0], [3, 0], [3, 3], [2, 3], [2, 1], [1, 1], [1, 3], [0, 3], [0, 0]]
+    areas = [{"pref": "", "city": "凹区", "parent": "", "bbox": (0, 0, 3, 3), "rings": [ring]}]
+    assert _city({
+        "切り欠き": (2.0, 1.5),
+        "左の腕": (2.0, 0.5),
+        "底": (0.5, 1.5),
+        "頂点の緯度": (1.0, 0.5),
+    }, areas) == {"左の腕": "凹区", "底": "凹区", "頂点の緯度": "凹区"}
+
+
+def test_apply_municipal_boundaries(built_graph, tmp_path):
+    path = _write_geojson(
+        tmp_path / "n03.geojson",
+        # 表参道の周りだけ港区の飛び地（穴）
+        _feature({"N03_001": "東京都", "N03_004": "渋谷区"},
+                 [_square(139.69, 35.65, 139.72, 35.68), _square(139.71, 35.66, 139.715, 35.67)]),
+        _feature({"N03_001": "東京都", "N03_004": "港区"},
+                 [_square(139.71, 35.66, 139.715, 35.67)], [_square(139.73, 35.67, 139.74, 35.68)]),
+        _feature({"N03_001": "福岡県", "N03_003": "福岡市", "N03_004": "中央区"},
+                 [_square(130.38, 33.58, 130.40, 33.60)]),
+        _feature({"N03_001": "福岡県", "N03_003": "福岡市", "N03_004": "博多区"},
+                 [_square(130.40, 33.58, 130.42, 33.60)]),
+    )
+    stats = transport_api.apply_municipal_boundaries([path])
+    assert stats == {"stations": 10, "assigned": 8, "municipalities": 5}
+
+    lookup = transport_api.lookup_stations_in_city
+    assert sorted(lookup("東京都", "渋谷区")) == ["原宿", "渋谷"]
+    assert sorted(lookup("東京都", "港区")) == ["表参道", "赤坂(東京)", "赤坂見附"]
+    # 政令指定都市は区名でも市名でも引ける
+    assert sorted(lookup("福岡県", "中央区")) == ["天神", "赤坂(福岡)"]
+    assert sorted(lookup("", "福岡市")) == ["中洲川端", "天神", "赤坂(福岡)"]
+    assert lookup("東京都", "新宿区") == []
+    assert sorted(transport_api.list_cities_in_prefecture("福岡県")) == ["中央区", "博多区"]
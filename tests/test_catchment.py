@@ -0,0 +1,34 @@
+import json
+import os
+
+import catchment_mode
+import image_fetcher
+import transport_api
+
+DUMP = os.path.join(os.path.dirname(__file__), "fixtures", "jawiki-stations.xml.bz2")
+
+
+def _write_meta(cache_dir, name, passengers):
+    station_dir = cache_dir / name
+    station_dir.mkdir(parents=True)
+    (station_dir / f"{name}_1.jpg").write_bytes(b"")
+    (station_dir / "meta.json").write_text(
+        json.dumps({"name": f"{name}駅", "passengers": passengers}, ensure_ascii=False), encoding="utf-8"
+    )
+
+
+def test_known_passengers_prefer_table_over_image_cache(built_graph, monkeypatch):
+    image_cache = built_graph / "images"
+    monkeypatch.setattr(image_fetcher, "IMAGE_CACHE_DIR", str(image_cache))
+    _write_meta(image_cache, "渋谷", 1)
+    _write_meta(image_cache, "原宿", 5000)
+
+    # 乗降客数表がなければ保管庫メタデータだけ
+    assert catchment_mode.load_known_passengers() == {"渋谷": 1, "原宿": 5000}
+
+    transport_api.build_passenger_table(DUMP)
+    passengers = catchment_mode.load_known_passengers()
+    assert passengers["渋谷"] == 1234567
+    assert passengers["赤坂(福岡)"] == 10000
+    # 表にない駅は保管庫メタデータで補う
+    assert passengers["原宿"] == 5000
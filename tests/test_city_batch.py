@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import city_mode
+
+_TOP = {
+    "渋谷区": [{"name": "渋谷", "line_count": 8, "lat": 35.66, "lon": 139.70}],
+    "新宿区": [
+        {"name": "新宿", "line_count": 10, "lat": 35.69, "lon": 139.70},
+        {"name": "高田馬場", "line_count": 3, "lat": 35.71, "lon": 139.70},
+    ],
+}
+
+
+@pytest.fixture
+def batch(monkeypatch, tmp_path):
+    """run_city_batch のネットワーク・グラフ依存を小さな固定値に差し替える"""
+
+    def select(pref, city, rank_by):
+        if city == "港区":
+            raise RuntimeError("Overpass 応答が壊れています")
+        if city not in _TOP:
+            return None
+        return [s["name"] for s in _TOP[city]], {"winner": "boundaries"}, _TOP[city]
+
+    def fetch(name, subdir, label=""):
+        if name == "高田馬場":
+            raise RuntimeError("画像の取得に失敗")
+        return [f"{name}.jpg"], {"passengers": 1000, "passenger_label": "乗降人員（全社合算）"}
+
+    monkeypatch.setattr(city_mode, "CITY_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(city_mode, "fetch_rail_graph", lambda: None)
+    monkeypatch.setattr(city_mode, "base_station_name", lambda name: name)
+    monkeypatch.setattr(city_mode, "get_passenger_table", lambda: None)
+    monkeypatch.setattr(city_mode, "get_graph_version", lambda: {"graph_hash": "test"})
+    monkeypatch.setattr(city_mode, "prefetch_pages", lambda titles: None)
+    monkeypatch.setattr(city_mode, "_select_city_stations", select)
+    monkeypatch.setattr(city_mode, "_fetch_station_assets", fetch)
+    monkeypatch.setattr(
+        city_mode, "list_cities_in_prefecture", lambda pref: ["渋谷区", "港区", "新宿区", "千代田区"]
+    )
+
+
+def test_run_city_batch_isolates_failures(batch):
+    summary = city_mode.run_city_batch("東京都")
+
+    assert summary["cities"] == 4
+    assert summary["found"] == 2
+    assert summary["errors"] == 1
+    with open(summary["index_path"], encoding="utf-8") as f:
+        records = {r["city"]: r for r in map(json.loads, f)}
+
+    assert records["渋谷区"]["status"] == "ok"
+    # 駅の選定で例外が出た市区も一覧に残る
+    assert records["港区"]["status"] == "error"
+    assert "Overpass" in records["港区"]["error"]
+    assert records["千代田区"]["status"] == "not_found"
+    # 1駅の取得失敗は市区の結果を止めず、その駅だけ error になる
+    shinjuku = records["新宿区"]
+    assert shinjuku["status"] == "ok"
+    assert [s.get("status") for s in shinjuku["stations"]] == [None, "error"]
+    assert shinjuku["stations"][1]["images"] == 0
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+import city_mode
+import http_client
+
+OVERPASS = http_client._host(city_mode.OVERPASS_API_URL)
+NOMINATIM = http_client._host(city_mode.NOMINATIM_SEARCH_URL)
+
+
+def _response(payload):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = json.dumps(payload).encode()
+    return resp
+
+
+class _Session:
+    """Overpass は gate が開くまで応答しない（結果の遅い行政区域検索）。Nominatim はすぐ返す"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.overpass_calls = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, timeout=None, **kwargs):
+        if http_client._host(url) == OVERPASS:
+            with self.lock:
+                self.overpass_calls += 1
+            self.gate.wait(5)
+            return _response({"elements": [{"tags": {"name": "渋谷駅"}}]})
+        return _response([{"boundingbox": ["35.6", "35.7", "139.6", "139.8"]}])
+
+
+@pytest.fixture
+def lookup(monkeypatch):
+    """Overpass の同時接続数を slots にした駅検索（戻り値の session.gate で Overpass の応答を返す）"""
+    session = _Session()
+
+    def setup(slots):
+        monkeypatch.setattr(http_client, "_limiters", {
+            OVERPASS: http_client._HostLimiter(slots, 0.0, 0),
+            NOMINATIM: http_client._HostLimiter(1, 0.0, 0),
+        })
+        return session
+
+    monkeypatch.setattr(http_client, "_session", lambda host: session)
+    monkeypatch.setattr(city_mode, "_hedge_backups", {})
+    monkeypatch.setattr(city_mode, "fetch_rail_graph", lambda: ({}, {}, {"渋谷": {"lat": 35.65, "lon": 139.70}}))
+    yield setup
+    session.gate.set()
+
+
+def _wait_until(predicate, timeout=3.0):
+    until = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_finished_hedge_frees_its_slot(lookup):
+    session = lookup(slots=1)
+    names, result = city_mode._lookup_stations_hedged("東京都", "渋谷区", deadline=5, bbox_grace=0.1)
+    assert result["winner"] == "bbox"
+    assert names == ["渋谷"]
+
+    # 枠を待っていたバックアップは送られずに終わる（通信中の本命だけが枠を持つ）
+    assert _wait_until(lambda: city_mode._hedge_backups[OVERPASS] == 0)
+    assert session.overpass_calls == 1
+
+    # 本命の応答が返ればホストの枠はすべて空く
+    session.gate.set()
+    limiter = http_client._limiters[OVERPASS]
+    assert limiter.slots.acquire(timeout=3)
+    limiter.slots.release()
+
+
+def test_backup_skipped_while_previous_backup_in_flight(lookup):
+    session = lookup(slots=2)
+    city_mode._lookup_stations_hedged("東京都", "渋谷区", deadline=5, bbox_grace=0.1)
+    assert _wait_until(lambda: session.overpass_calls == 2)
+
+    # 前の市区のバックアップが応答待ちのあいだは、次の市区ではバックアップを出さない
+    _names, result = city_mode._lookup_stations_hedged("東京都", "新宿区", deadline=5, bbox_grace=0.1)
+    assert result["strategies"]["overpass_pref_area"]["status"] == "skipped"
+
+    session.gate.set()
+    assert _wait_until(lambda: city_mode._hedge_backups[OVERPASS] == 0)
+
+
+def test_request_cancelled_before_slot(monkeypatch):
+    monkeypatch.setattr(http_client, "_limiters", {OVERPASS: http_client._HostLimiter(1, 0.0, 0)})
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(http_client.RequestCancelled):
+        http_client.post(city_mode.OVERPASS_API_URL, cancel=cancel)
+    # 打ち切ったリクエストは枠を使わない
+    assert http_client._limiters[OVERPASS].slots.acquire(blocking=False)
@@ -0,0 +1,44 @@
+from collections import defaultdict
+
+from transport_api import find_travel_times
+
+
+def _travel_graph(edges):
+    adj = defaultdict(list)
+    for a, b, rw, minutes in edges:
+        adj[a].append((b, rw, minutes))
+        adj[b].append((a, rw, minutes))
+    return {"adj": adj}
+
+
+# S-X は路線Aで速いが、X から先（B → C）は乗り換え2回。
+# S-P-X を路線Bで行けば遅いが、Z-W（C）への乗り換え1回で W に着く
+_EDGES = [
+    ("S", "X", "A", 1),
+    ("S", "P", "B", 5),
+    ("P", "X", "B", 5),
+    ("X", "Z", "B", 2),
+    ("Z", "W", "C", 2),
+]
+
+
+def test_transfer_limit_keeps_slower_route_with_transfers_left():
+    result = find_travel_times({"S": 0}, _travel_graph(_EDGES), max_transfer=1)
+
+    assert result["W"]["transfers"] == 1
+    assert result["W"]["travel_time"] == 5 + 5 + 2 + 2 + 5
+    # Z までは速い経路（A → B、乗り換え1回）のまま
+    assert result["Z"]["travel_time"] == 1 + 2 + 5
+
+
+def test_no_transfer_limit_uses_fastest_route():
+    result = find_travel_times({"S": 0}, _travel_graph(_EDGES))
+
+    assert result["W"] == {"travel_time": 1 + 2 + 5 + 2 + 5, "transfers": 2, "source": "S"}
+
+
+def test_zero_transfers_stays_on_first_line():
+    result = find_travel_times({"S": 0}, _travel_graph(_EDGES), max_transfer=0)
+
+    assert set(result) == {"S", "X", "P", "Z"}
+    assert result["Z"]["travel_time"] == 5 + 5 + 2
@@ -0,0 +1,80 @@
+import glob
+import json
+import os
+
+import transport_api
+from transport_api import _GraphArtifact
+
+
+def _graph_files(cache_dir):
+    """ヘッダ以外のグラフキャッシュ（バイナリ・表）のファイル名"""
+    header = os.path.basename(transport_api.GRAPH_CACHE)
+    return sorted(name for name in map(os.path.basename, glob.glob(str(cache_dir / "osm_rail_graph.*")))
+                  if name != header)
+
+
+def _reload():
+    transport_api._artifact_memo.clear()
+    return transport_api.fetch_rail_graph()
+
+
+def test_header_is_compact_and_tables_load_lazily(built_graph):
+    views = transport_api.fetch_rail_graph()
+    expected = [dict(v) for v in views]
+    same_name = transport_api._artifact_memo["artifact"]["same_name"]
+
+    with open(transport_api.GRAPH_CACHE, encoding="utf-8") as f:
+        text = f.read()
+    header = json.loads(text)
+    assert "\n" not in text
+    assert not set(transport_api._ARTIFACT_TABLES) & set(header)
+    # バイナリ・表は1組だけ残る
+    assert _graph_files(built_graph) == [header["bin"], header["tables"]]
+
+    assert [dict(v) for v in _reload()] == expected
+    artifact = transport_api._artifact_memo["artifact"]
+    assert isinstance(artifact, _GraphArtifact)
+    # 有無の確認だけでは表を読まない
+    assert "same_name" in artifact and artifact._tables_file is not None
+    assert artifact["same_name"] == same_name
+    assert artifact._tables_file is None
+    assert artifact.get("municipalities") is None
+
+
+def test_mismatched_binary_is_a_cache_miss(built_graph, monkeypatch):
+    expected = [dict(v) for v in transport_api.fetch_rail_graph()]
+    graph_hash = transport_api._artifact_memo["artifact"]["graph_hash"]
+    calls = []
+    monkeypatch.setattr(transport_api, "_build_and_save_graph",
+                        lambda data, source, _build=transport_api._build_and_save_graph: calls.append(1) or _build(data, source))
+
+    # 書き込み途中で止まったバイナリ（ヘッダと長さが合わない）
+    with open(glob.glob(str(built_graph / "osm_rail_graph.*.bin"))[0], "r+b") as f:
+        f.truncate(100)
+    assert [dict(v) for v in _reload()] == expected
+    assert calls == [1]
+    assert transport_api._artifact_memo["artifact"]["graph_hash"] == graph_hash
+
+    # 表のファイルがない
+    os.remove(glob.glob(str(built_graph / "osm_rail_graph.*.tables.json"))[0])
+    assert [dict(v) for v in _reload()] == expected
+    assert calls == [1, 1]
+
+
+def test_legacy_format_is_converted(built_graph):
+    transport_api.fetch_rail_graph()
+    artifact, graph = transport_api._artifact_memo["artifact"], transport_api._artifact_memo["graph"]
+
+    # 旧形式: 表もすべてヘッダに入れ、バイナリは固定名
+    for name in _graph_files(built_graph):
+        os.remove(built_graph / name)
+    graph.write_binary(transport_api._LEGACY_GRAPH_BIN)
+    legacy = {**artifact, "format": 2, "stations": graph.station_names, "railways": graph.railway_names}
+    with open(transport_api.GRAPH_CACHE, "w", encoding="utf-8") as f:
+        json.dump(legacy, f, ensure_ascii=False, indent=2)
+
+    _reload()
+    converted = transport_api._artifact_memo["artifact"]
+    assert dict(converted) == dict(artifact)
+    assert not os.path.exists(transport_api._LEGACY_GRAPH_BIN)
+    assert len(_graph_files(built_graph)) == 2
@@ -0,0 +1,92 @@
+import copy
+import json
+
+import pytest
+
+import refresh_mode
+import station_mode
+import transport_api
+from rail_graph import RailGraph
+
+_FUKUOKA = {"赤坂(福岡)", "天神", "中洲川端"}
+
+
+def _move_tenjin(rail_data):
+    """天神駅の座標だけずらした Overpass 応答"""
+    data = copy.deepcopy(rail_data)
+    for el in data["elements"]:
+        if el.get("tags", {}).get("name") == "天神":
+            el["lat"] += 0.001
+    return data
+
+
+def _digests(rail_data):
+    return RailGraph.from_dicts(*transport_api._build_graph_from_overpass(rail_data, workers=1)).station_digests()
+
+
+def test_station_digests_change_only_along_affected_railways(rail_data):
+    before = _digests(rail_data)
+    after = _digests(_move_tenjin(rail_data))
+
+    assert set(before) == set(after)
+    # 座標の変わった駅と、同じ路線に乗り入れる駅だけ値が変わる
+    assert {name for name in before if before[name] != after[name]} == _FUKUOKA
+    assert before == _digests(rail_data)
+
+
+@pytest.fixture
+def saved_results(built_graph, monkeypatch):
+    """現在の版で作った駅別結果（渋谷・天神）を一時ディレクトリに保存する"""
+    station_dir, city_dir = built_graph / "station", built_graph / "city"
+    station_dir.mkdir()
+    city_dir.mkdir()
+    monkeypatch.setattr(refresh_mode, "STATION_OUTPUT_DIR", str(station_dir))
+    monkeypatch.setattr(refresh_mode, "CITY_OUTPUT_DIR", str(city_dir))
+
+    graph_hash = transport_api.get_graph_version()["graph_hash"]
+    paths = {}
+    for base, stations in (("渋谷", ["新宿", "表参道"]), ("天神", ["中洲川端"])):
+        paths[base] = station_dir / f"{base}_1transfer.json"
+        paths[base].write_text(json.dumps({
+            "base_station": base,
+            "max_transfer": 1,
+            "stations": [{"name": name} for name in stations],
+            "graph_hash": graph_hash,
+        }, ensure_ascii=False), encoding="utf-8")
+    return graph_hash, paths
+
+
+def test_refresh_restamps_unaffected_and_recomputes_affected(saved_results, rail_data, monkeypatch):
+    old_hash, paths = saved_results
+    transport_api._build_and_save_graph(_move_tenjin(rail_data), {"source": "test"})
+    new_hash = transport_api.get_graph_version()["graph_hash"]
+    assert new_hash != old_hash
+
+    recomputed = []
+    monkeypatch.setattr(station_mode, "run_station_mode",
+                        lambda base, max_transfer, use_cache=True: recomputed.append((base, max_transfer)))
+
+    summary = refresh_mode.run_refresh_mode(dry_run=True)
+    assert summary["restamped"] == [str(paths["渋谷"])] and summary["recomputed"] == [str(paths["天神"])]
+    assert recomputed == []
+    assert json.loads(paths["渋谷"].read_text(encoding="utf-8"))["graph_hash"] == old_hash
+
+    summary = refresh_mode.run_refresh_mode()
+    assert summary["checked"] == 2
+    restamped = json.loads(paths["渋谷"].read_text(encoding="utf-8"))
+    assert restamped["graph_hash"] == new_hash and restamped["travel_version"] == new_hash
+    assert recomputed == [("天神", 1)]
+
+    # 付け替えた結果は次回は確認しない
+    assert refresh_mode.run_refresh_mode(dry_run=True)["restamped"] == []
+
+
+def test_results_from_unknown_version_are_recomputed(saved_results):
+    _old_hash, paths = saved_results
+    for path in paths.values():
+        data = json.loads(path.read_text(encoding="utf-8"))
+        data["graph_hash"] = "0000000000000000"
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    summary = refresh_mode.run_refresh_mode(dry_run=True)
+    assert sorted(summary["recomputed"]) == sorted(str(p) for p in paths.values())
@@ -0,0 +1,98 @@
+import zipfile
+
+import transport_api
+from gtfs_loader import load_gtfs_segment_minutes
+
+_STOPS = {"A": "渋谷", "B": "表参道", "C": "赤坂見附", "X": None}
+_ADJACENT = {("渋谷", "表参道"), ("表参道", "赤坂見附")}
+
+
+def _write_feed(path, stop_times, routes=(("R1", "1"), ("BUS", "3"))):
+    """最小限の GTFS zip（stop_times は (trip, 停車順, 停留所, 着, 発) の並び）"""
+    trips = {"T1": "R1", "T2": "R1", "T3": "R1", "T4": "R1", "TB": "BUS"}
+    files = {
+        "routes.txt": ["route_id,route_type"] + [f"{r},{t}" for r, t in routes],
+        "trips.txt": ["route_id,service_id,trip_id"] + [f"{r},WD,{t}" for t, r in trips.items()],
+        "stops.txt": ["stop_id,stop_name,stop_lat,stop_lon"] + [f"{s},{s},35.6,139.7" for s in _STOPS],
+        "stop_times.txt": ["trip_id,stop_sequence,stop_id,arrival_time,departure_time"]
+        + [",".join(row) for row in stop_times],
+    }
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, lines in files.items():
+            zf.writestr(name, "\ufeff" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+def _load(paths):
+    return load_gtfs_segment_minutes(
+        paths,
+        lambda name, lat, lon: _STOPS.get(name),
+        lambda a, b: (a, b) in _ADJACENT or (b, a) in _ADJACENT,
+    )
+
+
+def test_segment_minutes_are_medians_of_rail_trips(tmp_path):
+    feed = _write_feed(tmp_path / "feed.zip", [
+        ("T1", "1", "A", "08:00:00", "08:00:00"),
+        ("T1", "2", "B", "08:02:00", "08:02:30"),
+        ("T1", "3", "C", "08:05:30", ""),
+        # 逆向き・日付をまたぐ便も同じ区間に数える
+        ("T2", "2", "A", "24:03:00", ""),
+        ("T2", "1", "B", "", "24:00:00"),
+        ("T3", "1", "A", "09:00:00", "09:00:00"),
+        ("T3", "2", "B", "09:04:00", "09:04:00"),
+        # 隣り合わない駅の間（B を通過）・対応づかない停留所は数えない
+        ("T4", "1", "A", "10:00:00", "10:00:00"),
+        ("T4", "2", "C", "10:05:00", "10:05:00"),
+        ("T4", "3", "X", "10:07:00", "10:07:00"),
+        # バスは数えない
+        ("TB", "1", "A", "11:00:00", "11:00:00"),
+        ("TB", "2", "B", "11:30:00", "11:30:00"),
+    ])
+    edge_minutes, stats = _load([feed])
+
+    # 渋谷-表参道: 120, 180, 240 秒の中央値
+    assert edge_minutes == {("渋谷", "表参道"): 3.0, ("表参道", "赤坂見附"): 3.0}
+    assert stats["feeds"] == 1 and stats["samples"] == 4 and stats["bad_rows"] == 0
+    assert stats["stops"] == 4 and stats["matched_stops"] == 3
+
+
+def test_malformed_rows_and_feeds_are_skipped(tmp_path):
+    feed = _write_feed(tmp_path / "feed.zip", [
+        ("T1", "1", "A", "08:00:00", "08:00:00"),
+        ("T1", "x", "B", "08:02:00", "08:02:00"),
+        ("T1", "3", "B", "8:02", "08:02:00"),
+        ("T2", "1", "B", "09:00:00", "09:00:00"),
+        ("T2", "2", "C", "09:02:00", "09:02:00"),
+    ])
+    broken = tmp_path / "broken.zip"
+    broken.write_bytes(b"not a zip")
+    edge_minutes, stats = _load([str(broken), feed])
+
+    # 不正な行を飛ばした T1 は区間にならないが、同じフィードの他の便は使う
+    assert edge_minutes == {("表参道", "赤坂見附"): 2.0}
+    assert stats["bad_rows"] == 2
+    assert stats["feeds"] == 1
+
+
+def test_apply_gtfs_feeds_changes_only_the_travel_version(built_graph, tmp_path):
+    version = transport_api.get_graph_version()
+    assert version["travel_version"] == version["graph_hash"]
+
+    # 停留所名は駅名索引で、名前のない停留所は座標の近い駅で対応づける
+    feed = str(tmp_path / "feed.zip")
+    with zipfile.ZipFile(feed, "w") as zf:
+        zf.writestr("routes.txt", "route_id,route_type\nR1,1\n")
+        zf.writestr("trips.txt", "route_id,service_id,trip_id\nR1,WD,T1\n")
+        zf.writestr("stops.txt", "stop_id,stop_name,stop_lat,stop_lon\n"
+                                 "S1,渋谷駅,35.6581,139.7017\nS2,,35.6652,139.7123\n")
+        zf.writestr("stop_times.txt", "trip_id,stop_sequence,stop_id,arrival_time,departure_time\n"
+                                      "T1,1,S1,08:00:00,08:00:00\nT1,2,S2,08:07:00,08:07:00\n")
+
+    stats = transport_api.apply_gtfs_feeds([feed])
+    assert stats["matched_stops"] == 2 and stats["edges"] == 1
+    assert transport_api.get_edge_minutes() == {("渋谷", "表参道"): 7.0}
+
+    updated = transport_api.get_graph_version()
+    assert updated["graph_hash"] == version["graph_hash"]
+    assert updated["travel_version"] != version["travel_version"]
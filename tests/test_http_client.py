@@ -0,0 +1,30 @@
+import pytest
+import requests
+
+import http_client
+
+
+def _response(retry_after=None):
+    resp = requests.Response()
+    resp.status_code = 429
+    if retry_after is not None:
+        resp.headers["Retry-After"] = retry_after
+    return resp
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("3", 3.0),
+        # 長すぎる値・無限大は上限で止める（全スレッドが止まるため）
+        ("86400", http_client._MAX_BACKOFF),
+        ("inf", http_client._MAX_BACKOFF),
+        ("-5", 0.0),
+        # HTTP日付形式・不正値・ヘッダなしは既定値
+        ("Wed, 21 Oct 2026 07:28:00 GMT", http_client._DEFAULT_BACKOFF),
+        ("nan", http_client._DEFAULT_BACKOFF),
+        (None, http_client._DEFAULT_BACKOFF),
+    ],
+)
+def test_retry_after_is_clamped(header, expected):
+    assert http_client._retry_after(_response(header)) == expected
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+import http_client
+import image_fetcher
+
+
+class _Clock:
+    """http_client の time.monotonic / time.sleep の代わり（sleep は時計を進めるだけ）"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(http_client.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_token_bucket_spaces_requests_after_burst(clock):
+    limiter = http_client._HostLimiter(4, rate=2.0, burst=3)
+    starts = []
+    for _ in range(6):
+        limiter.wait_turn()
+        starts.append(clock.now - 1000.0)
+    # 最初の3件はすぐ、以降は毎秒2件
+    assert starts == [0.0, 0.0, 0.0, 0.5, 1.0, 1.5]
+
+    # しばらく空けるとまた burst 件まで貯まる（それ以上は貯まらない）
+    clock.now += 10
+    start = clock.now
+    for _ in range(4):
+        limiter.wait_turn()
+    assert clock.now - start == 0.5
+
+
+def test_backoff_pauses_host_and_drains_tokens(clock):
+    limiter = http_client._HostLimiter(4, rate=2.0, burst=3)
+    limiter.backoff(5)
+    starts = []
+    for _ in range(3):
+        limiter.wait_turn()
+        starts.append(clock.now - 1000.0)
+    # 429 の待ちが明けても貯まっていた分を一度に使わず、空のバケットから毎秒2件で再開する
+    assert starts == [5.5, 6.0, 6.5]
+
+
+def test_zero_rate_only_waits_for_backoff(clock):
+    limiter = http_client._HostLimiter(1, rate=0.0, burst=0)
+    for _ in range(3):
+        limiter.wait_turn()
+    assert clock.sleeps == []
+    limiter.backoff(2)
+    limiter.wait_turn()
+    assert clock.sleeps == [2.0]
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """URL の末尾で結果を決める _download_image（ok: 保存, ng: 失敗, broken: 書きかけで OSError）"""
+    requested = []
+
+    def download(url, save_path, retries=2):
+        requested.append(url)
+        kind = url.rsplit("/", 1)[-1].split("-")[0]
+        if kind == "ng":
+            return False
+        with open(save_path, "wb") as f:
+            f.write(url.encode())
+        if kind == "broken":
+            raise OSError("No space left on device")
+        return True
+
+    monkeypatch.setattr(image_fetcher, "_download_image", download)
+    return requested
+
+
+def test_download_candidates_keeps_candidate_order_and_cleans_up(downloads, tmp_path):
+    candidates = [(f"https://img.example/{name}", ".jpg") for name in ("ok-1", "ng-2", "broken-3", "ok-4", "ok-5", "ok-6")]
+    saved = image_fetcher._download_candidates(candidates, str(tmp_path), "渋谷", max_images=3, start_idx=1)
+
+    assert [os.path.basename(p) for p in saved] == ["渋谷_2.jpg", "渋谷_3.jpg", "渋谷_4.jpg"]
+    assert [open(p, "rb").read().decode().rsplit("/", 1)[-1] for p in saved] == ["ok-1", "ok-4", "ok-5"]
+    # 足りない枚数ぶんだけ取りに行く（ok-6 は要求しない）
+    assert [u.rsplit("/", 1)[-1] for u in downloads] == ["ok-1", "ng-2", "broken-3", "ok-4", "ok-5"]
+    # 失敗・書きかけの一時ファイル（.part）は残らない
+    assert sorted(os.listdir(tmp_path)) == ["渋谷_2.jpg", "渋谷_3.jpg", "渋谷_4.jpg"]
+
+
+def test_download_candidates_with_too_few_candidates(downloads, tmp_path):
+    candidates = [("https://img.example/ng-1", ".png"), ("https://img.example/ok-2", ".png")]
+    saved = image_fetcher._download_candidates(candidates, str(tmp_path), "原宿", max_images=3)
+
+    assert [os.path.basename(p) for p in saved] == ["原宿_1.png"]
+    assert os.listdir(tmp_path) == ["原宿_1.png"]
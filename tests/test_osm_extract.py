@@ -0,0 +1,28 @@
+import json
+import os
+
+import transport_api
+from osm_extract import load_osm_extract
+from rail_graph import RailGraph
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _build(data):
+    return transport_api._build_graph_from_overpass(data, workers=1)
+
+
+def test_extract_matches_overpass():
+    data = load_osm_extract(os.path.join(FIXTURES, "rail-extract.osm"))
+    with open(os.path.join(FIXTURES, "rail-overpass.json"), encoding="utf-8") as f:
+        overpass = json.load(f)
+
+    # メンバーの way を構成する駅ノード（明治神宮前）は残り、どの路線にも属さない駅（外苑前）は残らない
+    names = {e["tags"]["name"] for e in data["elements"] if e["type"] == "node"}
+    assert "明治神宮前" in names
+    assert "外苑前" not in names
+
+    from_extract = _build(data)
+    from_overpass = _build(overpass)
+    assert from_extract == from_overpass
+    assert RailGraph.from_dicts(*from_extract).content_hash() == RailGraph.from_dicts(*from_overpass).content_hash()
@@ -0,0 +1,49 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import transport_api
+
+_DATA = {
+    "version": 0.6,
+    "osm3s": {"timestamp_osm_base": "2026-10-01T00:00:00Z"},
+    "elements": [
+        {"type": "node", "id": 1, "lat": 35.66, "lon": 139.70, "tags": {"name": "渋谷駅", "railway": "station"}},
+        {"type": "relation", "id": 10, "tags": {"route": "train", "name": "山手線"},
+         "members": [{"type": "node", "ref": 1, "role": "stop"}]},
+    ],
+}
+
+
+@pytest.fixture
+def archive(monkeypatch, tmp_path):
+    """生レスポンスの保存先を一時ディレクトリに向ける"""
+    cache_dir = transport_api.CACHE_DIR
+    for attr in ("CACHE_DIR", "RAW_ARCHIVE", "_LEGACY_RAW_ARCHIVE", "RAW_ARCHIVE_META"):
+        monkeypatch.setattr(transport_api, attr, getattr(transport_api, attr).replace(cache_dir, str(tmp_path), 1))
+
+
+def test_archive_round_trip(archive):
+    raw = json.dumps(_DATA).encode()
+    transport_api._archive_overpass_response(json.loads(raw), len(raw), "lean")
+
+    # 1行目がヘッダ、以降は1行1要素
+    with gzip.open(transport_api.RAW_ARCHIVE, "rt", encoding="utf-8") as f:
+        assert len(f.readlines()) == 1 + len(_DATA["elements"])
+    data, meta = transport_api.load_overpass_archive()
+    assert data == _DATA
+    assert meta["mode"] == "lean"
+    assert meta["bytes"] == len(raw)
+
+
+def test_legacy_archive_is_converted(archive):
+    with gzip.open(transport_api._LEGACY_RAW_ARCHIVE, "wb") as f:
+        f.write(json.dumps(_DATA).encode())
+    assert transport_api.has_overpass_archive()
+
+    data, _meta = transport_api.load_overpass_archive()
+    assert data == _DATA
+    assert os.path.exists(transport_api.RAW_ARCHIVE)
+    assert not os.path.exists(transport_api._LEGACY_RAW_ARCHIVE)
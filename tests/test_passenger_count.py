@@ -0,0 +1,110 @@
+import bz2
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import city_mode
+from wiki_client import parse_passenger_count
+
+DUMP = os.path.join(os.path.dirname(__file__), "fixtures", "jawiki-stations.xml.bz2")
+
+
+def _baseline_parse(wikitext):
+    """1回の走査にまとめる前の抽出（項目名ごとに走査し、行ごとにマークアップを順に除く）"""
+    total = 0
+    found = False
+    for label in ("乗降人員", "乗車人員"):
+        multiplier = 1 if label == "乗降人員" else 2
+        for m in re.finditer(rf"\|\s*{label}\s*=\s*(.+)", wikitext):
+            line = m.group(1)
+            pipe_pos = line.find("|")
+            if pipe_pos >= 0:
+                line = line[:pipe_pos]
+            line = re.sub(r"<ref[^>]*/>", "", line)
+            line = re.sub(r"<ref[^>]*>.*?</ref>", "", line, flags=re.DOTALL)
+            line = re.sub(r"<br\s*/?>", " ", line)
+            line = line.replace("'''", "")
+            line = re.sub(r"（[^）]*）", " ", line)
+            line = re.sub(r"\{\{[^}]*\}\}", "", line)
+            numbers = re.findall(r"([\d,]+)\s*人", line)
+            if numbers:
+                for n in numbers:
+                    v = int(n.replace(",", ""))
+                    if v > 100:
+                        total += v * multiplier
+                        found = True
+                continue
+            for n in re.findall(r"([\d,]{3,})", line):
+                v = int(n.replace(",", ""))
+                if v > 100:
+                    total += v * multiplier
+                    found = True
+    return total if found else None
+
+
+_INFOBOXES = [
+    "{{駅情報\n|乗降人員 = 1,234,567人<ref>2022年</ref>\n}}",
+    # 複数社: 乗降人員と乗車人員（×2）を合算し、<br> と注記をまたいで拾う
+    "{{駅情報\n|乗降人員 = '''JR'''：12,000人<br />'''メトロ'''：34,000人（2023年）\n|乗車人員 = 5,000人\n}}",
+    # 出典テンプレートの | で値が切れる
+    "|乗降人員 = 45,678人<ref>{{Cite web|title=2023年度|url=https://example.jp}}</ref>\n",
+    "|乗降人員 = 2,500人<ref name=\"jr\" />-{{0}}1,100人\n",
+    # 「人」がなければ3桁以上の数字。100以下は除く
+    "|乗車人員 = 8,765 {{small|（2022年）}}\n|乗降人員 = 99人\n",
+    # 年度だけの値も数字として拾う（従来どおり）。空の値は飛ばして次の項目を読む
+    "|乗降人員 = 2021年度\n|乗車人員 =\n|乗降人員=　\n",
+    "{{駅情報\n| 乗降人員  =   -\n}}\n",
+    "|乗降人員 = 12,345人<ref>\n2022年</ref>\n",
+    "本文だけで infobox のない記事",
+]
+
+
+def _dump_texts():
+    ns = "{http://www.mediawiki.org/xml/export-0.10/}"
+    with bz2.open(DUMP, "rb") as f:
+        root = ET.parse(f).getroot()
+    return [page.find(f"{ns}revision/{ns}text").text or "" for page in root.iter(f"{ns}page")]
+
+
+@pytest.mark.parametrize("wikitext", _INFOBOXES + _dump_texts())
+def test_matches_baseline_parser(wikitext):
+    assert parse_passenger_count(wikitext) == _baseline_parse(wikitext)
+
+
+def test_values():
+    assert [parse_passenger_count(t) for t in _INFOBOXES] == [
+        1234567, 56000, 45678, 3600, 17530, 2021, None, 12345, None,
+    ]
+
+
+def test_passenger_memo_is_saved_once_per_batch(monkeypatch, tmp_path):
+    cache = tmp_path / "wiki_passengers.json"
+    monkeypatch.setattr(city_mode, "PASSENGER_CACHE", str(cache))
+    monkeypatch.setattr(city_mode, "_passenger_memo", {})
+    monkeypatch.setattr(city_mode, "get_passenger_table", lambda: None)
+    monkeypatch.setattr(city_mode, "prefetch_pages", lambda titles: None)
+    monkeypatch.setattr(city_mode, "fetch_station_images", lambda name, subdir: [])
+    pages = {f"駅{i}駅": {"wikitext": f"|乗降人員 = {1000 + i}人\n", "revid": 100 + i} for i in range(5)}
+    monkeypatch.setattr(city_mode, "get_page", pages.get)
+    saves = []
+    save = city_mode._save_passenger_memo
+
+    def counting_save():
+        saves.append(city_mode._passenger_dirty)
+        save()
+
+    monkeypatch.setattr(city_mode, "_save_passenger_memo", counting_save)
+
+    assets = city_mode._fetch_all_station_assets({f"駅{i}": str(tmp_path / "out") for i in range(5)})
+    assert [pax["passengers"] for _, pax in assets.values()] == [1000, 1001, 1002, 1003, 1004]
+    # 駅ごとには書かず、全駅の取得後に1回だけ書く
+    assert saves == [True]
+    assert sorted(json.loads(cache.read_text(encoding="utf-8"))) == ["100", "101", "102", "103", "104"]
+
+    # 単独の呼び出しはその場で保存する
+    pages["駅5駅"] = {"wikitext": "|乗降人員 = 2000人\n", "revid": 105}
+    assert city_mode.fetch_passenger_count("駅5")["passengers"] == 2000
+    assert "105" in json.loads(cache.read_text(encoding="utf-8"))
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import transport_api
+from rail_graph import RailGraph
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "rail-overpass.json")
+
+# 別プロセスで構築し、グラフのハッシュとバイナリのハッシュを出力する
+_BUILD_SCRIPT = """
+import hashlib, json, sys
+import transport_api
+from rail_graph import RailGraph
+with open(sys.argv[1], encoding="utf-8") as f:
+    data = json.load(f)
+graph = RailGraph.from_dicts(*transport_api._build_graph_from_overpass(data, workers=1))
+graph.write_binary(sys.argv[2])
+with open(sys.argv[2], "rb") as f:
+    print(graph.content_hash(), hashlib.sha256(f.read()).hexdigest())
+"""
+
+
+@pytest.fixture(scope="module")
+def dicts():
+    with open(FIXTURE, encoding="utf-8") as f:
+        data = json.load(f)
+    return transport_api._build_graph_from_overpass(data, workers=1)
+
+
+def test_build_is_independent_of_hash_seed(tmp_path):
+    outputs = []
+    for seed in ("1", "2"):
+        env = {**os.environ, "PYTHONHASHSEED": seed}
+        proc = subprocess.run(
+            [sys.executable, "-c", _BUILD_SCRIPT, FIXTURE, str(tmp_path / f"graph{seed}.bin")],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        )
+        outputs.append(proc.stdout.split())
+    # 駅の乗り入れ路線は set なので、並べ方がシードに依存すると版が毎回変わる
+    assert outputs[0] == outputs[1]
+    assert (tmp_path / "graph1.bin").read_bytes() == (tmp_path / "graph2.bin").read_bytes()
+
+
+def test_binary_round_trip(dicts, tmp_path):
+    graph = RailGraph.from_dicts(*dicts)
+    path = str(tmp_path / "graph.bin")
+    graph.write_binary(path)
+
+    loaded = RailGraph.open_binary(path, graph.station_names, graph.railway_names)
+    assert loaded.content_hash() == graph.content_hash()
+    assert loaded.nbytes() == graph.nbytes()
+    for sid in range(len(graph.station_names)):
+        assert list(loaded.railways_of(sid)) == list(graph.railways_of(sid))
+
+    with pytest.raises(ValueError):
+        RailGraph.open_binary(path, graph.station_names[:-1], graph.railway_names)
+
+
+def test_views_match_dicts(dicts):
+    station_to_railways, railway_stations, station_coords = dicts
+    views = RailGraph.from_dicts(*dicts).views()
+    s2r, r2s, coords = views
+
+    assert dict(s2r) == {k: frozenset(v) for k, v in station_to_railways.items()}
+    assert dict(r2s) == railway_stations
+    assert dict(coords) == station_coords
+    assert len(s2r) == len(station_to_railways)
+    # 路線に属さない駅（座標だけある駅）は station_to_railways には出ない
+    coords_only = set(station_coords) - set(station_to_railways)
+    assert coords_only and not any(name in s2r for name in coords_only)
+    assert "存在しない駅" not in s2r and "存在しない駅" not in coords
@@ -0,0 +1,98 @@
+import random
+from collections import defaultdict, deque
+
+import pytest
+
+import transport_api
+from rail_graph import RailGraph
+
+
+def _reference_bfs(station_to_railways, railway_stations, station_coords, base, max_transfer, max_distance_km=None):
+    """逐次化する前の探索（駅名・路線名の dict の上で、max_transfer まで一度に探索する）"""
+    base_coord = station_coords.get(base) if max_distance_km is not None else None
+
+    def too_far(name):
+        coord = station_coords.get(name)
+        return bool(base_coord and coord) and transport_api._haversine_km(
+            base_coord["lat"], base_coord["lon"], coord["lat"], coord["lon"]
+        ) > max_distance_km
+
+    visited = {base: 0}
+    railway_map = defaultdict(set)
+    queue = deque((base, rw, 0) for rw in station_to_railways[base])
+    railway_map[base].update(station_to_railways[base])
+    processed = set()
+    while queue:
+        current, rw, transfers = queue.popleft()
+        if (current, rw) in processed:
+            continue
+        processed.add((current, rw))
+        if transfers > max_transfer:
+            continue
+        for name in railway_stations[rw]:
+            if too_far(name):
+                continue
+            visited[name] = min(visited.get(name, transfers), transfers)
+            railway_map[name].add(rw)
+            if transfers + 1 <= max_transfer:
+                for rw2 in station_to_railways[name]:
+                    if rw2 != rw and (name, rw2) not in processed:
+                        queue.append((name, rw2, transfers + 1))
+    return visited, dict(railway_map)
+
+
+def _random_network(seed, n_stations=120, n_railways=40):
+    """路線が駅を共有する乱数の路線網（一部は基準駅から80km以上離れた駅を含む）"""
+    rng = random.Random(seed)
+    names = [f"駅{i}" for i in range(n_stations)]
+    coords = {
+        name: {"lat": 35.0 + rng.uniform(0, 1.2), "lon": 139.0 + rng.uniform(0, 1.2)}
+        for name in names
+    }
+    railway_stations = {f"路線{r}": rng.sample(names, rng.randint(2, 8)) for r in range(n_railways)}
+    station_to_railways = defaultdict(set)
+    for rw, stations in railway_stations.items():
+        for name in stations:
+            station_to_railways[name].add(rw)
+    return dict(station_to_railways), railway_stations, coords
+
+
+def _levels(graph, base, max_transfer, max_distance_km):
+    names, rw_names = graph.station_names, graph.railway_names
+    for level, visited, railway_map in transport_api._bfs_levels_csr(
+        graph, graph.station_ids[base], max_transfer, max_distance_km
+    ):
+        # 返る dict は探索中に更新され続けるので、その場で名前に直して写す
+        yield level, (
+            {names[sid]: t for sid, t in visited.items()},
+            {names[sid]: {rw_names[r] for r in rids} for sid, rids in railway_map.items()},
+        )
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_distance_km", [None, 80])
+def test_each_level_matches_a_full_search(seed, max_distance_km):
+    dicts = _random_network(seed)
+    graph = RailGraph.from_dicts(*dicts)
+    for base in sorted(dicts[0])[:10]:
+        levels = list(_levels(graph, base, 6, max_distance_km))
+        assert [level for level, _ in levels] == list(range(7))
+        for level, snapshot in levels:
+            assert snapshot == _reference_bfs(*dicts, base, level, max_distance_km)
+
+
+def test_find_reachable_stations_on_fixture_graph(rail_data):
+    dicts = transport_api._build_graph_from_overpass(rail_data, workers=1)
+    reachable, railway_map, matched, transfers = transport_api.find_reachable_stations("赤坂(東京)", 2, *dicts)
+
+    assert matched == "赤坂(東京)"
+    expected_transfers, expected_railways = _reference_bfs(*dicts, "赤坂(東京)", 2, 80)
+    assert transfers == expected_transfers and dict(railway_map) == expected_railways
+    assert transfers["表参道"] == 0 and transfers["渋谷"] == 1 and transfers["原宿"] == 2
+    # 同名の赤坂(福岡)の路線にはつながらない
+    assert "天神" not in transfers
+    assert reachable == sorted(reachable, key=transfers.get)
+
+    # 逐次版の最後の結果は一括版と同じ
+    *_, (last_level, last) = transport_api.iter_find_reachable_stations("赤坂(東京)", 2, *dicts)
+    assert last_level == 2 and last[3] == transfers
@@ -0,0 +1,41 @@
+import transport_api
+
+
+def _reload():
+    transport_api._artifact_memo.clear()
+    return transport_api.fetch_rail_graph()
+
+
+def test_same_name_table_is_built_with_the_graph(built_graph):
+    table = transport_api.get_same_name_table()
+
+    assert list(table) == ["赤坂"]
+    by_name = {v["name"]: v for v in table["赤坂"]}
+    assert set(by_name) == {"赤坂(東京)", "赤坂(福岡)"}
+    assert by_name["赤坂(福岡)"]["railways"] == ["福岡市地下鉄空港線"]
+    assert by_name["赤坂(福岡)"]["label"] == "赤坂(福岡)（福岡市地下鉄空港線）"
+    assert round(by_name["赤坂(東京)"]["lat"], 4) == 35.6721
+
+
+def test_candidates_and_base_names(built_graph):
+    names = [c["name"] for c in transport_api.find_station_candidates("赤坂")]
+    assert sorted(names) == ["赤坂(東京)", "赤坂(福岡)"]
+    # 同名駅でない駅名は完全一致の1件だけ
+    assert [c["name"] for c in transport_api.find_station_candidates("赤坂見附")] == ["赤坂見附"]
+
+    assert transport_api.base_station_name("赤坂(福岡)") == "赤坂"
+    assert transport_api.base_station_name("天神") == "天神"
+
+
+def test_old_cache_rebuilds_table_from_station_names(built_graph, monkeypatch):
+    expected = transport_api.get_same_name_table()
+    artifact, graph = transport_api._artifact_memo["artifact"], transport_api._artifact_memo["graph"]
+    artifact = {k: v for k, v in artifact.items() if k != "same_name"}
+    transport_api._save_graph_artifact(artifact, graph)
+
+    _reload()
+    assert transport_api.get_same_name_table() == expected
+    # 作り直した表はキャッシュに書き戻すので、次回は計算しない
+    monkeypatch.setattr(transport_api, "build_same_name_table", None)
+    _reload()
+    assert transport_api.get_same_name_table() == expected
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+import station_mode
+
+
+@pytest.fixture
+def output_dir(built_graph, monkeypatch):
+    path = built_graph / "station"
+    monkeypatch.setattr(station_mode, "STATION_OUTPUT_DIR", str(path))
+    return path
+
+
+def _stations(result):
+    return {s["name"]: (s["transfers"], s["travel_time"]) for s in result["stations"]}
+
+
+def test_filter_result_by_transfer(output_dir):
+    full = station_mode.run_station_mode("赤坂(東京)", 2)
+    assert full["max_transfer"] == 2
+    assert {t for t, _ in _stations(full).values()} >= {0, 1}
+
+    for n in range(3):
+        filtered = station_mode.filter_result_by_transfer(full, n)
+        searched = station_mode.run_station_mode("赤坂(東京)", n, use_cache=False)
+        assert filtered["max_transfer"] == n
+        assert _stations(filtered) == _stations(searched)
+        assert filtered["total_stations"] == searched["total_stations"]
+        assert all(rw["stations"] for rw in filtered["railways"])
+
+
+def test_fewer_transfers_reuse_a_deeper_saved_result(output_dir, monkeypatch):
+    full = station_mode.run_station_mode("赤坂(東京)", station_mode.MAX_TRANSFER_LEVEL)
+    assert os.listdir(output_dir) == [f"赤坂(東京)_{station_mode.MAX_TRANSFER_LEVEL}transfer.json"]
+
+    def no_search(*args, **kwargs):
+        raise AssertionError("保存済みの結果があれば探索しない")
+
+    monkeypatch.setattr(station_mode, "iter_reachable_stations", no_search)
+    result = station_mode.run_station_mode("赤坂(東京)", 1)
+    # 要求した回数の結果として返す
+    assert result["max_transfer"] == 1
+    assert _stations(result) == _stations(station_mode.filter_result_by_transfer(full, 1))
+    assert len(os.listdir(output_dir)) == 1
@@ -0,0 +1,24 @@
+import pytest
+
+from transport_api import normalize_station_name
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("新宿駅", "新宿"),
+        ("Shinjuku Station", "shinjuku"),
+        ("Ｓｈｉｎｊｕｋｕ　ｓｔａｔｉｏｎ", "shinjuku"),
+        ("Higashi-Ginza Sta.", "higashiginza"),
+        ("シンジュク", "しんじゅく"),
+        ("Ōsaka", "osaka"),
+        # 読み・ローマ字の末尾の "えき" / "sta" / "station" は区切りがなければ駅名の一部
+        ("まえき", "まえき"),
+        ("Costa", "costa"),
+        ("Kamata Sta", "kamatasta"),
+        ("Railstation", "railstation"),
+        ("駅", "駅"),
+    ],
+)
+def test_normalize_station_name(name, expected):
+    assert normalize_station_name(name) == expected
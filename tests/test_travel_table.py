@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import transport_api
+from travel_table import TravelTable
+
+_ROWS = [
+    [(0, 0, 0), (1, 3, 0), (3, 12, 1)],
+    [],
+    [(0, 70000, 300), (2, 0, 0)],
+    [(3, 0, 0)],
+]
+
+
+def _write(path, graph_hash="abcd1234abcd1234", rows=_ROWS):
+    TravelTable.from_rows(graph_hash, 90, rows).write(path)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "table.bin")
+    _write(path)
+    table = TravelTable.open(path)
+
+    assert table.graph_hash == "abcd1234abcd1234"
+    assert table.max_minutes == 90
+    assert len(table) == 4
+    assert table.row(0) == [(0, 0, 0), (1, 3, 0), (3, 12, 1)]
+    assert table.row(1) == []
+    # uint16 / uint8 に収まらない値は上限で止める
+    assert table.row(2) == [(0, 0xFFFF, 0xFF), (2, 0, 0)]
+    assert table.nbytes() == TravelTable.from_rows("abcd1234abcd1234", 90, _ROWS).nbytes()
+
+
+def test_lookup(tmp_path):
+    path = str(tmp_path / "table.bin")
+    _write(path)
+    table = TravelTable.open(path)
+
+    assert table.lookup(0, 3) == (12, 1)
+    assert table.lookup(0, 2) is None
+    assert table.lookup(1, 0) is None
+    # 行の境界をまたいで次の始点の行を拾わない
+    assert table.lookup(2, 3) is None
+    assert table.lookup(3, 3) == (0, 0)
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / "table.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        TravelTable.open(str(path))
+
+
+@pytest.fixture
+def cached_table(monkeypatch, tmp_path):
+    """get_travel_table が一時ディレクトリの表を、グラフなしで開くようにする"""
+    path = str(tmp_path / "table.bin")
+    _write(path)
+    monkeypatch.setattr(transport_api, "TRAVEL_TABLE", path)
+    monkeypatch.setattr(transport_api, "fetch_rail_graph", lambda use_cache=True: None)
+    monkeypatch.setattr(transport_api, "_travel_version", lambda: "abcd1234abcd1234")
+    monkeypatch.setattr(transport_api, "_travel_table_memo", {})
+    return path
+
+
+def test_get_travel_table_reloads_on_mtime(cached_table):
+    first = transport_api.get_travel_table()
+    assert first is transport_api.get_travel_table()
+
+    _write(cached_table, rows=_ROWS[:2])
+    st = os.stat(cached_table)
+    os.utime(cached_table, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert len(transport_api.get_travel_table()) == 2
+
+
+def test_get_travel_table_while_memo_is_replaced(cached_table):
+    # build_travel_table と同じ差し替えを別スレッドから繰り返しても、読み込み側は表を受け取れる
+    # （スレッドの切り替えを細かくして競合を起こしやすくする）
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    errors = []
+    stop = threading.Event()
+
+    def reader():
+        try:
+            while not stop.is_set():
+                assert transport_api.get_travel_table() is not None
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        until = time.monotonic() + 0.5
+        while time.monotonic() < until:
+            with transport_api._memo_lock:
+                transport_api._replace_memo(transport_api._travel_table_memo)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        sys.setswitchinterval(interval)
+    assert errors == []
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+import pytest
+import requests
+
+import wiki_client
+
+_SHIBUYA = "{{駅情報\n| 駅名 = 渋谷駅\n| 乗降人員 = 1,000,000人\n}}"
+
+# 1回目: 正規化・リダイレクトと渋谷駅の本文。本文の続き（明治神宮前駅）は continue で2回目に返る
+_RESPONSES = [
+    {
+        "continue": {"rvcontinue": "1|2", "continue": "||"},
+        "query": {
+            "normalized": [{"from": "明治神宮前_〈原宿〉駅", "to": "明治神宮前 〈原宿〉駅"}],
+            "redirects": [
+                {"from": "明治神宮前 〈原宿〉駅", "to": "明治神宮前駅"},
+                {"from": "JR渋谷駅", "to": "渋谷駅"},
+                {"from": "循環A", "to": "循環B"},
+                {"from": "循環B", "to": "循環A"},
+            ],
+            "pages": [
+                {"title": "渋谷駅", "revisions": [{"revid": 11, "slots": {"main": {"content": _SHIBUYA}}}],
+                 "original": {"source": "https://upload.example/shibuya.jpg", "width": 800, "height": 600}},
+                {"title": "明治神宮前駅"},
+                {"title": "存在しない駅", "missing": True},
+            ],
+        },
+    },
+    {
+        "query": {
+            "pages": [
+                {"title": "明治神宮前駅", "revisions": [{"revid": 22, "slots": {"main": {"content": "本文"}}}]},
+            ],
+        },
+    },
+]
+
+
+class _Api:
+    """Wikipedia API の代わりに決まった応答を順に返す"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, headers=None):
+        self.calls.append(params)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.json = lambda payload=self.responses.pop(0): payload
+        return resp
+
+
+@pytest.fixture
+def api(monkeypatch):
+    def setup(responses=_RESPONSES):
+        api = _Api(responses)
+        monkeypatch.setattr(wiki_client.http_client, "get", api.get)
+        return api
+
+    monkeypatch.setattr(wiki_client, "_page_cache", OrderedDict())
+    return setup
+
+
+_TITLES = ["渋谷駅", "明治神宮前_〈原宿〉駅", "JR渋谷駅", "存在しない駅", "循環A"]
+
+
+def test_query_batch_resolves_normalized_titles_and_redirects(api):
+    calls = api().calls
+    result = wiki_client._query_batch(_TITLES)
+
+    assert list(result) == _TITLES
+    assert result["渋谷駅"]["revid"] == 11 and result["渋谷駅"]["image_size"] == (800, 600)
+    # 正規化 → リダイレクトの順にたどり、続きの応答で届いた本文も同じ記事に入る
+    assert result["明治神宮前_〈原宿〉駅"]["title"] == "明治神宮前駅"
+    assert result["明治神宮前_〈原宿〉駅"]["wikitext"] == "本文"
+    assert result["JR渋谷駅"] is result["渋谷駅"]
+    assert result["存在しない駅"]["missing"] and result["存在しない駅"]["wikitext"] is None
+    # 循環するリダイレクトは途中で止め、記事なしとして返す
+    assert result["循環A"]["missing"]
+
+    assert len(calls) == 2
+    assert calls[0]["titles"] == "|".join(_TITLES) and calls[0]["rvsection"] == 0
+    assert calls[1]["rvcontinue"] == "1|2"
+
+
+def test_prefetch_caches_every_requested_title(api):
+    calls = api().calls
+    assert wiki_client.prefetch_pages(_TITLES + ["渋谷駅"]) == 1
+    assert len(calls) == 2
+
+    # 取得済みのタイトルは問い合わせない
+    assert wiki_client.prefetch_pages(["JR渋谷駅"]) == 0
+    page = wiki_client.get_page("JR渋谷駅")
+    assert page["title"] == "渋谷駅"
+    assert wiki_client.parse_passenger_count(page["wikitext"]) == 1_000_000
+    assert len(calls) == 2
+
+
+def test_probe_lead_images_skips_content(api):
+    calls = api(_RESPONSES[:1] + [{"query": {"pages": []}}]).calls
+    images = wiki_client.probe_lead_images(["JR渋谷駅", "明治神宮前_〈原宿〉駅"])
+
+    assert images == {
+        "JR渋谷駅": {"url": "https://upload.example/shibuya.jpg", "width": 800, "height": 600},
+        "明治神宮前_〈原宿〉駅": None,
+    }
+    assert calls[0]["prop"] == "pageimages" and "rvprop" not in calls[0]
+    # 本文を取らない問い合わせはキャッシュしない
+    assert not wiki_client._page_cache
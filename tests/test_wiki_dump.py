@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+import transport_api
+from wiki_dump import load_passenger_articles
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "jawiki-stations.xml.bz2")
+
+# 同名駅 "赤坂" は地域名付きの表示名で2駅ある
+_STATIONS = ["渋谷", "赤坂(東京)", "赤坂(福岡)", "明治神宮前", "新宿", "池袋"]
+_SAME_NAME = {"赤坂": [{"name": "赤坂(東京)"}, {"name": "赤坂(福岡)"}]}
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """_match_passenger_articles が参照するグラフを小さな駅一覧に差し替える"""
+    station_to_railways = {name: ["路線"] for name in _STATIONS}
+    monkeypatch.setattr(transport_api, "fetch_rail_graph", lambda use_cache=True: (station_to_railways, {}, {}))
+    monkeypatch.setattr(transport_api, "_artifact_memo", {"artifact": {"same_name": _SAME_NAME}})
+
+
+def test_load_passenger_articles():
+    articles, redirects = load_passenger_articles(FIXTURE)
+
+    assert articles == {
+        # 「== 歴史 ==」以降の値は冒頭節の外なので使わない
+        "渋谷駅": {"passengers": 1234567, "revid": 100},
+        "赤坂駅 (東京都)": {"passengers": 50000, "revid": 200},
+        # 乗車人員は×2で乗降換算
+        "赤坂駅 (福岡県)": {"passengers": 10000, "revid": 300},
+        "明治神宮前〈原宿〉駅": {"passengers": 80000, "revid": 400},
+    }
+    # ノート名前空間（ns=1）、冒頭節に値のない記事、駅記事でないタイトルは含まない
+    assert redirects == {"明治神宮前駅": "明治神宮前〈原宿〉駅"}
+
+
+def test_match_passenger_articles(graph):
+    articles, redirects = load_passenger_articles(FIXTURE)
+
+    stations = transport_api._match_passenger_articles(articles, redirects)
+
+    assert {name: s["title"] for name, s in stations.items()} == {
+        "渋谷": "渋谷駅",
+        # 括弧付きの記事は同名駅の地域名で振り分ける
+        "赤坂(東京)": "赤坂駅 (東京都)",
+        "赤坂(福岡)": "赤坂駅 (福岡県)",
+        # リダイレクト元のタイトルからリダイレクト先の記事に対応づける
+        "明治神宮前": "明治神宮前〈原宿〉駅",
+    }
+    assert stations["赤坂(福岡)"]["passengers"] == 10000
+    assert "新宿" not in stations and "池袋" not in stations
+
+
+def test_missing_dump():
+    with pytest.raises(FileNotFoundError):
+        load_passenger_articles(os.path.join(os.path.dirname(__file__), "fixtures", "missing.xml.bz2"))
@@ -3,68 +3,308 @@
 APIキー不要で全国対応
 """
 import difflib
+import gzip
+import hashlib
+import heapq
 import json
 import math
 import os
+import random
+import re
+import struct
+import time
+import unicodedata
 import logging
+import threading
 from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 
 import requests
 
-from config import OVERPASS_API_URL, OUTPUT_DIR
+import http_client
+from rail_graph import RailGraph
+from travel_table import TravelTable
+from config import (
+    OVERPASS_API_URL,
+    OVERPASS_FETCH_MODE,
+    GRAPH_BUILD_WORKERS,
+    OSM_EXTRACT_PATH,
+    GTFS_FEEDS,
+    MUNICIPAL_BOUNDARIES,
+    OUTPUT_DIR,
+)
 
 logger = logging.getLogger("store-traffic")
 
 CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache")
+# 成果物: JSONヘッダ（メタデータ・駅名/路線名テーブル）+ CSR配列のバイナリ（mmapで参照）
+#   + 大きな表（_ARTIFACT_TABLES）のJSON（最初に参照したときに読む）。
+# バイナリと表のファイル名は保存ごとに変え、ヘッダを最後に差し替えるので、ヘッダは常に揃った組を指す
 GRAPH_CACHE = os.path.join(CACHE_DIR, "osm_rail_graph.json")
+GRAPH_FORMAT = 3
+_GRAPH_FILE_PREFIX = "osm_rail_graph."
+# 旧形式（format 2: ヘッダに表もすべて入れ、バイナリは固定名）のバイナリ
+_LEGACY_GRAPH_BIN = os.path.join(CACHE_DIR, "osm_rail_graph.bin")
+# ヘッダに入れず別ファイルに置く表
+_ARTIFACT_TABLES = ("centrality", "same_name", "name_index", "municipalities", "edge_weights")
+# グラフの版ごとの駅ダイジェスト（保存済み結果の差分再計算用）
+GRAPH_VERSIONS_DIR = os.path.join(CACHE_DIR, "graph_versions")
+# Overpassの生レスポンス（gzip）と取得日時。グラフ構築ロジック変更時は再取得せずここから再構築する
+RAW_ARCHIVE = os.path.join(CACHE_DIR, "osm_rail_raw.ndjson.gz")
+# レスポンス全体を1つのJSONで保存していた旧形式（読み込むときに RAW_ARCHIVE に変換する）
+_LEGACY_RAW_ARCHIVE = os.path.join(CACHE_DIR, "osm_rail_raw.json.gz")
+RAW_ARCHIVE_META = os.path.join(CACHE_DIR, "osm_rail_raw.meta.json")
+# 全駅発の移動時間表（build_travel_table で作成。グラフの版が変わったら作り直す）
+TRAVEL_TABLE = os.path.join(CACHE_DIR, "osm_travel_table.bin")
+TRAVEL_TABLE_MINUTES = 90  # 表に載せる所要時間の上限（駅別モードの上限と揃える）
+# Wikipediaダンプから抽出した全国の駅の乗降客数表（build_passenger_table で作成）
+PASSENGER_TABLE = os.path.join(CACHE_DIR, "passenger_table.json")
+
+# 移動時間推定の前提（station_mode._estimate_travel_time と揃える）
+ROUTE_DETOUR_FACTOR = 1.3  # 直線距離 → 線路距離の迂回係数
+TRAIN_SPEED_KMH = 60  # 平均速度
+TRANSFER_PENALTY_MIN = 5  # 乗り換え1回あたりの加算（分）
+FALLBACK_MIN_PER_STATION = 2.5  # 座標がない区間の1駅あたり時間（分）
+WALK_SPEED_KMH = 4.8  # 徒歩速度（店舗→駅のアクセス時間）
+
+# GTFS停留所 → 駅の対応づけ: 同名駅はこの距離以内、名前で見つからなければ最寄り駅をこの距離以内で採用
+GTFS_NAME_MATCH_KM = 2.0
+GTFS_NEAREST_MATCH_KM = 0.3
+
+# 最寄り駅検索用グリッドのセルサイズ（度）
+_GRID_CELL_DEG = 0.02
+
+# これ未満のrelation数ならプロセス並列化しない（起動コストの方が大きい）
+PARALLEL_MIN_RELATIONS = 2000
+# 移動時間表の作成で、始点駅数がこれ未満ならプロセス並列化しない
+# （始点1駅ごとに上限時間までの探索をするので、relationの処理より1件あたりが重い）
+TRAVEL_TABLE_PARALLEL_MIN_STATIONS = 500
+
+# 近似媒介中心性の計算に使うサンプル駅数
+CENTRALITY_SAMPLES = 200
+
+# 駅名の別表記として索引に入れるOSMタグ（ローマ字・ひらがな・カタカナ）
+_NAME_ALIAS_TAGS = ("name:en", "name:ja-Latn", "name:ja_rm", "name:ja-Hira", "name:ja_kana", "name:ja-Kana")
+# 駅名中の括弧書き（〈東京メトロ〉・(東京) など）
+_NAME_BRACKETS_RE = re.compile(r"[〈《(\[［【「][^〉》)\]］】」]*[〉》)\]］】」]")
+# 末尾の "駅" と、区切り（空白・ハイフンなど）のあとの "station" / "sta."（読み・ローマ字の末尾の "えき" / "sta" は駅名の一部なので削らない）
+_NAME_SUFFIX_RE = re.compile(r"(?:駅|[\s\-_・]+(?:station|sta\.))$")
+# 駅名索引の正規化の版（normalize_station_name を変えたら上げる。古い索引は駅名自体の表記を足し直す）
+_NAME_INDEX_VERSION = 2
+# カタカナ → ひらがな、ローマ字の長音記号 → 母音
+_NAME_TRANSLATE = str.maketrans(
+    {**{chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F7)},
+     **dict(zip("āīūēōâîûêô", "aiueoaiueo")),
+     **{c: None for c in " -・'’.　"}}
+)
+
+# Wikipediaの駅記事タイトル "X駅" / "X駅 (東京都)" → (X, 括弧内)
+_WIKI_STATION_TITLE_RE = re.compile(r"^(.+?)駅(?: \((.+)\))?$")
+
+# プロセス内で読み込み済みのグラフ成果物（mtime / artifact / graph / centrality / edge_minutes / travel_graph）
+_artifact_memo = {}
+# プロセス内で読み込み済みの移動時間表（mtime / table）
+_travel_table_memo = {}
+# プロセス内で読み込み済みの乗降客数表（mtime / graph_hash / stations）
+_passenger_table_memo = {}
+# _artifact_memo / _travel_table_memo / _passenger_table_memo の読み込み・派生値の作成・差し替えはこのロック内で行う
+# （市区別モードのワーカースレッドや Streamlit の各セッションから同時に呼ばれるため）
+_memo_lock = threading.RLock()
+
+
+def _replace_memo(memo, **values):
+    """memo の中身を values に差し替える（上書きしてから古いキーを消すので、読み込み済みのキーが途中で消えない）"""
+    memo.update(values)
+    for key in [k for k in memo if k not in values]:
+        del memo[key]
 
 
 def _ensure_cache_dir():
     os.makedirs(CACHE_DIR, exist_ok=True)
 
 
-def _fetch_rail_data_from_overpass():
-    """
-    Overpass APIから関東エリアの鉄道路線・駅データを取得
-    route=train/subway/light_rail/monorail の relation を取得し、
-    メンバーの stop ノードから駅名を収集する
-    """
-    logger.info("Overpass APIから鉄道データを取得中...")
+# 対象とする路線relationの種別
+_ROUTE_TYPES = ("train", "subway", "light_rail", "monorail", "railway")
 
-    # 日本全国
-    bbox = "24.0,122.0,46.0,146.0"
 
-    query = f"""
+def _build_overpass_rail_query(bbox, mode):
+    """
+    全国鉄道データ取得用のOverpass QLを組み立てる
+
+    mode:
+        "full": relation と再帰メンバー（way・線路ノード含む）を全て out body で取得
+        "lean": グラフ構築に必要なものだけ取得
+                - relation: メンバー順・role と name/ref/operator/route タグ（out body）
+                - node: railway=station/halt/stop かつ name 付きのみ（座標+タグ）。relation の直接の
+                  メンバーに加え、メンバーの way を構成するノードからも拾う（full の再帰で得られる駅ノードと同じ集合。
+                  同名駅の分離・駅座標に効く）
+                way 自体と線路形状ノードは取得しない
+    """
+    relations = "\n".join(
+        f'      relation["type"="route"]["route"="{rt}"];' for rt in _ROUTE_TYPES
+    )
+    if mode == "full":
+        return f"""
     [out:json][timeout:300][bbox:{bbox}];
     (
-      relation["type"="route"]["route"="train"];
-      relation["type"="route"]["route"="subway"];
-      relation["type"="route"]["route"="light_rail"];
-      relation["type"="route"]["route"="monorail"];
-      relation["type"="route"]["route"="railway"];
+{relations}
     );
     out body;
     >;
     out body qt;
     """
+    return f"""
+    [out:json][timeout:300][bbox:{bbox}];
+    (
+{relations}
+    )->.routes;
+    .routes out body;
+    way(r.routes)->.route_ways;
+    (
+      node(r.routes)["railway"~"^(station|halt|stop)$"]["name"];
+      node(w.route_ways)["railway"~"^(station|halt|stop)$"]["name"];
+    );
+    out body qt;
+    """
+
+
+def _fetch_rail_data_from_overpass(mode=None):
+    """
+    Overpass APIから全国の鉄道路線・駅データを取得
+    route=train/subway/light_rail/monorail の relation を取得し、
+    メンバーの stop ノードから駅名を収集する
+
+    Args:
+        mode: "lean"（既定。必要な要素だけ取得）/ "full"（従来どおり全メンバー取得）
+    """
+    mode = mode or OVERPASS_FETCH_MODE
+    logger.info(f"Overpass APIから鉄道データを取得中...（{mode}）")
+
+    # 日本全国
+    bbox = "24.0,122.0,46.0,146.0"
+    query = _build_overpass_rail_query(bbox, mode)
 
     try:
-        resp = requests.post(
+        t0 = time.perf_counter()
+        resp = http_client.post(
             OVERPASS_API_URL,
             data={"data": query},
             timeout=240,
         )
         resp.raise_for_status()
-        return resp.json()
+        raw = resp.content
+        t1 = time.perf_counter()
+        data = json.loads(raw)
+        t2 = time.perf_counter()
     except requests.RequestException as e:
         logger.error(f"Overpass APIエラー: {e}")
         raise
 
+    logger.info(
+        f"Overpass応答（{mode}）: {len(raw) / 1e6:.1f}MB, "
+        f"{len(data.get('elements', []))}要素, 取得{t1 - t0:.1f}秒, JSON解析{t2 - t1:.2f}秒"
+    )
+    _archive_overpass_response(data, len(raw), mode)
+    return data
+
+
+def _write_raw_archive(data):
+    """
+    Overpassレスポンスを1行1要素のNDJSON（gzip圧縮）で保存する
+    1行目は elements 以外のキー（version / osm3s など）、2行目以降が要素
+    """
+    _ensure_cache_dir()
+    tmp_path = RAW_ARCHIVE + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(json.dumps({k: v for k, v in data.items() if k != "elements"}, ensure_ascii=False) + "\n")
+        for elem in data.get("elements", []):
+            f.write(json.dumps(elem, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, RAW_ARCHIVE)
+
+
+def _archive_overpass_response(data, raw_bytes, mode):
+    """Overpassのレスポンスをgzip圧縮のNDJSONで保存し、取得日時をメタデータに記録する"""
+    _write_raw_archive(data)
+
+    meta = {
+        "fetched_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "mode": mode,
+        "bytes": raw_bytes,
+        "compressed_bytes": os.path.getsize(RAW_ARCHIVE),
+    }
+    with open(RAW_ARCHIVE_META, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    logger.info(f"生レスポンス保存: {RAW_ARCHIVE}（{meta['compressed_bytes'] / 1e6:.1f}MB）")
+
+
+def _load_archive_meta():
+    """生レスポンスの取得時メタデータ（なければ空dict）"""
+    if not os.path.exists(RAW_ARCHIVE_META):
+        return {}
+    with open(RAW_ARCHIVE_META, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def has_overpass_archive():
+    """保存済みの生レスポンスがあるか（旧形式を含む）"""
+    return os.path.exists(RAW_ARCHIVE) or os.path.exists(_LEGACY_RAW_ARCHIVE)
 
-def _build_graph_from_overpass(data):
+
+def _convert_legacy_archive():
+    """旧形式（1つのJSON）の生レスポンスを NDJSON に変換する（変換時の1回だけ全体を読み込む）"""
+    logger.info(f"生レスポンスを1行1要素の形式に変換します: {_LEGACY_RAW_ARCHIVE}")
+    with gzip.open(_LEGACY_RAW_ARCHIVE, "rb") as f:
+        data = json.load(f)
+    _write_raw_archive(data)
+    os.remove(_LEGACY_RAW_ARCHIVE)
+
+
+def load_overpass_archive():
+    """
+    保存済みの生レスポンスを1行（1要素）ずつ展開しながら読み込む
+    （展開後の全文をメモリに置かないので、全国分でも要素の dict の分しか使わない）
+
+    Returns:
+        (data, meta): Overpassレスポンス（dict）と取得時メタデータ
+    """
+    if not os.path.exists(RAW_ARCHIVE) and os.path.exists(_LEGACY_RAW_ARCHIVE):
+        _convert_legacy_archive()
+    with gzip.open(RAW_ARCHIVE, "rt", encoding="utf-8") as f:
+        data = json.loads(next(f, "{}"))
+        data["elements"] = [json.loads(line) for line in f if line.strip()]
+    return data, _load_archive_meta()
+
+
+# 地域判定用テーブル (lat, lon の範囲 → 地域名)  ※先頭から順にマッチ、狭い範囲を先に
+_REGION_TABLE = [
+    ((33.45, 33.75, 130.2, 130.6), "福岡"),
+    ((34.6, 34.8, 135.3, 135.6), "大阪"),
+    ((34.9, 35.1, 136.8, 137.0), "名古屋"),
+    ((35.6, 35.82, 139.5, 140.0), "東京"),
+    ((35.35, 35.6, 139.3, 139.8), "神奈川"),
+    ((35.8, 36.1, 139.5, 140.2), "埼玉"),
+    ((35.5, 35.9, 139.9, 140.3), "千葉"),
+    ((35.0, 35.6, 138.5, 139.3), "山梨"),
+    ((42.5, 46.0, 139.0, 146.0), "北海道"),
+    ((38.5, 42.5, 139.0, 141.5), "東北"),
+    ((36.0, 37.5, 139.0, 140.5), "北関東"),
+    ((35.0, 36.5, 136.5, 138.5), "中部"),
+    ((34.5, 35.5, 134.5, 136.5), "関西"),
+    ((33.5, 35.0, 130.5, 135.0), "中国"),
+    ((33.0, 34.5, 132.0, 134.5), "四国"),
+    ((31.0, 34.0, 129.5, 132.0), "九州"),
+]
+
+
+def _build_graph_from_overpass(data, workers=None, same_name_groups=None, station_aliases=None):
     """
     Overpassレスポンスからグラフを構築
     同名駅（座標が50km以上離れている）は地域名を付加して区別する
+    路線relationごとの処理は workers プロセスで並列化する（Noneなら設定値）
+    same_name_groups に dict を渡すと、分離した同名駅を {元の駅名: [表示名, ...]} で受け取れる
+    station_aliases に dict を渡すと、駅の別表記（name:en など）を {表示名: set[表記]} で受け取れる
 
     Returns:
         station_to_railways: dict[駅名] -> set[路線名]
@@ -74,6 +314,7 @@ def _build_graph_from_overpass(data):
     # node ID → 駅名マッピング（railway=stop/station/halt すべて対象）
     node_names_raw = {}  # node_id -> clean_name (元の名前)
     node_coords = {}  # node ID → {lat, lon}
+    node_aliases = {}  # node ID → [別表記]
     for elem in data.get("elements", []):
         if elem.get("type") == "node":
             tags = elem.get("tags", {})
@@ -82,6 +323,8 @@ def _build_graph_from_overpass(data):
             if name and railway in ("station", "halt", "stop"):
                 clean = name.rstrip("駅")
                 node_names_raw[elem["id"]] = clean
+                if station_aliases is not None:
+                    node_aliases[elem["id"]] = [name] + [v for k in _NAME_ALIAS_TAGS for v in tags.get(k, "").split(";") if v]
                 if "lat" in elem and "lon" in elem:
                     node_coords[elem["id"]] = {"lat": elem["lat"], "lon": elem["lon"]}
 
@@ -96,26 +339,6 @@ def _build_graph_from_overpass(data):
         else:
             name_to_nodes[cname].append((nid, None, None))
 
-    # 地域判定用テーブル (lat, lon の範囲 → 地域名)  ※先頭から順にマッチ、狭い範囲を先に
-    _REGION_TABLE = [
-        ((33.45, 33.75, 130.2, 130.6), "福岡"),
-        ((34.6, 34.8, 135.3, 135.6), "大阪"),
-        ((34.9, 35.1, 136.8, 137.0), "名古屋"),
-        ((35.6, 35.82, 139.5, 140.0), "東京"),
-        ((35.35, 35.6, 139.3, 139.8), "神奈川"),
-        ((35.8, 36.1, 139.5, 140.2), "埼玉"),
-        ((35.5, 35.9, 139.9, 140.3), "千葉"),
-        ((35.0, 35.6, 138.5, 139.3), "山梨"),
-        ((42.5, 46.0, 139.0, 146.0), "北海道"),
-        ((38.5, 42.5, 139.0, 141.5), "東北"),
-        ((36.0, 37.5, 139.0, 140.5), "北関東"),
-        ((35.0, 36.5, 136.5, 138.5), "中部"),
-        ((34.5, 35.5, 134.5, 136.5), "関西"),
-        ((33.5, 35.0, 130.5, 135.0), "中国"),
-        ((33.0, 34.5, 132.0, 134.5), "四国"),
-        ((31.0, 34.0, 129.5, 132.0), "九州"),
-    ]
-
     def _get_region(lat, lon):
         if lat is None or lon is None:
             return ""
@@ -157,6 +380,7 @@ def _build_graph_from_overpass(data):
             # 複数クラスタ → 地域名を付加
             # 同じ地域名が重複する場合は連番で区別
             used_names = {}
+            variants = []
             for clat, clon, member_nids in clusters:
                 region = _get_region(clat, clon)
                 base_suffix = f"{cname}({region})" if region else cname
@@ -168,80 +392,50 @@ def _build_graph_from_overpass(data):
                     suffix_name = base_suffix
                 for nid in member_nids:
                     node_names[nid] = suffix_name
+                if suffix_name not in variants:
+                    variants.append(suffix_name)
+            if same_name_groups is not None and len(variants) > 1:
+                same_name_groups[cname] = variants
+
+    # 路線(relation)ごとの駅順序づけ（relation間で独立なのでプロセス並列化できる）
+    relations = [
+        elem for elem in data.get("elements", [])
+        if elem.get("type") == "relation" and elem.get("tags", {}).get("route", "") in _ROUTE_TYPES
+    ]
+    t0 = time.perf_counter()
+    routes, used_workers = _order_routes(relations, node_names, node_coords, workers)
+    logger.info(f"路線処理: {len(relations)}relation, {used_workers}プロセス, {time.perf_counter() - t0:.2f}秒")
 
-    # 路線(relation)から駅順序を構築
+    # 路線名ごとにマージ（relationの出現順に処理するので並列数によらず同じ結果になる）
     railway_stations = {}
     station_to_railways = defaultdict(set)
 
-    for elem in data.get("elements", []):
-        if elem.get("type") != "relation":
-            continue
-
-        tags = elem.get("tags", {})
-        route_type = tags.get("route", "")
-        if route_type not in ("train", "subway", "light_rail", "monorail", "railway"):
+    for route in routes:
+        if route is None:
             continue
+        base_name, ordered = route
 
-        route_name = tags.get("name", "")
-        if not route_name:
-            ref = tags.get("ref", "")
-            operator = tags.get("operator", "")
-            route_name = f"{operator} {ref}".strip() or f"route_{elem['id']}"
-
-        # 上り/下りで重複するのでユニーク化
-        # "東京メトロ銀座線 : 浅草→渋谷" → "東京メトロ銀座線"
-        base_name = route_name.split(" : ")[0].split("：")[0].strip()
-
-        members = elem.get("members", [])
-        # まず路線のメンバーノードIDと座標を収集
-        member_nids = []
-        for m in members:
-            role = m.get("role", "")
-            is_stop_role = role in ("stop", "stop_entry_only", "stop_exit_only", "platform", "platform_entry_only", "platform_exit_only")
-            is_railway_member = route_type == "railway" and m.get("type") == "node"
-            if m.get("type") == "node" and (is_stop_role or is_railway_member):
-                nid = m.get("ref")
-                if nid in node_names:
-                    member_nids.append(nid)
-
-        # 路線の重心を計算し、重心から150km以上離れたノードを除外（OSMデータ誤り対策）
-        route_coords = [node_coords[nid] for nid in member_nids if nid in node_coords]
-        route_valid_nids = set(member_nids)
-        if len(route_coords) >= 3:
-            med_lat = sorted(c["lat"] for c in route_coords)[len(route_coords) // 2]
-            med_lon = sorted(c["lon"] for c in route_coords)[len(route_coords) // 2]
-            route_valid_nids = set()
-            for nid in member_nids:
-                c = node_coords.get(nid)
-                if c and _haversine_km(c["lat"], c["lon"], med_lat, med_lon) > 150:
-                    continue
-                route_valid_nids.add(nid)
-
-        ordered = []
-        for nid in member_nids:
-            if nid in route_valid_nids:
-                sname = node_names[nid]
-                if not ordered or ordered[-1] != sname:
-                    ordered.append(sname)
-
-        if len(ordered) >= 2:
-            # 上下線をマージ
-            if base_name in railway_stations:
-                existing = railway_stations[base_name]
-                # 長い方を採用
-                if len(ordered) > len(existing):
-                    railway_stations[base_name] = ordered
-                # 既存にない駅を追加
-                existing_set = set(existing)
-                for s in ordered:
-                    if s not in existing_set:
-                        railway_stations[base_name].append(s)
-                        existing_set.add(s)
-            else:
+        # 上下線をマージ
+        if base_name in railway_stations:
+            existing = railway_stations[base_name]
+            # 長い方を採用
+            if len(ordered) > len(existing):
                 railway_stations[base_name] = ordered
-
+            # 既存にない駅を追加
+            existing_set = set(existing)
             for s in ordered:
-                station_to_railways[s].add(base_name)
+                if s not in existing_set:
+                    railway_stations[base_name].append(s)
+                    existing_set.add(s)
+        else:
+            railway_stations[base_name] = ordered
+
+        for s in ordered:
+            station_to_railways[s].add(base_name)
+
+    if station_aliases is not None:
+        for nid, sname in node_names.items():
+            station_aliases.setdefault(sname, set()).update(node_aliases.get(nid, ()))
 
     # 駅名 → 座標マッピング（同名駅は最初に見つかったものを採用）
     station_coords = {}
@@ -252,42 +446,920 @@ def _build_graph_from_overpass(data):
     return station_to_railways, railway_stations, station_coords
 
 
+_STOP_ROLES = ("stop", "stop_entry_only", "stop_exit_only", "platform", "platform_entry_only", "platform_exit_only")
+
+
+def _order_route_relation(elem, node_names, node_coords):
+    """
+    1つの路線relationからメンバー駅を順序どおりに並べる
+    （stopメンバー抽出 → 重心から遠い外れ値除外 → 連続重複除去）
+
+    Returns:
+        (base_name, ordered): 路線名と駅名リスト。駅が2つ未満なら None
+    """
+    tags = elem.get("tags", {})
+    route_type = tags.get("route", "")
+
+    route_name = tags.get("name", "")
+    if not route_name:
+        ref = tags.get("ref", "")
+        operator = tags.get("operator", "")
+        route_name = f"{operator} {ref}".strip() or f"route_{elem['id']}"
+
+    # 上り/下りで重複するのでユニーク化
+    # "東京メトロ銀座線 : 浅草→渋谷" → "東京メトロ銀座線"
+    base_name = route_name.split(" : ")[0].split("：")[0].strip()
+
+    members = elem.get("members", [])
+    # まず路線のメンバーノードIDと座標を収集
+    member_nids = []
+    for m in members:
+        role = m.get("role", "")
+        is_stop_role = role in _STOP_ROLES
+        is_railway_member = route_type == "railway" and m.get("type") == "node"
+        if m.get("type") == "node" and (is_stop_role or is_railway_member):
+            nid = m.get("ref")
+            if nid in node_names:
+                member_nids.append(nid)
+
+    # 路線の重心を計算し、重心から150km以上離れたノードを除外（OSMデータ誤り対策）
+    route_coords = [node_coords[nid] for nid in member_nids if nid in node_coords]
+    route_valid_nids = set(member_nids)
+    if len(route_coords) >= 3:
+        med_lat = sorted(c["lat"] for c in route_coords)[len(route_coords) // 2]
+        med_lon = sorted(c["lon"] for c in route_coords)[len(route_coords) // 2]
+        route_valid_nids = set()
+        for nid in member_nids:
+            c = node_coords.get(nid)
+            if c and _haversine_km(c["lat"], c["lon"], med_lat, med_lon) > 150:
+                continue
+            route_valid_nids.add(nid)
+
+    ordered = []
+    for nid in member_nids:
+        if nid in route_valid_nids:
+            sname = node_names[nid]
+            if not ordered or ordered[-1] != sname:
+                ordered.append(sname)
+
+    if len(ordered) < 2:
+        return None
+    return base_name, ordered
+
+
+# プロセスプールのワーカーが初期化時に1回だけ受け取るノード表
+_worker_nodes = {}
+
+
+def _init_route_worker(node_names, node_coords):
+    _worker_nodes["names"] = node_names
+    _worker_nodes["coords"] = node_coords
+
+
+def _order_route_chunk(relations):
+    return [_order_route_relation(elem, _worker_nodes["names"], _worker_nodes["coords"]) for elem in relations]
+
+
+def _order_routes(relations, node_names, node_coords, workers=None):
+    """
+    全relationを _order_route_relation で処理する。
+    relationが多ければプロセスプールに分割し、結果は入力順に並べて返す。
+
+    Returns:
+        (routes, used_workers)
+    """
+    if workers is None:
+        workers = GRAPH_BUILD_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(relations) < PARALLEL_MIN_RELATIONS:
+        return [_order_route_relation(elem, node_names, node_coords) for elem in relations], 1
+
+    # ワーカー数の数倍に分割して負荷の偏りをならす
+    chunk_size = max(1, -(-len(relations) // (workers * 4)))
+    chunks = [relations[i:i + chunk_size] for i in range(0, len(relations), chunk_size)]
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_route_worker,
+            initargs=(node_names, node_coords),
+        ) as pool:
+            routes = []
+            for part in pool.map(_order_route_chunk, chunks):
+                routes.extend(part)
+        return routes, workers
+    except (OSError, BrokenProcessPool) as e:
+        logger.warning(f"並列処理に失敗したため単一プロセスで処理します: {e}")
+        return [_order_route_relation(elem, node_names, node_coords) for elem in relations], 1
+
+
+def benchmark_graph_build(data, worker_counts=None):
+    """
+    プロセス数ごとのグラフ構築時間を計測する（出力が単一プロセス版と一致することも確認）
+
+    Returns:
+        list[dict]: [{"workers": int, "seconds": float, "identical": bool}, ...]
+    """
+    if worker_counts is None:
+        cpu = os.cpu_count() or 1
+        worker_counts = sorted({1, 2, 4, 8, cpu} & set(range(1, cpu + 1)))
+
+    def _serialize(graph):
+        station_to_railways, railway_stations, station_coords = graph
+        return json.dumps([
+            {k: sorted(v) for k, v in station_to_railways.items()}, railway_stations, station_coords,
+        ], ensure_ascii=False)
+
+    results = []
+    baseline = None
+    for w in worker_counts:
+        t0 = time.perf_counter()
+        graph = _build_graph_from_overpass(data, workers=w)
+        elapsed = time.perf_counter() - t0
+        serialized = _serialize(graph)
+        if baseline is None:
+            baseline = serialized
+        results.append({"workers": w, "seconds": round(elapsed, 3), "identical": serialized == baseline})
+        logger.info(f"グラフ構築 {w}プロセス: {elapsed:.2f}秒")
+    return results
+
+
+def compute_station_centrality(station_to_railways, railway_stations, samples=None):
+    """
+    駅の中心性指標を計算する（グラフ構築時に1回だけ実行し、成果物に保存する）
+
+    - line_count: 乗り入れ路線数
+    - transfer_degree: 路線上で隣り合う駅の数（分岐・乗り換えの多さ）
+    - betweenness: 近似媒介中心性。サンプル駅からのBFS（Brandes法）で推定し、最大値を1に正規化
+
+    Returns:
+        dict: {"samples": int, "stations": dict[駅名] -> [line_count, transfer_degree, betweenness]}
+    """
+    if samples is None:
+        samples = CENTRALITY_SAMPLES
+
+    neighbors = defaultdict(set)
+    for stations in railway_stations.values():
+        for a, b in zip(stations, stations[1:]):
+            if a != b:
+                neighbors[a].add(b)
+                neighbors[b].add(a)
+
+    names = sorted(station_to_railways)
+    # 毎回同じ結果になるようサンプルは固定シードで選ぶ
+    sources = names if len(names) <= samples else random.Random(0).sample(names, samples)
+
+    between = dict.fromkeys(names, 0.0)
+    for src in sources:
+        order = []
+        preds = defaultdict(list)
+        sigma = defaultdict(int)
+        sigma[src] = 1
+        dist = {src: 0}
+        queue = deque([src])
+        while queue:
+            v = queue.popleft()
+            order.append(v)
+            for w in neighbors.get(v, ()):
+                if w not in dist:
+                    dist[w] = dist[v] + 1
+                    queue.append(w)
+                if dist[w] == dist[v] + 1:
+                    sigma[w] += sigma[v]
+                    preds[w].append(v)
+        delta = defaultdict(float)
+        while order:
+            w = order.pop()
+            for v in preds[w]:
+                delta[v] += sigma[v] / sigma[w] * (1 + delta[w])
+            if w != src and w in between:
+                between[w] += delta[w]
+
+    peak = max(between.values(), default=0.0) or 1.0
+    return {
+        "samples": len(sources),
+        "stations": {
+            name: [len(station_to_railways[name]), len(neighbors.get(name, ())), round(between[name] / peak, 4)]
+            for name in names
+        },
+    }
+
+
+def _station_label(name, railways):
+    return f"{name}（{' / '.join(railways)}）" if railways else name
+
+
+def build_same_name_table(same_name_groups, station_to_railways, station_coords):
+    """
+    同名駅テーブルを作る（元の駅名 → 地域別の候補）
+    路線に属さない表示名は検索できないので候補から外す
+
+    Returns:
+        dict[元の駅名] -> list[{"name", "railways", "lat", "lon", "label"}]
+    """
+    table = {}
+    for base, names in same_name_groups.items():
+        variants = []
+        for name in names:
+            if name not in station_to_railways:
+                continue
+            rws = sorted(station_to_railways[name])
+            coord = station_coords.get(name) or {}
+            variants.append({
+                "name": name,
+                "railways": rws,
+                "lat": coord.get("lat"),
+                "lon": coord.get("lon"),
+                "label": _station_label(name, rws),
+            })
+        if variants:
+            table[base] = variants
+    return table
+
+
+def normalize_station_name(name):
+    """
+    駅名検索用の正規化（全角/半角・大文字/小文字・カタカナ/ひらがな・長音記号・空白や記号の違いを吸収）
+    例: "Shinjuku Station" / "しんじゅく" / "シンジュク" → "shinjuku" / "しんじゅく"
+    """
+    key = unicodedata.normalize("NFKC", name).casefold().strip()
+    # 区切りは _NAME_TRANSLATE で消えるので、接尾辞はその前に外す
+    return (_NAME_SUFFIX_RE.sub("", key) or key).translate(_NAME_TRANSLATE)
+
+
+def build_station_name_index(station_aliases, station_to_railways):
+    """
+    正規化した表記 → 正式駅名（表示名）の索引を作る
+    駅名そのもの・括弧書きを除いた形・OSMの別表記（ローマ字/かな）をすべて登録する
+
+    Returns:
+        dict[正規化表記] -> list[駅名]
+    """
+    index = defaultdict(list)
+    for sname in station_to_railways:
+        forms = {sname, *station_aliases.get(sname, ())}
+        forms |= {_NAME_BRACKETS_RE.sub("", f) for f in forms}
+        for key in {normalize_station_name(f) for f in forms if f}:
+            if sname not in index[key]:
+                index[key].append(sname)
+    return dict(index)
+
+
+def _same_name_groups_from_names(station_names):
+    """
+    同名駅テーブルのない古いキャッシュ用: 表示名の地域サフィックスから同名駅グループを復元する
+    （構築時に付ける "駅名(地域名)" / "駅名(地域名2)" の形だけを対象にする）
+    """
+    regions = "|".join(sorted({re.escape(r) for _, r in _REGION_TABLE}, key=len, reverse=True))
+    pattern = re.compile(rf"^(.+)\((?:{regions})\d*\)$")
+    groups = defaultdict(list)
+    for name in station_names:
+        m = pattern.match(name)
+        if m:
+            groups[m.group(1)].append(name)
+    names = set(station_names)
+    for base, variants in groups.items():
+        # 地域外のクラスタは元の駅名のまま残る
+        if base in names:
+            variants.insert(0, base)
+    return dict(groups)
+
+
+class _GraphArtifact(dict):
+    """
+    読み込んだグラフ成果物のメタデータ（dict）
+    大きな表（_ARTIFACT_TABLES）は別ファイルにあり、最初に参照したときに読み込む。
+    表のファイルはヘッダを読んだ時点で開いておく（後から別プロセスが保存して古い組を消しても読める）
+    """
+
+    def __init__(self, header, tables_file, table_keys):
+        super().__init__(header)
+        self._tables_file = tables_file
+        self._table_keys = set(table_keys)
+
+    def load_tables(self):
+        """別ファイルの表をすべて読み込む（2回目以降は何もしない）"""
+        with _memo_lock:
+            f, self._tables_file = self._tables_file, None
+            if f is None:
+                return
+            with f:
+                tables = json.load(f)
+            for key, value in tables.items():
+                self.setdefault(key, value)
+
+    def __missing__(self, key):
+        if key in self._table_keys and self._tables_file is not None:
+            self.load_tables()
+            return self[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        # ヘッダに表の一覧があるので、有無の確認だけなら読み込まない
+        return dict.__contains__(self, key) or (key in self._table_keys and self._tables_file is not None)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+def _write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _remove_stale_graph_files(keep):
+    """今のヘッダが指さないバイナリ・表のファイルを消す（他プロセスが開いていて消せなければ次回に回す）"""
+    for name in os.listdir(CACHE_DIR):
+        stale = name.startswith(_GRAPH_FILE_PREFIX) and name.endswith((".bin", ".tables.json"))
+        if stale and name not in keep:
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def _save_graph_artifact(artifact, graph):
+    """
+    グラフ成果物を保存し、プロセス内の読み込み済みデータも差し替える
+    バイナリ → 表 → ヘッダの順に書き、どれも一時ファイルから os.replace で差し替える。
+    バイナリと表は保存ごとの名前にするので、途中で止まっても・同時に保存しても、ヘッダは揃った組を指す
+
+    Args:
+        artifact: メタデータと索引（source, centrality など）
+        graph: RailGraph
+    """
+    if isinstance(artifact, _GraphArtifact):
+        artifact.load_tables()
+    _ensure_cache_dir()
+    token = f"{time.time_ns():x}{os.getpid():x}"
+    bin_name = f"{_GRAPH_FILE_PREFIX}{token}.bin"
+    tables_name = f"{_GRAPH_FILE_PREFIX}{token}.tables.json"
+
+    tmp_bin = os.path.join(CACHE_DIR, bin_name + ".tmp")
+    graph.write_binary(tmp_bin)
+    os.replace(tmp_bin, os.path.join(CACHE_DIR, bin_name))
+
+    tables = {k: artifact[k] for k in _ARTIFACT_TABLES if k in artifact}
+    _write_json_atomic(os.path.join(CACHE_DIR, tables_name), tables)
+
+    header = {
+        **{k: v for k, v in artifact.items() if k not in tables},
+        "format": GRAPH_FORMAT,
+        "bin": bin_name,
+        "tables": tables_name,
+        "table_keys": list(tables),
+        "stations": graph.station_names,
+        "railways": graph.railway_names,
+    }
+    # ヘッダの更新時刻で読み込み済みかを判定するので、ヘッダは最後に差し替える
+    _write_json_atomic(GRAPH_CACHE, header)
+    _remove_stale_graph_files(keep=(bin_name, tables_name))
+
+    with _memo_lock:
+        _replace_memo(_artifact_memo, mtime=os.path.getmtime(GRAPH_CACHE), artifact=artifact, graph=graph)
+
+
+def _read_graph_artifact():
+    """
+    グラフ成果物のヘッダを読み、バイナリを mmap で開く
+
+    Returns:
+        (artifact, graph)。座標データがない古い形式なら None
+        （ヘッダとバイナリ・表が揃っていなければ OSError / ValueError を送出）
+    """
+    with open(GRAPH_CACHE, "r", encoding="utf-8") as f:
+        header = json.load(f)
+
+    if header.get("format") == GRAPH_FORMAT:
+        station_names = header.pop("stations")
+        railway_names = header.pop("railways")
+        bin_path = os.path.join(CACHE_DIR, header.pop("bin"))
+        tables_path = os.path.join(CACHE_DIR, header.pop("tables"))
+        table_keys = header.pop("table_keys")
+        header.pop("format")
+        graph = RailGraph.open_binary(bin_path, station_names, railway_names)
+        return _GraphArtifact(header, open(tables_path, "r", encoding="utf-8"), table_keys), graph
+    if header.get("format") == 2 and os.path.exists(_LEGACY_GRAPH_BIN):
+        # 旧形式（表もヘッダに入れていた）→ 新形式で書き直す
+        logger.info("旧形式のグラフキャッシュを変換します")
+        station_names = header.pop("stations")
+        railway_names = header.pop("railways")
+        header.pop("format")
+        graph = RailGraph.open_binary(_LEGACY_GRAPH_BIN, station_names, railway_names)
+        _save_graph_artifact(header, graph)
+        return header, graph
+    if "station_coords" in header:
+        # 旧形式（全路線をJSONに展開）→ 変換して新形式で書き直す
+        logger.info("旧形式のグラフキャッシュを変換します")
+        graph = RailGraph.from_dicts(
+            header.pop("station_to_railways"),
+            header.pop("railway_stations"),
+            header.pop("station_coords"),
+        )
+        _save_graph_artifact(header, graph)
+        return header, graph
+    return None
+
+
+def _load_graph_artifact():
+    """
+    グラフ成果物を読み込む（同じファイル・同じ更新時刻ならプロセス内で1回だけ）
+    CSR配列はバイナリを mmap するだけで、路線ごとの駅リストはアクセス時に復元される
+
+    Returns:
+        (artifact, graph)。座標データがない古い形式・壊れている（ヘッダとバイナリが合わない）なら None
+    """
+    with _memo_lock:
+        mtime = os.path.getmtime(GRAPH_CACHE)
+        if _artifact_memo.get("mtime") != mtime or "graph" not in _artifact_memo:
+            logger.info("鉄道グラフをキャッシュから読み込み")
+            # 読み込み中に別プロセスが保存して古い組を消した場合に備え、1回だけ読み直す
+            for attempt in range(2):
+                try:
+                    loaded = _read_graph_artifact()
+                    break
+                except (OSError, ValueError, KeyError, struct.error) as e:
+                    if attempt:
+                        logger.warning(f"グラフキャッシュを読み込めません: {e}")
+                        return None
+                    mtime = os.path.getmtime(GRAPH_CACHE)
+            if loaded is None:
+                return None
+            artifact, graph = loaded
+            if _artifact_memo.get("graph") is not graph:
+                _replace_memo(_artifact_memo, mtime=mtime, artifact=artifact, graph=graph)
+        return _artifact_memo["artifact"], _artifact_memo["graph"]
+
+
 def fetch_rail_graph(use_cache=True):
     """鉄道グラフを取得（キャッシュ付き）
 
     Returns:
         (station_to_railways, railway_stations, station_coords)
+        いずれも RailGraph の Mapping 互換ビュー（読み取り専用）
     """
     _ensure_cache_dir()
 
     if use_cache and os.path.exists(GRAPH_CACHE):
-        logger.info("鉄道グラフをキャッシュから読み込み")
-        with open(GRAPH_CACHE, "r", encoding="utf-8") as f:
-            cached = json.load(f)
+        with _memo_lock:
+            loaded = _load_graph_artifact()
+            if loaded is not None:
+                artifact, graph = loaded
+
+                # 古いキャッシュに足りない索引・版情報は1回だけ計算して書き戻す
+                if (
+                    any(k not in artifact for k in ("centrality", "same_name", "name_index", "graph_hash"))
+                    or artifact.get("name_index_version") != _NAME_INDEX_VERSION
+                ):
+                    station_to_railways, railway_stations, station_coords = graph.views()
+                    if "centrality" not in artifact:
+                        logger.info("キャッシュに中心性指標がないため計算します")
+                        artifact["centrality"] = compute_station_centrality(station_to_railways, railway_stations)
+                    if "same_name" not in artifact:
+                        logger.info("キャッシュに同名駅テーブルがないため作成します")
+                        artifact["same_name"] = build_same_name_table(
+                            _same_name_groups_from_names(graph.station_names), station_to_railways, station_coords
+                        )
+                    if "name_index" not in artifact:
+                        # 別表記タグはキャッシュに残っていないので、駅名自体の表記ゆれだけ吸収する
+                        logger.info("キャッシュに駅名索引がないため作成します")
+                        artifact["name_index"] = build_station_name_index({}, station_to_railways)
+                    elif artifact.get("name_index_version") != _NAME_INDEX_VERSION:
+                        # 別表記タグはキャッシュにないので、旧索引の表記は残したまま駅名自体の表記を今の正規化で足す
+                        logger.info("駅名索引の正規化が古いため駅名の表記を足し直します（別表記は --mode graph で再構築）")
+                        for key, names in build_station_name_index({}, station_to_railways).items():
+                            merged = artifact["name_index"].setdefault(key, [])
+                            merged.extend(n for n in names if n not in merged)
+                    artifact["name_index_version"] = _NAME_INDEX_VERSION
+                    if "graph_hash" not in artifact:
+                        logger.info("キャッシュに版情報がないため付与します")
+                        _stamp_graph_version(artifact, graph)
+                    _save_graph_artifact(artifact, graph)
+
+                return graph.views()
+        # 座標データがない・壊れているキャッシュは作り直す
+        logger.info("グラフキャッシュを使えないため作り直します")
+
+    # ローカルのOSM抽出ファイルが設定されていればOverpassを使わない
+    if OSM_EXTRACT_PATH:
+        return build_rail_graph_from_extract(OSM_EXTRACT_PATH)
+
+    # 生レスポンスが保存済みなら再取得せずに再構築（use_cache=False は明示的な再取得）
+    if use_cache and has_overpass_archive():
+        return rebuild_rail_graph_from_archive()
 
-        # 座標データがないキャッシュは再取得
-        if "station_coords" not in cached:
-            logger.info("キャッシュに座標データがないため再取得します")
-            return fetch_rail_graph(use_cache=False)
+    data = _fetch_rail_data_from_overpass()
+    return _build_and_save_graph(data, _load_archive_meta())
 
-        station_to_railways = defaultdict(set)
-        for k, v in cached["station_to_railways"].items():
-            station_to_railways[k] = set(v)
-        return station_to_railways, cached["railway_stations"], cached["station_coords"]
 
-    data = _fetch_rail_data_from_overpass()
-    station_to_railways, railway_stations, station_coords = _build_graph_from_overpass(data)
+def rebuild_rail_graph_from_archive():
+    """
+    保存済みの生レスポンスからグラフを再構築する（ネットワーク不要・再現可能）
+    外れ値・同名駅しきい値など構築ロジックを変えたときに使う
 
-    cache_data = {
-        "station_to_railways": {k: list(v) for k, v in station_to_railways.items()},
-        "railway_stations": railway_stations,
-        "station_coords": station_coords,
+    Returns:
+        (station_to_railways, railway_stations, station_coords)
+    """
+    if not has_overpass_archive():
+        raise FileNotFoundError(f"生レスポンスがありません: {RAW_ARCHIVE}")
+    data, meta = load_overpass_archive()
+    logger.info(f"生レスポンスからグラフを再構築（取得日時: {meta.get('fetched_at', '不明')}）")
+    return _build_and_save_graph(data, meta)
+
+
+def build_rail_graph_from_extract(path=None):
+    """
+    ローカルのOSM抽出ファイル（.osm.pbf / .osm.xml）からグラフを構築して保存する
+
+    Returns:
+        (station_to_railways, railway_stations, station_coords)
+    """
+    from osm_extract import load_osm_extract
+
+    path = path or OSM_EXTRACT_PATH
+    if not path:
+        raise ValueError("OSM抽出ファイルが指定されていません（OSM_EXTRACT_PATH）")
+    data = load_osm_extract(path)
+    source = {
+        "source": "extract",
+        "path": os.path.abspath(path),
+        "file_mtime": datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S"),
+        "bytes": os.path.getsize(path),
     }
-    with open(GRAPH_CACHE, "w", encoding="utf-8") as f:
-        json.dump(cache_data, f, ensure_ascii=False, indent=2)
+    return _build_and_save_graph(data, source)
+
+
+def _build_and_save_graph(data, source):
+    """Overpassレスポンスからグラフを構築して成果物として保存"""
+    same_name_groups = {}
+    station_aliases = {}
+    station_to_railways, railway_stations, station_coords = _build_graph_from_overpass(
+        data, same_name_groups=same_name_groups, station_aliases=station_aliases
+    )
+    graph = RailGraph.from_dicts(station_to_railways, railway_stations, station_coords)
+
+    artifact = {
+        "source": source,
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "centrality": compute_station_centrality(station_to_railways, railway_stations),
+        "same_name": build_same_name_table(same_name_groups, station_to_railways, station_coords),
+        "name_index": build_station_name_index(station_aliases, station_to_railways),
+        "name_index_version": _NAME_INDEX_VERSION,
+    }
+    _stamp_graph_version(artifact, graph)
+    _save_graph_artifact(artifact, graph)
 
     logger.info(f"グラフ構築完了: {len(station_to_railways)}駅, {len(railway_stations)}路線")
-    return station_to_railways, railway_stations, station_coords
+    if GTFS_FEEDS:
+        apply_gtfs_feeds(GTFS_FEEDS)
+    if MUNICIPAL_BOUNDARIES:
+        apply_municipal_boundaries(MUNICIPAL_BOUNDARIES)
+    return graph.views()
+
+
+def _stamp_graph_version(artifact, graph):
+    """成果物に内容ハッシュと構築日時を付け、この版の駅ダイジェストを保存する"""
+    graph_hash = graph.content_hash()
+    artifact["graph_hash"] = graph_hash
+    artifact.setdefault("built_at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    os.makedirs(GRAPH_VERSIONS_DIR, exist_ok=True)
+    path = os.path.join(GRAPH_VERSIONS_DIR, f"{graph_hash}.json")
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "graph_hash": graph_hash,
+                "built_at": artifact["built_at"],
+                "stations": graph.station_digests(),
+            }, f, ensure_ascii=False)
+    logger.info(f"グラフ版: {graph_hash}（{artifact['built_at']}）")
+
+
+def get_graph_version():
+    """
+    現在のグラフの版情報
+
+    Returns:
+        dict: {"graph_hash": str, "built_at": str, "travel_version": str}
+        travel_version は移動時間の版（グラフの版 + GTFS区間時間の版。GTFSを取り込むと graph_hash は同じでも変わる）
+    """
+    fetch_rail_graph()
+    artifact = _artifact_memo["artifact"]
+    return {
+        "graph_hash": artifact.get("graph_hash"),
+        "built_at": artifact.get("built_at"),
+        "travel_version": _travel_version(),
+    }
+
+
+def load_graph_version_digests(graph_hash):
+    """
+    指定した版の駅ダイジェストを読み込む
+
+    Returns:
+        dict[駅名] -> str。版情報が残っていなければ None
+    """
+    path = os.path.join(GRAPH_VERSIONS_DIR, f"{graph_hash}.json")
+    if not graph_hash or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["stations"]
+
+
+def get_rail_graph():
+    """読み込み済みの RailGraph（ID・CSR表現）を返す"""
+    fetch_rail_graph()
+    return _artifact_memo["graph"]
+
+
+def get_same_name_table():
+    """
+    同名駅テーブルを返す（成果物に保存済み）
+
+    Returns:
+        dict[元の駅名] -> list[{"name", "railways", "lat", "lon", "label"}]
+    """
+    fetch_rail_graph()
+    return _artifact_memo["artifact"]["same_name"]
+
+
+def lookup_station_names(input_name):
+    """
+    駅名索引を引く（ローマ字・ひらがな・括弧書きなしの入力にも対応）
+
+    Returns:
+        list[駅名]。見つからなければ空リスト
+    """
+    fetch_rail_graph()
+    return _artifact_memo["artifact"]["name_index"].get(normalize_station_name(input_name), [])
+
+
+def base_station_name(name):
+    """同名駅の表示名（"赤坂(東京)"）を元の駅名（"赤坂"）に戻す。同名駅でなければそのまま"""
+    with _memo_lock:
+        fetch_rail_graph()
+        if "same_name_base" not in _artifact_memo:
+            _artifact_memo["same_name_base"] = {
+                v["name"]: base for base, variants in _artifact_memo["artifact"]["same_name"].items() for v in variants
+            }
+        same_name_base = _artifact_memo["same_name_base"]
+    return same_name_base.get(name, name)
+
+
+def apply_municipal_boundaries(paths):
+    """
+    行政区域ポリゴンから全駅の都道府県・市区町村を判定し、グラフ成果物に割り当て表として保存する
+    政令指定都市の区は区名と市名（例: "中区" と "横浜市"）の両方で引けるようにする
+
+    Returns:
+        dict: {"stations": int, "assigned": int, "municipalities": int}
+    """
+    from admin_boundaries import load_boundaries, assign_points
+
+    station_to_railways, _railway_stations, station_coords = fetch_rail_graph()
+    artifact, graph = _artifact_memo["artifact"], _artifact_memo["graph"]
+
+    points = {n: (c["lat"], c["lon"]) for n, c in station_coords.items() if n in station_to_railways}
+    t0 = time.perf_counter()
+    assigned = assign_points(points, load_boundaries(paths))
+
+    areas = defaultdict(lambda: defaultdict(list))
+    parents = defaultdict(set)
+    for name in points:
+        a = assigned.get(name)
+        if not a:
+            continue
+        areas[a["pref"]][a["city"]].append(name)
+        if a["parent"] and a["parent"] != a["city"]:
+            areas[a["pref"]][a["parent"]].append(name)
+            parents[a["pref"]].add(a["parent"])
+
+    artifact["municipalities"] = {
+        "sources": [os.path.basename(p) for p in paths],
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "areas": {pref: dict(cities) for pref, cities in areas.items()},
+        "parents": {pref: sorted(names) for pref, names in parents.items()},
+    }
+    _save_graph_artifact(artifact, graph)
+
+    stats = {
+        "stations": len(points),
+        "assigned": len(assigned),
+        "municipalities": sum(len(c) for c in areas.values()),
+    }
+    logger.info(
+        f"行政区域の割り当て: {stats['assigned']}/{stats['stations']}駅, "
+        f"{stats['municipalities']}市区町村, {time.perf_counter() - t0:.1f}秒"
+    )
+    return stats
+
+
+def lookup_stations_in_city(prefecture, city):
+    """
+    行政区域の割り当て表から市区町村内の駅を引く（ネットワーク不要）
+
+    Returns:
+        list[駅名]。割り当て表がなければ None、該当市区町村がなければ空リスト
+    """
+    fetch_rail_graph()
+    table = _artifact_memo["artifact"].get("municipalities")
+    if not table:
+        return None
+    areas = table["areas"]
+    if prefecture in areas:
+        return list(areas[prefecture].get(city, []))
+    # 都道府県名が省略・表記違いの場合は全国から市区町村名で探す（同名が複数あれば連結）
+    return [name for cities in areas.values() for name in cities.get(city, [])]
+
+
+def list_cities_in_prefecture(prefecture):
+    """
+    行政区域の割り当て表から、駅のある都道府県内の市区町村を返す
+    政令指定都市は市名ではなく区ごとに返す
+
+    Returns:
+        list[市区町村名]（駅数の多い順）。割り当て表がなければ None
+    """
+    fetch_rail_graph()
+    table = _artifact_memo["artifact"].get("municipalities")
+    if not table:
+        return None
+    cities = table["areas"].get(prefecture, {})
+    if "parents" in table:
+        parents = set(table["parents"].get(prefecture, []))
+    else:
+        logger.warning("行政区域の割り当て表に政令指定都市の情報がありません（--boundaries で作り直してください）。駅の重なりから推定します")
+        parents = _derive_parent_cities(cities)
+    names = [c for c in cities if c not in parents]
+    return sorted(names, key=lambda c: -len(cities[c]))
+
+
+def _derive_parent_cities(cities):
+    """
+    "parents" のない古い割り当て表で、政令指定都市（区の駅をまとめて持つ市）を駅の包含関係から推定する
+    区以外の駅はどれか1つの市区町村にだけ属するので、他の市区町村の駅を全て含むものは市とみなす
+    （区が1つだけで駅の集合が同じときは、名前が「区」で終わる方を区とする）
+    """
+    sets = {c: set(names) for c, names in cities.items() if names}
+    parents = set()
+    for c, members in sets.items():
+        for d, sub in sets.items():
+            if d != c and sub <= members and (sub != members or (d.endswith("区") and not c.endswith("区"))):
+                parents.add(c)
+                break
+    return parents
+
+
+def _station_prefectures():
+    """行政区域の割り当て表から 駅名 → 都道府県名（割り当て表がなければ空）"""
+    table = _artifact_memo["artifact"].get("municipalities") or {}
+    return {
+        name: pref
+        for pref, cities in table.get("areas", {}).items()
+        for names in cities.values()
+        for name in names
+    }
+
+
+def _match_passenger_articles(articles, redirects):
+    """
+    ダンプの駅記事をグラフの駅名に対応づける
+
+    "X駅" はそのまま "X" に、"X駅 (東京都)" のような曖昧さ回避付きの記事は、同名駅の地域名
+    （"X(東京)"）か割り当て表の都道府県名が括弧内に含まれるものを採用する。
+    括弧なしの記事がなく、括弧付きの記事が1件だけならそれを採用する
+
+    Returns:
+        dict[駅名] -> {"passengers", "passenger_label", "title"}
+    """
+    station_to_railways, _railway_stations, _station_coords = fetch_rail_graph()
+
+    def _final(title):
+        seen = set()
+        while title in redirects and title not in seen:
+            seen.add(title)
+            title = redirects[title]
+        return title
+
+    # 元の駅名 → [(括弧内, 記事タイトル)]（リダイレクト元のタイトルでも引けるようにする）
+    by_base = defaultdict(list)
+    for title in set(articles) | set(redirects):
+        article = _final(title)
+        m = _WIKI_STATION_TITLE_RE.match(title)
+        if article in articles and m:
+            by_base[m.group(1)].append((m.group(2) or "", article))
+
+    prefectures = _station_prefectures()
+    stations = {}
+    for name in station_to_railways:
+        base = base_station_name(name)
+        candidates = by_base.get(base)
+        if not candidates:
+            continue
+        hints = [
+            h for h in (
+                name[len(base):].strip("()0123456789"),  # 同名駅の地域名 "X(東京)" → "東京"
+                re.sub(r"[都道府県]$", "", prefectures.get(name, "")),  # "東京都" → "東京"
+            ) if h
+        ]
+        plain = {a for paren, a in candidates if not paren}
+        if base == name and plain:
+            article = next(iter(plain))
+        else:
+            hinted = {a for paren, a in candidates if paren and any(h in paren for h in hints)}
+            bracketed = {a for paren, a in candidates if paren}
+            if len(hinted) == 1:
+                article = next(iter(hinted))
+            elif base == name and not hinted and len(bracketed) == 1:
+                article = next(iter(bracketed))
+            else:
+                continue
+        stations[name] = {
+            "passengers": articles[article]["passengers"],
+            "passenger_label": "乗降人員（全社合算）",
+            "title": article,
+        }
+    return stations
+
+
+def build_passenger_table(dump_path):
+    """
+    Wikipedia ダンプから全国の駅の乗降客数表を作って保存する（ネットワーク不要）
+
+    記事タイトル単位の抽出結果も保存しておき、グラフを作り直したときは駅名への対応づけだけやり直す
+
+    Returns:
+        dict: {"articles": int, "stations": int, "seconds": float}
+    """
+    from wiki_dump import load_passenger_articles
+
+    t0 = time.perf_counter()
+    articles, redirects = load_passenger_articles(dump_path)
+    stations = _match_passenger_articles(articles, redirects)
+
+    _ensure_cache_dir()
+    table = {
+        "source": os.path.basename(dump_path),
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "graph_hash": get_graph_version()["graph_hash"],
+        "articles": articles,
+        "redirects": redirects,
+        "stations": stations,
+    }
+    tmp = PASSENGER_TABLE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    os.replace(tmp, PASSENGER_TABLE)
+    with _memo_lock:
+        _passenger_table_memo.clear()
+
+    stats = {"articles": len(articles), "stations": len(stations), "seconds": round(time.perf_counter() - t0, 1)}
+    logger.info(f"乗降客数表: 記事 {stats['articles']}件 → {stats['stations']}駅, {stats['seconds']}秒 → {PASSENGER_TABLE}")
+    return stats
+
+
+def get_passenger_table():
+    """
+    全国の駅の乗降客数表を返す（build_passenger_table で作成）
+
+    Returns:
+        dict[駅名] -> {"passengers", "passenger_label", "title"}。未作成なら None
+    """
+    try:
+        mtime = os.path.getmtime(PASSENGER_TABLE)
+    except OSError:
+        return None
+    with _memo_lock:
+        fetch_rail_graph()
+        graph_hash = get_graph_version()["graph_hash"]
+        if _passenger_table_memo.get("mtime") != mtime or _passenger_table_memo.get("graph_hash") != graph_hash:
+            with open(PASSENGER_TABLE, "r", encoding="utf-8") as f:
+                table = json.load(f)
+            stations = table["stations"]
+            if table.get("graph_hash") != graph_hash:
+                # グラフの駅名が変わっていれば、保存済みの記事単位の結果から対応づけだけやり直す（1回だけ）
+                stations = _match_passenger_articles(table["articles"], table.get("redirects", {}))
+                logger.info(f"乗降客数表をグラフの版に合わせて再対応づけ: {len(stations)}駅")
+            _replace_memo(_passenger_table_memo, mtime=mtime, graph_hash=graph_hash, stations=stations)
+        return _passenger_table_memo["stations"]
+
+
+def get_station_centrality():
+    """
+    駅の中心性指標を返す（成果物に保存済みの値を引くだけで、クエリ時の計算はない）
+
+    Returns:
+        dict[駅名] -> {"line_count": int, "transfer_degree": int, "betweenness": float}
+    """
+    with _memo_lock:
+        fetch_rail_graph()
+        if "centrality" not in _artifact_memo:
+            rows = _artifact_memo["artifact"]["centrality"]["stations"]
+            _artifact_memo["centrality"] = {
+                name: {"line_count": lc, "transfer_degree": deg, "betweenness": bw}
+                for name, (lc, deg, bw) in rows.items()
+            }
+        return _artifact_memo["centrality"]
 
 
 def _haversine_km(lat1, lon1, lat2, lon2):
@@ -299,14 +1371,450 @@ def _haversine_km(lat1, lon1, lat2, lon2):
     return R * 2 * math.asin(math.sqrt(min(a, 1.0)))
 
 
-def find_reachable_stations(base_station, max_transfer, station_to_railways, railway_stations, station_coords=None):
+def _segment_minutes(c1, c2):
+    """隣接2駅間の所要時間（分、float）を座標距離から推定"""
+    if c1 and c2:
+        km = _haversine_km(c1["lat"], c1["lon"], c2["lat"], c2["lon"])
+        return km * ROUTE_DETOUR_FACTOR / TRAIN_SPEED_KMH * 60
+    return FALLBACK_MIN_PER_STATION
+
+
+def _walk_minutes(km):
+    """徒歩の所要時間（分、float）。直線距離に迂回係数を掛けて概算"""
+    return km * ROUTE_DETOUR_FACTOR / WALK_SPEED_KMH * 60
+
+
+def build_travel_graph(station_to_railways, railway_stations, station_coords, edge_minutes=None):
     """
-    BFS探索：指定駅からmax_transfer回以内の乗り換えで到達できる駅を返す
-    路線情報付きで返す
+    移動時間探索用の隣接リストと最寄り駅検索グリッドを構築する。
+    グラフ1つにつき1回だけ作れば、以降の探索は座標計算なしで回せる。
+    edge_minutes（GTFSの実測区間時間）がある区間はその値を、ない区間は座標距離からの推定を使う。
 
     Returns:
-        (reachable, station_railway_map, matched_name)
-        matched_name: マッチした正式駅名（入力と同じ場合もそのまま返す）
+        dict: {
+            "adj": dict[駅名] -> list[(隣接駅, 路線名, 所要分)],
+            "grid": dict[(i, j)] -> list[(駅名, lat, lon)],
+            "station_coords": 元の座標テーブル,
+            "station_to_railways": 元の駅→路線テーブル,
+        }
+    """
+    adj = defaultdict(list)
+    for rw, stations in railway_stations.items():
+        for j in range(len(stations) - 1):
+            a, b = stations[j], stations[j + 1]
+            if a == b:
+                continue
+            minutes = edge_minutes.get((a, b) if a < b else (b, a)) if edge_minutes else None
+            if minutes is None:
+                minutes = _segment_minutes(station_coords.get(a), station_coords.get(b))
+            adj[a].append((b, rw, minutes))
+            adj[b].append((a, rw, minutes))
+
+    grid = defaultdict(list)
+    for name, c in station_coords.items():
+        key = (int(c["lat"] // _GRID_CELL_DEG), int(c["lon"] // _GRID_CELL_DEG))
+        grid[key].append((name, c["lat"], c["lon"]))
+
+    return {
+        "adj": adj,
+        "grid": grid,
+        "station_coords": station_coords,
+        "station_to_railways": station_to_railways,
+    }
+
+
+def get_edge_minutes():
+    """
+    成果物に保存済みのGTFS実測区間時間
+
+    Returns:
+        dict[(駅名, 駅名)] -> 分（キーは駅名の昇順）。未設定なら空dict
+    """
+    with _memo_lock:
+        fetch_rail_graph()
+        if "edge_minutes" not in _artifact_memo:
+            weights = _artifact_memo["artifact"].get("edge_weights") or {}
+            _artifact_memo["edge_minutes"] = {(a, b): m for a, b, m in weights.get("edges", [])}
+        return _artifact_memo["edge_minutes"]
+
+
+def get_travel_graph():
+    """現在のグラフの探索用グラフ（build_travel_graph）。プロセス内で1回だけ作る"""
+    with _memo_lock:
+        station_to_railways, railway_stations, station_coords = fetch_rail_graph()
+        if "travel_graph" not in _artifact_memo:
+            _artifact_memo["travel_graph"] = build_travel_graph(
+                station_to_railways, railway_stations, station_coords, get_edge_minutes()
+            )
+        return _artifact_memo["travel_graph"]
+
+
+def _travel_version():
+    """移動時間表の対応版: グラフの版 + GTFS区間時間の版"""
+    artifact = _artifact_memo["artifact"]
+    digest = (artifact.get("edge_weights") or {}).get("digest")
+    if not digest:
+        return artifact.get("graph_hash")
+    return hashlib.sha256(f"{artifact.get('graph_hash')}:{digest}".encode("ascii")).hexdigest()[:16]
+
+
+def apply_gtfs_feeds(paths):
+    """
+    GTFS zip から駅間の実測所要時間を求め、グラフ成果物に区間の重みとして保存する
+    以降の移動時間探索（get_travel_graph / 移動時間表）はこの重みを使う
+
+    Returns:
+        dict: {"feeds", "stops", "matched_stops", "samples", "edges", "coverage"}
+    """
+    from gtfs_loader import load_gtfs_segment_minutes
+
+    station_to_railways, railway_stations, station_coords = fetch_rail_graph()
+    artifact, graph = _artifact_memo["artifact"], _artifact_memo["graph"]
+    # 停留所の対応づけ・隣接判定は推定値だけのグラフで行う
+    travel_graph = build_travel_graph(station_to_railways, railway_stations, station_coords)
+    adjacent = {(a, b) for a, nbs in travel_graph["adj"].items() for b, _rw, _m in nbs}
+
+    def _match_stop(name, lat, lon):
+        names = [n for n in lookup_station_names(name) if n in station_coords] if name else []
+        if names and lat is not None:
+            best = min(names, key=lambda n: _haversine_km(lat, lon, station_coords[n]["lat"], station_coords[n]["lon"]))
+            c = station_coords[best]
+            if _haversine_km(lat, lon, c["lat"], c["lon"]) <= GTFS_NAME_MATCH_KM:
+                return best
+        if lat is not None:
+            nearest = find_nearest_stations(lat, lon, travel_graph, k=1, max_km=GTFS_NEAREST_MATCH_KM)
+            if nearest:
+                return nearest[0][0]
+        return None
+
+    edge_minutes, stats = load_gtfs_segment_minutes(paths, _match_stop, lambda a, b: (a, b) in adjacent)
+    edges = sorted([a, b, m] for (a, b), m in edge_minutes.items())
+    stats["coverage"] = round(len(edges) / max(1, len(adjacent) // 2), 3)
+    artifact["edge_weights"] = {
+        "feeds": [os.path.basename(p) for p in paths],
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "digest": hashlib.sha256(json.dumps(edges, ensure_ascii=False).encode("utf-8")).hexdigest()[:16],
+        "edges": edges,
+    }
+    _save_graph_artifact(artifact, graph)
+    logger.info(f"GTFS区間時間を保存: {len(edges)}区間（グラフの隣接区間の{stats['coverage']:.0%}）")
+    return stats
+
+
+def find_nearest_stations(lat, lon, travel_graph, k=3, max_km=2.0):
+    """
+    座標から近い順に最大k駅を返す（路線に属する駅のみ）
+
+    Returns:
+        list[(駅名, 距離km)]
+    """
+    grid = travel_graph["grid"]
+    station_to_railways = travel_graph["station_to_railways"]
+    ci, cj = int(lat // _GRID_CELL_DEG), int(lon // _GRID_CELL_DEG)
+    # max_km をカバーするセル半径（経度方向は緯度で縮むので cos で補正）
+    r_lat = int(max_km / 111.0 / _GRID_CELL_DEG) + 1
+    r_lon = int(max_km / (111.0 * max(math.cos(math.radians(lat)), 0.1)) / _GRID_CELL_DEG) + 1
+
+    found = []
+    for i in range(ci - r_lat, ci + r_lat + 1):
+        for j in range(cj - r_lon, cj + r_lon + 1):
+            for name, slat, slon in grid.get((i, j), ()):
+                if not station_to_railways.get(name):
+                    continue
+                d = _haversine_km(lat, lon, slat, slon)
+                if d <= max_km:
+                    found.append((d, name))
+    found.sort()
+    return [(name, d) for d, name in found[:k]]
+
+
+def find_travel_times(sources, travel_graph, max_minutes=90, max_transfer=None):
+    """
+    多始点の時間重み付き探索（Dijkstra）。
+    状態は (駅, 乗車中の路線) で、別路線に乗り継ぐと乗り換えペナルティを加算する。
+    乗り換え回数に上限があるときは乗り換え回数も状態に含める（速いが乗り換えを使い切った経路が、
+    遅いが乗り換えの余っている経路を打ち消さないように、時間・回数とも劣る状態だけを捨てる）。
+
+    Args:
+        sources: dict[駅名] -> 出発時点の経過時間（分）。複数駅から同時に探索する
+        travel_graph: build_travel_graph() の戻り値
+        max_minutes: この時間を超える駅は探索しない
+        max_transfer: 乗り換え回数の上限（Noneなら無制限）
+
+    Returns:
+        dict[駅名] -> {"travel_time": int, "transfers": int, "source": 出発駅名}
+    """
+    adj = travel_graph["adj"]
+
+    def _dominated(station, railway, transfers, t):
+        # 上限なしなら回数は区別しない（キーの回数は常に0）
+        k_max = transfers if max_transfer is not None else 0
+        return any(best_state.get((station, railway, k), math.inf) <= t for k in range(k_max + 1))
+
+    heap = []
+    best_state = {}
+    result = {}
+    for src, t0 in sources.items():
+        heapq.heappush(heap, (t0, 0, src, None, src))
+
+    while heap:
+        t, transfers, station, railway, src = heapq.heappop(heap)
+        if _dominated(station, railway, transfers, t):
+            continue
+        best_state[(station, railway, transfers if max_transfer is not None else 0)] = t
+
+        if station not in result:
+            result[station] = {
+                "travel_time": max(1, round(t)) if t > 0 else 0,
+                "transfers": transfers,
+                "source": src,
+            }
+
+        for nb, rw, minutes in adj.get(station, ()):
+            if railway is None or rw == railway:
+                nt, ntr = t + minutes, transfers
+            else:
+                nt, ntr = t + minutes + TRANSFER_PENALTY_MIN, transfers + 1
+                if max_transfer is not None and ntr > max_transfer:
+                    continue
+            if nt > max_minutes:
+                continue
+            if _dominated(nb, rw, ntr, nt):
+                continue
+            heapq.heappush(heap, (nt, ntr, nb, rw, src))
+
+    return result
+
+
+# プロセスプールのワーカーが初期化時に1回だけ受け取る探索用グラフ
+_worker_travel = {}
+
+
+def _init_travel_worker(travel_graph, station_ids, max_minutes):
+    _worker_travel.update(graph=travel_graph, ids=station_ids, max_minutes=max_minutes)
+
+
+def _travel_rows(sources, travel_graph, station_ids, max_minutes):
+    """始点駅ごとに上限時間内の到達駅を探索し、(到達駅ID, 分, 乗り換え回数) の行にする"""
+    rows = []
+    for src in sources:
+        reached = find_travel_times({src: 0}, travel_graph, max_minutes=max_minutes)
+        rows.append(sorted(
+            (station_ids[name], r["travel_time"], r["transfers"]) for name, r in reached.items()
+        ))
+    return rows
+
+
+def _travel_rows_chunk(sources):
+    w = _worker_travel
+    return _travel_rows(sources, w["graph"], w["ids"], w["max_minutes"])
+
+
+def build_travel_table(max_minutes=TRAVEL_TABLE_MINUTES, workers=None):
+    """
+    全駅を始点に上限時間つきの探索（find_travel_times）を行い、移動時間表として保存する
+    時間のかかるオフライン処理なので、グラフ更新後に1回だけ実行する
+
+    Returns:
+        dict: {"stations": int, "rows": int, "bytes": int, "seconds": float, "workers": int}
+    """
+    fetch_rail_graph()
+    graph = _artifact_memo["graph"]
+    version = _travel_version()
+    # ワーカーに渡すのは隣接リストだけ（Mappingビューはプロセス間で渡せない）
+    travel_graph = {"adj": dict(get_travel_graph()["adj"])}
+
+    names = graph.station_names
+    sources = [names[sid] for sid in range(len(names)) if graph.railways_of(sid)]
+
+    if workers is None:
+        workers = GRAPH_BUILD_WORKERS or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    rows_by_name = None
+    if workers > 1 and len(sources) >= TRAVEL_TABLE_PARALLEL_MIN_STATIONS:
+        chunk_size = max(1, -(-len(sources) // (workers * 4)))
+        chunks = [sources[i:i + chunk_size] for i in range(0, len(sources), chunk_size)]
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_travel_worker,
+                initargs=(travel_graph, graph.station_ids, max_minutes),
+            ) as pool:
+                rows = []
+                for part in pool.map(_travel_rows_chunk, chunks):
+                    rows.extend(part)
+            rows_by_name = dict(zip(sources, rows))
+        except (OSError, BrokenProcessPool) as e:
+            logger.warning(f"並列処理に失敗したため単一プロセスで処理します: {e}")
+    if rows_by_name is None:
+        workers = 1
+        rows_by_name = dict(zip(sources, _travel_rows(sources, travel_graph, graph.station_ids, max_minutes)))
+
+    table = TravelTable.from_rows(version, max_minutes, (rows_by_name.get(name, ()) for name in names))
+    elapsed = time.perf_counter() - t0
+
+    _ensure_cache_dir()
+    tmp = TRAVEL_TABLE + ".tmp"
+    table.write(tmp)
+    os.replace(tmp, TRAVEL_TABLE)
+    with _memo_lock:
+        _replace_memo(_travel_table_memo)
+
+    stats = {
+        "stations": len(sources),
+        "rows": len(table.targets),
+        "bytes": os.path.getsize(TRAVEL_TABLE),
+        "seconds": round(elapsed, 2),
+        "workers": workers,
+    }
+    logger.info(
+        f"移動時間表を保存: {stats['stations']}駅, {stats['rows']}行, "
+        f"{stats['bytes'] / 1e6:.1f}MB, {elapsed:.1f}秒（{workers}プロセス）"
+    )
+    return stats
+
+
+def get_travel_table():
+    """
+    現在のグラフに対応する移動時間表を返す（mmapで開くだけで、行は参照時に読む）
+
+    Returns:
+        TravelTable。未作成またはグラフの版と合わなければ None
+    """
+    if not os.path.exists(TRAVEL_TABLE):
+        return None
+    fetch_rail_graph()
+    with _memo_lock:
+        mtime = os.path.getmtime(TRAVEL_TABLE)
+        if _travel_table_memo.get("mtime") != mtime:
+            _replace_memo(_travel_table_memo, mtime=mtime, table=TravelTable.open(TRAVEL_TABLE))
+        table = _travel_table_memo["table"]
+    if table.graph_hash != _travel_version():
+        logger.info("移動時間表がグラフ・GTFS区間時間の版と一致しないため使用しません（build_travel_table で再作成）")
+        return None
+    return table
+
+
+def lookup_travel_times(base_station):
+    """
+    移動時間表から基準駅の行を引く
+
+    Returns:
+        dict[駅名] -> {"travel_time": int, "transfers": int}。表がなければ None
+    """
+    table = get_travel_table()
+    if table is None:
+        return None
+    graph = _artifact_memo["graph"]
+    sid = graph.station_ids.get(base_station)
+    if sid is None:
+        return {}
+    names = graph.station_names
+    return {names[tid]: {"travel_time": m, "transfers": tr} for tid, m, tr in table.row(sid)}
+
+
+def lookup_travel_time(from_station, to_station):
+    """
+    2駅間の所要時間を移動時間表から引く
+
+    Returns:
+        (所要分, 乗り換え回数)。表がない・上限時間内に着かない場合は None
+    """
+    table = get_travel_table()
+    if table is None:
+        return None
+    ids = _artifact_memo["graph"].station_ids
+    if from_station not in ids or to_station not in ids:
+        return None
+    return table.lookup(ids[from_station], ids[to_station])
+
+
+def _bfs_levels_csr(graph, base_sid, max_transfer, max_distance_km=None):
+    """
+    find_reachable_stations の探索本体（駅ID・路線IDとCSR配列の上で実行）
+    キューは乗り換え回数の順に並ぶので、回数ごとに探索し終えた時点でその回数までの結果を返す
+
+    Yields:
+        (level, visited, railway_map): level = 0, 1, …, max_transfer
+        visited: dict[駅ID] -> 最小乗り換え回数, railway_map: dict[駅ID] -> set[路線ID]
+        （どちらも探索中に更新し続ける同じオブジェクトなので、次を要求する前に使うこと）
+    """
+    st_off, st_ids = graph.st_rw_offsets, graph.st_rw_ids
+    rw_off, rw_ids = graph.rw_st_offsets, graph.rw_st_ids
+    lat, lon = graph.lat, graph.lon
+    n_rw = len(graph.railway_names)
+
+    # 基準駅からの距離判定は駅ごとに1回だけ行う（0=未判定, 1=範囲内, 2=範囲外）
+    use_distance = max_distance_km is not None and graph.has_coord(base_sid)
+    base_lat, base_lon = lat[base_sid], lon[base_sid]
+    far = bytearray(len(graph.station_names))
+
+    visited = {base_sid: 0}
+    railway_map = defaultdict(set)
+    queue = deque()
+
+    for k in range(st_off[base_sid], st_off[base_sid + 1]):
+        queue.append((base_sid, st_ids[k], 0))
+        railway_map[base_sid].add(st_ids[k])
+
+    processed = set()  # 駅ID * 路線数 + 路線ID
+    level = 0
+
+    while queue:
+        current, rid, transfers = queue.popleft()
+
+        # 次の回数に進む前に、ここまでの回数の結果を返す
+        while level < transfers and level < max_transfer:
+            yield level, visited, railway_map
+            level += 1
+
+        key = current * n_rw + rid
+        if key in processed:
+            continue
+        processed.add(key)
+
+        if transfers > max_transfer:
+            continue
+
+        for k in range(rw_off[rid], rw_off[rid + 1]):
+            sid = rw_ids[k]
+            # 座標距離で制限（同名別駅・遠距離路線を除外）
+            if use_distance:
+                flag = far[sid]
+                if not flag:
+                    slat = lat[sid]
+                    # NaN（座標なし）は範囲内扱い
+                    if slat == slat and _haversine_km(base_lat, base_lon, slat, lon[sid]) > max_distance_km:
+                        flag = 2
+                    else:
+                        flag = 1
+                    far[sid] = flag
+                if flag == 2:
+                    continue
+
+            if sid not in visited or visited[sid] > transfers:
+                visited[sid] = transfers
+            railway_map[sid].add(rid)
+
+            if transfers + 1 <= max_transfer:
+                for k2 in range(st_off[sid], st_off[sid + 1]):
+                    r2 = st_ids[k2]
+                    if r2 != rid and sid * n_rw + r2 not in processed:
+                        queue.append((sid, r2, transfers + 1))
+
+    # 新しい駅が増えなかった残りの回数も返す
+    while level <= max_transfer:
+        yield level, visited, railway_map
+        level += 1
+
+
+def iter_find_reachable_stations(base_station, max_transfer, station_to_railways, railway_stations, station_coords=None):
+    """
+    find_reachable_stations の逐次版: 乗り換え0回 → 1回 → … と、探索し終えた回数ごとに結果を返す
+
+    Yields:
+        (level, (reachable, station_railway_map, matched_name, station_transfers))
+        駅が見つからなければ何も返さない
     """
     matched_name = base_station
     if base_station not in station_to_railways:
@@ -326,64 +1834,83 @@ def find_reachable_stations(base_station, max_transfer, station_to_railways, rai
             matched_name = matched
         else:
             logger.error(f"駅 '{base_station}' が見つかりません")
-            return [], {}, None
+            return
 
     # 同名駅チェック: 同じ駅名が複数路線グループに属し、座標が遠い場合は候補を返す
     # （呼び出し元で選択UIを表示するため）
 
+    # 探索はID・CSR表現の上で行う（fetch_rail_graph のビューならそのまま、dictなら変換）
+    graph = getattr(station_to_railways, "graph", None)
+    if graph is None:
+        graph = RailGraph.from_dicts(station_to_railways, railway_stations, station_coords or {})
+
     # 基準駅の座標（距離制限に使用）
     MAX_DISTANCE_KM = 80
-    base_coord = (station_coords or {}).get(base_station)
+    names = graph.station_names
+    rw_names = graph.railway_names
+    for level, visited_ids, railway_map_ids in _bfs_levels_csr(
+        graph, graph.station_ids[base_station], max_transfer,
+        MAX_DISTANCE_KM if station_coords else None,
+    ):
+        visited = {names[sid]: t for sid, t in visited_ids.items()}
+        station_railway_map = defaultdict(set)
+        for sid, rids in railway_map_ids.items():
+            station_railway_map[names[sid]] = {rw_names[r] for r in rids}
+
+        reachable = sorted(
+            [s for s in visited if s != base_station],
+            key=lambda s: visited[s]
+        )
+        logger.info(
+            f"'{base_station}' から乗り換え{level}回以内: "
+            f"{len(reachable)}駅"
+        )
+        yield level, (reachable, station_railway_map, matched_name, visited)
 
-    visited = {base_station: 0}
-    station_railway_map = defaultdict(set)
-    queue = deque()
 
-    for rw_id in station_to_railways[base_station]:
-        queue.append((base_station, rw_id, 0))
-        station_railway_map[base_station].add(rw_id)
+def find_reachable_stations(base_station, max_transfer, station_to_railways, railway_stations, station_coords=None):
+    """
+    BFS探索：指定駅からmax_transfer回以内の乗り換えで到達できる駅を返す
+    路線情報付きで返す
 
-    processed = set()
+    Returns:
+        (reachable, station_railway_map, matched_name, station_transfers)
+        matched_name: マッチした正式駅名（入力と同じ場合もそのまま返す）
+        station_transfers: dict[駅名] -> 最小乗り換え回数
+    """
+    result = [], {}, None, {}
+    for _level, result in iter_find_reachable_stations(
+        base_station, max_transfer, station_to_railways, railway_stations, station_coords
+    ):
+        pass
+    return result
 
-    while queue:
-        current_station, current_railway, transfers = queue.popleft()
 
-        if (current_station, current_railway) in processed:
-            continue
-        processed.add((current_station, current_railway))
+def iter_reachable_stations(base_station, max_transfer):
+    """
+    get_reachable_stations の逐次版: 乗り換え0回 → 1回 → … と、探索し終えた回数ごとに
+    その回数までの結果を返す（深い探索でも最初の結果は0回分の探索だけで返る）
 
-        if transfers > max_transfer:
-            continue
+    Yields:
+        (level, get_reachable_stations と同じ形式のタプル)。駅が見つからなければ何も返さない
+    """
+    station_to_railways, railway_stations, station_coords = fetch_rail_graph()
 
-        if current_railway in railway_stations:
-            for station in railway_stations[current_railway]:
-                # 座標距離で制限（同名別駅・遠距離路線を除外）
-                if base_coord and station_coords:
-                    sc = station_coords.get(station)
-                    if sc:
-                        dist = _haversine_km(base_coord["lat"], base_coord["lon"], sc["lat"], sc["lon"])
-                        if dist > MAX_DISTANCE_KM:
-                            continue
-
-                if station not in visited or visited[station] > transfers:
-                    visited[station] = transfers
-                station_railway_map[station].add(current_railway)
-
-                if transfers + 1 <= max_transfer:
-                    for rw_id in station_to_railways.get(station, set()):
-                        if rw_id != current_railway:
-                            if (station, rw_id) not in processed:
-                                queue.append((station, rw_id, transfers + 1))
-
-    reachable = sorted(
-        [s for s in visited if s != base_station],
-        key=lambda s: visited[s]
-    )
-    logger.info(
-        f"'{base_station}' から乗り換え{max_transfer}回以内: "
-        f"{len(reachable)}駅"
-    )
-    return reachable, station_railway_map, matched_name
+    # 表記ゆれは索引で正式名に解決してから探索する（部分一致・あいまい一致の走査を避ける）
+    search_name = base_station
+    if base_station not in station_to_railways:
+        names = lookup_station_names(base_station)
+        if names:
+            search_name = names[0]
+            logger.info(f"'{base_station}' → '{search_name}' にマッチ（駅名索引）")
+
+    for level, (reachable, _station_railway_map, matched_name, station_transfers) in iter_find_reachable_stations(
+        search_name, max_transfer, station_to_railways, railway_stations, station_coords
+    ):
+        merged = _group_reachable_by_railway(
+            reachable, matched_name or base_station, station_to_railways, railway_stations
+        )
+        yield level, (reachable, merged, matched_name, station_coords, railway_stations, station_to_railways, station_transfers)
 
 
 def get_reachable_stations(base_station, max_transfer):
@@ -391,15 +1918,20 @@ def get_reachable_stations(base_station, max_transfer):
     メインエントリポイント：基準駅から到達可能な駅リストを取得（路線情報付き）
 
     Returns:
-        (reachable, merged, matched_name, station_coords, railway_stations, station_to_railways)
+        (reachable, merged, matched_name, station_coords, railway_stations, station_to_railways, station_transfers)
+        station_transfers: dict[駅名] -> 最小乗り換え回数
     """
-    station_to_railways, railway_stations, station_coords = fetch_rail_graph()
+    result = None
+    for _level, result in iter_reachable_stations(base_station, max_transfer):
+        pass
+    if result is None:
+        station_to_railways, railway_stations, station_coords = fetch_rail_graph()
+        return [], {}, None, station_coords, railway_stations, station_to_railways, {}
+    return result
 
-    reachable, station_railway_map, matched_name = find_reachable_stations(
-        base_station, max_transfer, station_to_railways, railway_stations, station_coords
-    )
 
-    base = matched_name or base_station
+def _group_reachable_by_railway(reachable, base, station_to_railways, railway_stations):
+    """到達駅を路線ごとに並べ（路線上の駅順）、上り/下り・直通運転の重複路線を統合する"""
     reachable_set = set(reachable)
 
     # reachable な駅が属する全路線を収集し、路線ごとにグルーピング
@@ -436,40 +1968,48 @@ def get_reachable_stations(base_station, max_transfer):
         if not is_subset:
             merged[rw_name] = stations
 
-    return reachable, merged, matched_name, station_coords, railway_stations, station_to_railways
+    return merged
 
 
 def find_station_candidates(input_name):
     """
     入力駅名に対する候補を路線情報付きで返す。
     同名駅や部分一致が複数ある場合にUIで選択させるために使用。
+    同名駅は構築時に作った同名駅テーブルを引くだけで決まる。
 
     Returns:
         list[dict]: [{"name": str, "railways": list[str], "label": str}, ...]
-        空リスト = 候補なし
+        空リスト = 候補なし、1件 = そのまま検索してよい
     """
-    station_to_railways, _railway_stations, station_coords = fetch_rail_graph()
+    station_to_railways, _railway_stations, _station_coords = fetch_rail_graph()
+
+    # 同名駅（"赤坂" → "赤坂(東京)", "赤坂(福岡)" ...）
+    variants = get_same_name_table().get(input_name)
+    if variants:
+        return variants
 
-    # 完全一致があるかチェック
+    # 完全一致 → 表記ゆれ（ローマ字・かな・括弧書きなし）
+    indexed = lookup_station_names(input_name)
     if input_name in station_to_railways:
         candidates_names = [input_name]
+    elif indexed:
+        candidates_names = indexed
     else:
-        # 部分文字列マッチ
+        # 部分文字列マッチ（入力名で始まる候補があればそれだけに絞る）
         candidates_names = [s for s in station_to_railways if input_name in s]
+        primary = [s for s in candidates_names if s.startswith(input_name)]
+        if primary:
+            candidates_names = primary
         if not candidates_names:
             # あいまいマッチ
             all_names = list(station_to_railways.keys())
             close = difflib.get_close_matches(input_name, all_names, n=5, cutoff=0.5)
             candidates_names = close if close else []
 
-    if not candidates_names:
-        return []
-
     # 各候補に路線情報を付加
     results = []
     for name in candidates_names:
         rws = sorted(station_to_railways.get(name, set()))
-        label = f"{name}（{' / '.join(rws)}）" if rws else name
-        results.append({"name": name, "railways": rws, "label": label})
+        results.append({"name": name, "railways": rws, "label": _station_label(name, rws)})
 
     return results
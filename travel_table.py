@@ -0,0 +1,120 @@
+"""
+全駅発の移動時間表 - 各駅から上限時間内に到達できる駅を (到達駅ID, 所要分, 乗り換え回数) の疎な行で保持する
+駅IDは RailGraph の駅IDと共通で、表を作ったときの版（graph_hash。GTFS区間時間があればそれも含めた版）をヘッダに持つ
+
+ファイル上は始点駅IDごとに行を連続して並べ、読み込み時は mmap して必要な行だけ参照する
+（行内は到達駅ID順なので、2駅間の所要時間は二分探索で引ける）
+"""
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+# バイナリ形式: ヘッダ → offsets(int64) / targets(int32) / minutes(uint16) / transfers(uint8)
+# 各区間は8バイト境界に揃える（リトルエンディアン）
+_MAGIC = b"TTABLE1\0"
+_HEADER = struct.Struct("<8s16sqqq")  # magic, graph_hash, max_minutes, 駅数, 行数
+_TYPECODES = "qiHB"
+
+
+class TravelTable:
+    """
+    始点駅ID → [(到達駅ID, 所要分, 乗り換え回数), ...] の疎な表（CSR形式）
+
+    offsets[sid]:offsets[sid + 1] が始点 sid の行の範囲
+    """
+
+    def __init__(self, graph_hash, max_minutes, offsets, targets, minutes, transfers):
+        self.graph_hash = graph_hash
+        self.max_minutes = max_minutes
+        self.offsets = offsets
+        self.targets = targets
+        self.minutes = minutes
+        self.transfers = transfers
+        self._mmap = None
+
+    @classmethod
+    def from_rows(cls, graph_hash, max_minutes, rows):
+        """
+        Args:
+            rows: 駅IDの順に、各始点の [(到達駅ID, 所要分, 乗り換え回数), ...]（到達駅ID順）
+        """
+        offsets = array("q", [0])
+        targets, minutes, transfers = array("i"), array("H"), array("B")
+        for row in rows:
+            for tid, m, tr in row:
+                targets.append(tid)
+                minutes.append(min(m, 0xFFFF))
+                transfers.append(min(tr, 0xFF))
+            offsets.append(len(targets))
+        return cls(graph_hash, max_minutes, offsets, targets, minutes, transfers)
+
+    def _sections(self):
+        return (self.offsets, self.targets, self.minutes, self.transfers)
+
+    def write(self, path):
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(
+                _MAGIC, self.graph_hash.encode("ascii"), self.max_minutes,
+                len(self.offsets) - 1, len(self.targets),
+            ))
+            for a, code in zip(self._sections(), _TYPECODES):
+                data = array(code, a)
+                if sys.byteorder != "little":
+                    data.byteswap()
+                raw = data.tobytes()
+                f.write(raw)
+                f.write(b"\0" * (-len(raw) % 8))
+
+    @classmethod
+    def open(cls, path):
+        """write() で保存したファイルを mmap で開く（全体は読み込まない）"""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, graph_hash, max_minutes, n_stations, n_rows = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC:
+            mm.close()
+            raise ValueError(f"移動時間表の形式が不正です: {path}")
+
+        buf = memoryview(mm)
+        pos = _HEADER.size
+        sections = []
+        for n, code in zip((n_stations + 1, n_rows, n_rows, n_rows), _TYPECODES):
+            size = n * array(code).itemsize
+            if sys.byteorder == "little":
+                sections.append(buf[pos:pos + size].cast(code))
+            else:
+                data = array(code, bytes(buf[pos:pos + size]))
+                data.byteswap()
+                sections.append(data)
+            pos += size + (-size % 8)
+
+        table = cls(graph_hash.rstrip(b"\0").decode("ascii"), max_minutes, *sections)
+        table._mmap = mm
+        return table
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row(self, sid):
+        """
+        Returns:
+            list[(到達駅ID, 所要分, 乗り換え回数)]（始点自身を含む）
+        """
+        lo, hi = self.offsets[sid], self.offsets[sid + 1]
+        return list(zip(self.targets[lo:hi], self.minutes[lo:hi], self.transfers[lo:hi]))
+
+    def lookup(self, sid, tid):
+        """
+        Returns:
+            (所要分, 乗り換え回数)。上限時間内に到達できなければ None
+        """
+        lo, hi = self.offsets[sid], self.offsets[sid + 1]
+        i = bisect_left(self.targets, tid, lo, hi)
+        if i < hi and self.targets[i] == tid:
+            return self.minutes[i], self.transfers[i]
+        return None
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in self._sections())
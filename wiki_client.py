@@ -0,0 +1,215 @@
+"""
+Wikipedia日本語版 APIクライアント - 駅記事の冒頭節（infoboxを含む節0）のwikitextとリード画像をまとめて取得する
+
+1回の API 呼び出し（http_client の共有接続）に最大50タイトルを載せ（prop=revisions|pageimages, rvsection=0）、
+表記の正規化・リダイレクトを解決したうえで、要求したタイトルごとの結果に振り分ける。
+取得済みのタイトルはプロセス内にキャッシュするので、ジョブの最初に対象駅をまとめて
+prefetch_pages() しておけば、駅ごとの乗降客数・画像の取得では API を呼ばない
+infobox からの乗降客数の抽出（parse_passenger_count）は、ダンプからの一括抽出（wiki_dump）と共通
+"""
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+
+from config import JA_WIKIPEDIA_API_URL
+import http_client
+
+logger = logging.getLogger("store-traffic")
+
+# 1回の API 呼び出しで問い合わせるタイトル数の上限（MediaWiki の titles 上限）
+_BATCH_SIZE = 50
+# プロセス内キャッシュの上限タイトル数（古いものから捨てる）
+_CACHE_MAX = 5000
+
+_HEADERS = {
+    "User-Agent": "StationStudio/1.0 (https://github.com/station-studio; station.studio.app@gmail.com)"
+}
+
+# 要求タイトル → {"title", "revid", "wikitext", "image", "image_size", "missing"}
+_page_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# infobox の「| 乗降人員 = …」「| 乗車人員 = …」。値は次の「|」か改行まで
+_PAX_FIELD_RE = re.compile(r"\|\s*(乗降人員|乗車人員)\s*=\s*([^\n|]+)")
+# 値から除くマークアップ（<br> と全角括弧の注記は空白に置き換え、それ以外は削除）
+_PAX_MARKUP_RE = re.compile(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>|<br\s*/?>|'''|（[^）]*）|\{\{[^}]*\}\}")
+_PAX_PERSONS_RE = re.compile(r"([\d,]+)\s*人")
+_PAX_DIGITS_RE = re.compile(r"[\d,]{3,}")
+# 乗車人員は×2して乗降換算
+_PAX_MULTIPLIER = {"乗降人員": 1, "乗車人員": 2}
+
+
+def _strip_markup(m):
+    return " " if m.group(0).startswith(("<br", "（")) else ""
+
+
+def parse_passenger_count(wikitext):
+    """
+    infobox の乗降人員・乗車人員を1回の走査で拾い、全社分を合算する
+
+    各値は「数字+人」があればそれらを、なければ3桁以上の数字を合算する（100以下は年などとみなして除外）
+
+    Returns:
+        int|None: 乗降換算の合計（該当なしは None）
+    """
+    total = 0
+    found = False
+    for m in _PAX_FIELD_RE.finditer(wikitext):
+        multiplier = _PAX_MULTIPLIER[m.group(1)]
+        value = _PAX_MARKUP_RE.sub(_strip_markup, m.group(2))
+        numbers = _PAX_PERSONS_RE.findall(value) or _PAX_DIGITS_RE.findall(value)
+        for n in numbers:
+            digits = n.replace(",", "")
+            if digits and int(digits) > 100:
+                total += int(digits) * multiplier
+                found = True
+    return total if found else None
+
+
+def _resolve(title, normalized, redirects):
+    """要求タイトル → 正規化 → リダイレクト先 の順にたどった最終タイトル"""
+    title = normalized.get(title, title)
+    seen = set()
+    while title in redirects and title not in seen:
+        seen.add(title)
+        title = redirects[title]
+    return title
+
+
+def _query_batch(titles, content=True):
+    """
+    最大50タイトルを1回（続きがあれば continue で追加取得）で問い合わせる
+
+    Args:
+        content: False なら本文を取らず、リード画像だけ問い合わせる
+
+    Returns:
+        dict[要求タイトル] -> {"title", "revid", "wikitext", "image", "image_size", "missing"}
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "titles": "|".join(titles),
+        "redirects": 1,
+        "prop": "pageimages",
+        "piprop": "original",
+        "pilimit": _BATCH_SIZE,
+    }
+    if content:
+        params.update(prop="revisions|pageimages", rvprop="ids|content", rvslots="main", rvsection=0)
+    normalized, redirects, pages = {}, {}, {}
+    cont = {}
+    while True:
+        resp = http_client.get(JA_WIKIPEDIA_API_URL, params={**params, **cont}, headers=_HEADERS)
+        resp.raise_for_status()
+        data = resp.json()
+        query = data.get("query", {})
+        for n in query.get("normalized", []):
+            normalized[n["from"]] = n["to"]
+        for r in query.get("redirects", []):
+            redirects[r["from"]] = r["to"]
+        for page in query.get("pages", []):
+            entry = pages.setdefault(page["title"], {
+                "title": page["title"], "revid": None, "wikitext": None, "image": None, "image_size": None,
+                "missing": bool(page.get("missing")),
+            })
+            revs = page.get("revisions") or []
+            if revs:
+                entry["revid"] = revs[0].get("revid")
+                entry["wikitext"] = revs[0].get("slots", {}).get("main", {}).get("content")
+            if page.get("original"):
+                entry["image"] = page["original"].get("source")
+                entry["image_size"] = (page["original"].get("width", 0), page["original"].get("height", 0))
+        # 本文が大きいと revisions が分割されるので続きを取る
+        if "continue" not in data:
+            break
+        cont = data["continue"]
+
+    result = {}
+    for t in titles:
+        final = _resolve(t, normalized, redirects)
+        result[t] = pages.get(final, {
+            "title": final, "revid": None, "wikitext": None, "image": None, "image_size": None, "missing": True,
+        })
+    return result
+
+
+def prefetch_pages(titles):
+    """
+    タイトル群をまとめて取得してキャッシュする（取得済みのものは問い合わせない）
+
+    Args:
+        titles: 記事タイトルのリスト（例: ["渋谷駅", "原宿駅"]）
+
+    Returns:
+        int: API 呼び出し回数（続きの取得を除く）
+    """
+    with _cache_lock:
+        todo = list(dict.fromkeys(t for t in titles if t and t not in _page_cache))
+    calls = 0
+    for i in range(0, len(todo), _BATCH_SIZE):
+        batch = todo[i:i + _BATCH_SIZE]
+        try:
+            result = _query_batch(batch)
+        except (requests.RequestException, ValueError) as e:
+            # 取得できなかったタイトルはキャッシュせず、次回の呼び出しで再試行する
+            logger.error(f"Wikipedia APIエラー（{len(batch)}件）: {e}")
+            continue
+        calls += 1
+        with _cache_lock:
+            for t, page in result.items():
+                _page_cache[t] = page
+                _page_cache.move_to_end(t)
+            while len(_page_cache) > _CACHE_MAX:
+                _page_cache.popitem(last=False)
+    if todo:
+        logger.info(f"Wikipedia記事 {len(todo)}件を{calls}回の呼び出しで取得")
+    return calls
+
+
+def get_page(title):
+    """
+    記事1件を返す（キャッシュになければその場で取得）
+
+    Returns:
+        dict: {"title": 解決後のタイトル, "revid": 版ID|None, "wikitext": 節0のwikitext|None,
+               "image": 画像URL|None, "image_size": (幅, 高さ)|None, "missing": bool}
+        API エラーで取得できなかったときは None
+    """
+    with _cache_lock:
+        page = _page_cache.get(title)
+    if page is None:
+        prefetch_pages([title])
+        with _cache_lock:
+            page = _page_cache.get(title)
+    return page
+
+
+def probe_lead_images(titles):
+    """
+    記事のリード画像だけを50タイトルずつ問い合わせる（本文は取らず、キャッシュにも入れない）
+
+    Returns:
+        dict[要求タイトル] -> {"url", "width", "height"}|None（記事なし・画像なし）
+        API エラーで問い合わせられなかったタイトルは含まない
+    """
+    result = {}
+    for i in range(0, len(titles), _BATCH_SIZE):
+        batch = titles[i:i + _BATCH_SIZE]
+        try:
+            pages = _query_batch(batch, content=False)
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Wikipedia APIエラー（{len(batch)}件）: {e}")
+            continue
+        for t, page in pages.items():
+            if page["image"]:
+                width, height = page["image_size"]
+                result[t] = {"url": page["image"], "width": width, "height": height}
+            else:
+                result[t] = None
+    return result
@@ -0,0 +1,91 @@
+"""
+Wikipedia ダンプの読み込み - ローカルの jawiki pages-articles（.xml.bz2 / .xml）を逐次解析し、
+駅記事（タイトルが「…駅」または「…駅 (…)」）の冒頭節から乗降客数を取り出す
+
+記事は1件ずつ読んで処理したらすぐに破棄するので、全国分のダンプでもメモリ使用量は駅記事の件数で頭打ちになる。
+抽出規則は API 経由の取得（city_mode.fetch_passenger_count）と共通の parse_passenger_count
+"""
+import bz2
+import os
+import re
+import time
+import logging
+import xml.etree.ElementTree as ET
+
+from wiki_client import parse_passenger_count
+
+logger = logging.getLogger("store-traffic")
+
+# 「渋谷駅」「赤坂駅 (東京都)」
+_STATION_TITLE_RE = re.compile(r"^.+駅(?: \(.+\))?$")
+# 節0（最初の見出しより前）。infobox はここにある
+_FIRST_HEADING_RE = re.compile(r"^==", re.MULTILINE)
+
+
+def _local(tag):
+    """名前空間 {http://www.mediawiki.org/xml/export-0.xx/} を外したタグ名"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _lead_section(text):
+    m = _FIRST_HEADING_RE.search(text)
+    return text[:m.start()] if m else text
+
+
+def _open_dump(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def load_passenger_articles(path):
+    """
+    ダンプから駅記事の乗降客数とリダイレクトを取り出す
+
+    Args:
+        path: jawiki-*-pages-articles*.xml.bz2（または展開済みの .xml）
+
+    Returns:
+        (articles, redirects)
+        articles: dict[記事タイトル] -> {"passengers": int, "revid": int|None}（乗降客数の取れた記事のみ）
+        redirects: dict[リダイレクト元タイトル] -> リダイレクト先タイトル（駅記事どうしのみ）
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Wikipediaダンプがありません: {path}")
+
+    logger.info(f"Wikipediaダンプを読み込み中: {path}（{os.path.getsize(path) / 1e6:.0f}MB）")
+    t0 = time.perf_counter()
+    articles, redirects = {}, {}
+    pages = stations = 0
+    with _open_dump(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or _local(elem.tag) != "page":
+                continue
+            pages += 1
+            fields = {_local(child.tag): child for child in elem}
+            title = fields["title"].text if "title" in fields else ""
+            ns = fields["ns"].text if "ns" in fields else "0"
+            if ns == "0" and title and _STATION_TITLE_RE.match(title):
+                stations += 1
+                if "redirect" in fields:
+                    target = fields["redirect"].get("title", "")
+                    if _STATION_TITLE_RE.match(target):
+                        redirects[title] = target
+                else:
+                    revision = fields.get("revision")
+                    rev = {_local(c.tag): c for c in revision} if revision is not None else {}
+                    text = rev["text"].text if "text" in rev else None
+                    passengers = parse_passenger_count(_lead_section(text)) if text else None
+                    if passengers is not None:
+                        revid = rev["id"].text if "id" in rev else None
+                        articles[title] = {"passengers": passengers, "revid": int(revid) if revid else None}
+            # 処理済みのページをルートから外してメモリを解放
+            root.clear()
+
+    logger.info(
+        f"Wikipediaダンプ解析: {pages}ページ中 駅記事 {stations}件, 乗降客数 {len(articles)}件, "
+        f"リダイレクト {len(redirects)}件, {time.perf_counter() - t0:.1f}秒"
+    )
+    return articles, redirects